@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+"""
+Generators for synthetic HDF5 files which are large in various dimensions.
+
+    python benchmarks/generate.py OUTDIR [--preset small|large] [NAME ...]
+"""
+from argparse import ArgumentParser
+import os
+from pathlib import Path
+import sys
+from typing import Callable, Dict
+
+import h5py
+import numpy as np
+
+
+def wide(f: h5py.File, n_members=100_000, dataset_every=10):
+    """A single group with ``n_members`` members: mostly groups,
+    with every ``dataset_every``th member a small dataset.
+    """
+    g = f.create_group("wide")
+    for i in range(n_members):
+        name = f"m{i:07d}"
+        if dataset_every and i % dataset_every == 0:
+            g.create_dataset(name, data=np.arange(4))
+        else:
+            g.create_group(name)
+
+
+def deep(f: h5py.File, depth=1_000, breadth=2):
+    """A hierarchy ``depth`` groups deep,
+    with ``breadth`` - 1 empty sibling groups and one dataset at each level.
+    """
+    g = f.create_group("deep")
+    for level in range(depth):
+        g.create_dataset("ds", data=level)
+        for sibling in range(1, breadth):
+            g.create_group(f"sibling{sibling}")
+        g = g.create_group("next")
+
+
+def attributes(f: h5py.File, n_attrs=5_000, array_len=16):
+    """A group and a dataset with ``n_attrs`` attributes each,
+    alternating between scalars, strings and short arrays.
+    """
+    g = f.create_group("attrs")
+    ds = g.create_dataset("ds", data=np.arange(10))
+    for obj in (g, ds):
+        for i in range(n_attrs):
+            name = f"attr{i:06d}"
+            kind = i % 3
+            if kind == 0:
+                obj.attrs[name] = i
+            elif kind == 1:
+                obj.attrs[name] = f"value {i}"
+            else:
+                obj.attrs[name] = np.arange(array_len, dtype=np.float64) * i
+
+
+def chunked(
+    f: h5py.File,
+    shape=(4_096, 4_096),
+    chunks=(256, 256),
+    compression="gzip",
+    dtype="float32",
+    seed=0,
+):
+    """A chunked, compressed dataset of compressible random-ish data,
+    and an uncompressed copy, written one row of chunks at a time.
+    """
+    g = f.create_group("chunked")
+    rng = np.random.default_rng(seed)
+    compressed = g.create_dataset(
+        "compressed",
+        shape,
+        dtype,
+        chunks=chunks,
+        compression=compression,
+        shuffle=compression is not None,
+    )
+    plain = g.create_dataset("plain", shape, dtype, chunks=chunks)
+    for start in range(0, shape[0], chunks[0]):
+        stop = min(start + chunks[0], shape[0])
+        rows = (stop - start,) + tuple(shape[1:])
+        # rounded, so that it compresses somewhat
+        block = np.round(rng.standard_normal(rows), 2).astype(dtype)
+        compressed[start:stop] = block
+        plain[start:stop] = block
+
+
+def dag(f: h5py.File, layers=8, width=8, fan_out=4):
+    """A directed acyclic graph of groups: ``layers`` layers of ``width`` groups,
+    each of which has hard links to ``fan_out`` groups in the layer below.
+
+    There are many paths to each group in the lower layers,
+    so naive traversal visits up to ``fan_out ** layers`` paths.
+    """
+    root = f.create_group("dag")
+    layer = [root.create_group(f"n0_{i}") for i in range(width)]
+    for depth in range(1, layers):
+        below = [root.create_group(f"n{depth}_{i}") for i in range(width)]
+        for i, g in enumerate(layer):
+            for j in range(fan_out):
+                g[f"child{j}"] = below[(i + j) % width]
+            g.create_dataset("ds", data=np.arange(depth))
+        layer = below
+
+
+def vds(f: h5py.File, n_sources=16, length=100_000, dtype="int32"):
+    """A virtual dataset concatenating ``n_sources`` datasets,
+    each in its own file next to this one.
+    """
+    fpath = Path(f.filename)
+    src_dir = fpath.parent / f"{fpath.stem}_sources"
+    src_dir.mkdir(exist_ok=True)
+    layout = h5py.VirtualLayout((n_sources, length), dtype)
+    for i in range(n_sources):
+        src_path = src_dir / f"source{i:03d}.h5"
+        with h5py.File(src_path, "w") as src:
+            src.create_dataset("data", data=np.arange(length, dtype=dtype) + i)
+        rel = os.path.relpath(src_path, fpath.parent)
+        layout[i] = h5py.VirtualSource(rel, "data", (length,))
+    f.create_group("vds").create_virtual_dataset("data", layout, fillvalue=-1)
+
+
+GENERATORS: Dict[str, Callable] = {
+    "wide": wide,
+    "deep": deep,
+    "attributes": attributes,
+    "chunked": chunked,
+    "dag": dag,
+    "vds": vds,
+}
+
+PRESETS = {
+    "small": {
+        "wide": {"n_members": 10_000},
+        "deep": {"depth": 100},
+        "attributes": {"n_attrs": 1_000},
+        "chunked": {"shape": (1_024, 1_024), "chunks": (128, 128)},
+        "dag": {"layers": 6, "width": 6, "fan_out": 3},
+        "vds": {"n_sources": 4, "length": 10_000},
+    },
+    "large": {
+        "wide": {"n_members": 1_000_000},
+        "deep": {"depth": 10_000},
+        "attributes": {"n_attrs": 10_000},
+        "chunked": {"shape": (16_384, 16_384), "chunks": (512, 512)},
+        "dag": {"layers": 12, "width": 16, "fan_out": 4},
+        "vds": {"n_sources": 64, "length": 1_000_000},
+    },
+}
+PRESETS["default"] = {name: {} for name in GENERATORS}
+
+
+def generate(name: str, fpath: os.PathLike, **kwargs) -> Path:
+    """Write a file at ``fpath`` using the named generator.
+
+    The generator's parameters are stored as attributes of the root group,
+    so that existing files can be checked with ``is_current``.
+    """
+    fpath = Path(fpath)
+    with h5py.File(fpath, "w") as f:
+        GENERATORS[name](f, **kwargs)
+        f.attrs["generator"] = name
+        f.attrs["params"] = repr(sorted(kwargs.items()))
+    return fpath
+
+
+def is_current(name: str, fpath: os.PathLike, **kwargs) -> bool:
+    """Whether a file exists which was generated with these parameters"""
+    try:
+        with h5py.File(fpath, "r") as f:
+            return f.attrs.get("generator") == name and f.attrs.get("params") == repr(
+                sorted(kwargs.items())
+            )
+    except OSError:
+        return False
+
+
+def generate_preset(outdir: os.PathLike, preset="default", names=None, force=False):
+    """Generate files for the named generators (default all) with a preset's parameters.
+
+    Files which already exist with the same parameters are reused unless ``force``.
+
+    :return: Dict of generator name to file path.
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    out = dict()
+    for name in names or GENERATORS:
+        kwargs = PRESETS[preset].get(name, {})
+        fpath = outdir / f"{name}_{preset}.h5"
+        if force or not is_current(name, fpath, **kwargs):
+            print(f"Generating {fpath}", file=sys.stderr)
+            generate(name, fpath, **kwargs)
+        out[name] = fpath
+    return out
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("outdir", type=Path, help="Directory to write files to")
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help=f"Generators to run (default all): {', '.join(GENERATORS)}",
+    )
+    parser.add_argument(
+        "-p",
+        "--preset",
+        choices=list(PRESETS),
+        default="default",
+        help="Set of sizes to generate (default 'default')",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Regenerate files even if they exist with the same parameters",
+    )
+    parsed = parser.parse_args(argv)
+    unknown = set(parsed.names) - set(GENERATORS)
+    if unknown:
+        parser.error(f"Unknown generators: {', '.join(sorted(unknown))}")
+    for name, fpath in generate_preset(
+        parsed.outdir, parsed.preset, parsed.names, parsed.force
+    ).items():
+        print(f"{name}\t{fpath}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""
+Timed benchmarks of hcl commands against synthetic files.
+
+    python benchmarks/run.py [--preset small|default|large] [--save] [--compare]
+
+Files are generated once into the data directory and reused.
+Results can be saved as a baseline for this machine and preset,
+and later runs compared against it; no network access is needed.
+"""
+from argparse import ArgumentParser
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess as sp
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple
+
+import h5py
+from prompt_toolkit.document import Document
+
+from hcl.cli import Cli
+from hcl.commands import all_commands
+from hcl.completion import H5AttrCompleter, H5PathCompleter
+from hcl.version import version
+
+from generate import GENERATORS, PRESETS, generate_preset
+
+HERE = Path(__file__).resolve().parent
+DEFAULT_DATA_DIR = HERE / "data"
+DEFAULT_BASELINE_DIR = HERE / "baselines"
+
+
+class Benchmark(NamedTuple):
+    name: str
+    #: name of the generated file to run against
+    data: str
+    #: called with an open Cli, whose output is discarded
+    fn: Callable[[Cli], object]
+
+
+def command(line: str) -> Callable[[Cli], object]:
+    def fn(cli: Cli):
+        return cli.run_line(line)
+
+    fn.__name__ = line
+    return fn
+
+
+def complete(text: str, completer_class=H5PathCompleter) -> Callable[[Cli], object]:
+    """Time to get every completion for the given text"""
+
+    def fn(cli: Cli):
+        completer = completer_class(cli)
+        return list(completer.get_completions(Document(text), None))
+
+    return fn
+
+
+def start_up(cli: Cli):
+    """Wall time for a one-off command in a new process"""
+    sp.run(
+        [sys.executable, "-m", "hcl", str(cli.fpath), "--no-cache", "--command", "pwd"],
+        stdout=sp.DEVNULL,
+        check=True,
+    )
+
+
+BENCHMARKS: List[Benchmark] = [
+    Benchmark("ls wide", "wide", command("ls wide")),
+    Benchmark("ls -l wide", "wide", command("ls -l wide")),
+    Benchmark("ls -lR dag", "dag", command("ls -lR dag")),
+    Benchmark("ls deep", "deep", command("ls deep")),
+    Benchmark("tree deep", "deep", command("tree deep")),
+    Benchmark("tree dag", "dag", command("tree dag")),
+    Benchmark("tree vds", "vds", command("tree")),
+    Benchmark("find wide", "wide", command("find wide -name 'm*5' -type d")),
+    Benchmark("find dag", "dag", command("find -type d -minsize 1")),
+    Benchmark("find attrs", "attributes", command("find -attr attr000003=3")),
+    Benchmark("attrs --all group", "attributes", command("attrs attrs --all")),
+    Benchmark("attrs --all dataset", "attributes", command("attrs attrs/ds --all")),
+    Benchmark("complete wide", "wide", complete("wide/m00001")),
+    Benchmark("complete wide all", "wide", complete("wide/")),
+    Benchmark("complete attrs", "attributes", complete("attrs/")),
+    Benchmark(
+        "complete attr names",
+        "attributes",
+        complete("attrs/ds attr0001", H5AttrCompleter),
+    ),
+    Benchmark("du chunked", "chunked", command("du chunked")),
+    Benchmark(
+        "chunkinfo compressed", "chunked", command("chunkinfo -s chunked/compressed")
+    ),
+    Benchmark("stats compressed", "chunked", command("stats chunked/compressed")),
+    Benchmark("stats vds", "vds", command("stats vds/data")),
+    Benchmark("checksum chunked", "chunked", command("checksum chunked")),
+    Benchmark("diff chunked", "chunked", command("diff chunked chunked")),
+    Benchmark("start-up", "wide", start_up),
+]
+
+
+@contextmanager
+def open_cli(fpath) -> Iterator[Cli]:
+    with open(os.devnull, "w") as devnull:
+        # a fresh Cli each time, so nothing is cached between repeats
+        with Cli(
+            fpath,
+            commands=all_commands,
+            print_kwargs={"file": devnull},
+            interactive=False,
+        ) as cli:
+            yield cli
+
+
+def time_benchmark(bench: Benchmark, fpath, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        with open_cli(fpath) as cli:
+            started = time.perf_counter()
+            bench.fn(cli)
+            times.append(time.perf_counter() - started)
+    return times
+
+
+def summarise(times: List[float]) -> Dict[str, float]:
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def baseline_path(baseline_dir: Path, preset: str) -> Path:
+    return baseline_dir / f"{platform.node() or 'unknown'}_{preset}.json"
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float):
+    """Print each benchmark's ratio to its baseline; return the names of regressions"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: no baseline")
+            continue
+        ratio = result["min"] / baseline[name]["min"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "\tREGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            flag = "\timproved"
+        print(f"{name}: {ratio:.2f}x baseline{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="Benchmarks to run, by substring of their name (default all)",
+    )
+    parser.add_argument(
+        "-p",
+        "--preset",
+        choices=list(PRESETS),
+        default="small",
+        help="Sizes of generated files (default 'small')",
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        type=Path,
+        default=DEFAULT_DATA_DIR,
+        help="Directory for generated files (default benchmarks/data)",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of times to run each benchmark (default 5)",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=Path,
+        help="Baseline file to save to or compare against "
+        "(default benchmarks/baselines/{host}_{preset}.json)",
+    )
+    parser.add_argument(
+        "-s", "--save", action="store_true", help="Save results as the baseline"
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        action="store_true",
+        help="Compare against the baseline, exiting with 1 if anything regressed",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fractional slow-down allowed before reporting a regression "
+        "(default 0.25)",
+    )
+    parsed = parser.parse_args(argv)
+
+    benchmarks = [
+        b
+        for b in BENCHMARKS
+        if not parsed.names or any(n in b.name for n in parsed.names)
+    ]
+    needed = sorted({b.data for b in benchmarks}, key=list(GENERATORS).index)
+    paths = generate_preset(parsed.data_dir, parsed.preset, needed)
+
+    results = dict()
+    for bench in benchmarks:
+        result = summarise(time_benchmark(bench, paths[bench.data], parsed.repeat))
+        results[bench.name] = result
+        print(
+            f"{bench.name}: min {result['min'] * 1000:.1f}ms, "
+            f"median {result['median'] * 1000:.1f}ms",
+            flush=True,
+        )
+
+    baseline = parsed.baseline or baseline_path(DEFAULT_BASELINE_DIR, parsed.preset)
+    status = 0
+    if parsed.compare and not baseline.exists():
+        # baselines are per machine, so none is committed
+        print(
+            f"No baseline at {baseline} to compare against; "
+            "run with --save to create one for this machine",
+            file=sys.stderr,
+        )
+    elif parsed.compare:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)["results"], parsed.tolerance)
+        if regressions:
+            status = 1
+    if parsed.save:
+        baseline.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "preset": parsed.preset,
+            "hcl": version,
+            "h5py": h5py.version.version,
+            "hdf5": h5py.version.hdf5_version,
+            "python": platform.python_version(),
+        }
+        with open(baseline, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Saved baseline to {baseline}", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
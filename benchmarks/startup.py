@@ -0,0 +1,130 @@
+"""
+Start-up time benchmark for hcl.
+
+Runs a few one-off invocations under ``python -X importtime``,
+and fails if any of them imports a module it should not need,
+or spends longer importing modules than its budget.
+
+    python benchmarks/startup.py [--repeat N] [--scale X]
+"""
+from argparse import ArgumentParser
+import os
+import subprocess as sp
+import sys
+from tempfile import TemporaryDirectory
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+HEAVY = ("h5py", "numpy", "prompt_toolkit")
+
+
+class Scenario(NamedTuple):
+    name: str
+    args: Tuple[str, ...]
+    forbidden: Tuple[str, ...]
+    #: budget for total import time, in milliseconds
+    budget_ms: float
+    needs_file: bool = False
+
+
+SCENARIOS = [
+    Scenario("version", ("--version",), HEAVY + ("sqlite3",), 150),
+    Scenario("help", ("--command", "help"), HEAVY + ("sqlite3",), 150),
+    Scenario(
+        "piped command",
+        ("--no-cache", "--command", "ls"),
+        ("prompt_toolkit",),
+        500,
+        needs_file=True,
+    ),
+]
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """Self import time in microseconds of each module in ``-X importtime`` output"""
+    out = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        self_us = self_us.strip()
+        if not self_us.isdigit():
+            # header line
+            continue
+        out[name.strip()] = int(self_us)
+    return out
+
+
+def run_once(args: Sequence[str]) -> Dict[str, int]:
+    cmd = [sys.executable, "-X", "importtime", "-m", "hcl", *args]
+    result = sp.run(cmd, stdout=sp.DEVNULL, stderr=sp.PIPE, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{result.stderr}")
+    return parse_importtime(result.stderr)
+
+
+def make_file(fpath):
+    import h5py
+
+    with h5py.File(fpath, "w") as f:
+        f.create_dataset("group/dataset", data=list(range(10)))
+
+
+def top_level(modules) -> List[str]:
+    return sorted({m.split(".")[0] for m in modules})
+
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Run each scenario this many times and take the fastest (default 5)",
+    )
+    parser.add_argument(
+        "-s",
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiply every budget by this, for slow machines (default 1)",
+    )
+    parsed = parser.parse_args(argv)
+
+    failed = False
+    with TemporaryDirectory() as tmpdir:
+        fpath = os.path.join(tmpdir, "startup.h5")
+        make_file(fpath)
+
+        for scenario in SCENARIOS:
+            args = scenario.args
+            if scenario.needs_file:
+                args = (fpath,) + args
+
+            best = None
+            for _ in range(parsed.repeat):
+                times = run_once(args)
+                if best is None or sum(times.values()) < sum(best.values()):
+                    best = times
+
+            total_ms = sum(best.values()) / 1000
+            budget_ms = scenario.budget_ms * parsed.scale
+            problems = []
+            imported = [m for m in top_level(best) if m in scenario.forbidden]
+            if imported:
+                problems.append(f"imported {', '.join(imported)}")
+            if total_ms > budget_ms:
+                problems.append(f"over budget of {budget_ms:.0f}ms")
+
+            status = "FAIL" if problems else "ok"
+            print(
+                f"{status}\t{total_ms:6.1f}ms\t{scenario.name}"
+                + (f" ({'; '.join(problems)})" if problems else "")
+            )
+            failed = failed or bool(problems)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
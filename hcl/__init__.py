@@ -1,4 +1,12 @@
 from .version import version as __version__  # noqa: F401
-from .commands import Command, format_dataset, format_obj, get_children, all_commands
 
 __all__ = ["Command", "format_dataset", "format_obj", "get_children", "all_commands"]
+
+
+def __getattr__(name):
+    # imported on demand, so that `import hcl` is cheap
+    if name in __all__:
+        from . import commands
+
+        return getattr(commands, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -9,6 +9,7 @@ import sys
 import os
 from runpy import run_path
 
+from .access import add_access_arguments, settings_from_args
 from .cli import Cli
 from .commands import Command, all_commands as COMMANDS
 from .utils import Signal
@@ -43,6 +44,21 @@ def get_plugin_commands(import_path):
     return out
 
 
+def print_summary(results, file=sys.stderr):
+    for line, result in results:
+        status = "ok" if result in (Signal.SUCCESS, Signal.QUIT) else "FAILED"
+        print(f"{status:<8}{line}", file=file)
+    n_failed = sum(r == Signal.FAILURE for _, r in results)
+    print(f"{len(results)} lines run, {n_failed} failed", file=file)
+
+
+def run_script(cli, script, keep_going=False):
+    if script == "-":
+        return cli.run_script(sys.stdin, keep_going)
+    with open(script) as f:
+        return cli.run_script(f, keep_going)
+
+
 def main():
     parser = ArgumentParser(description=__doc__)
     parser.add_argument(
@@ -50,14 +66,32 @@ def main():
         nargs="?",
         help=(
             "HDF5 file to explore. Add ':/path/to/group' to start in a specific group. "
-            "If this is not given, only `--version`, `--help`, or "
-            "`--command '<some_command> --help'` can be used."
+            "If this is not given, only `--version`, `--help`, "
+            "`--command '<some_command> --help'`, "
+            "or `--command` with a command which opens its own files "
+            "(like `diff`) can be used."
         ),
     )
-    parser.add_argument(
+    run_group = parser.add_mutually_exclusive_group()
+    run_group.add_argument(
         "-c",
         "--command",
-        help="Run a single command and exit.",
+        help="Run a single command (or several, separated by ';') and exit.",
+    )
+    run_group.add_argument(
+        "-s",
+        "--script",
+        help=(
+            "Run commands from this file ('-' for stdin), one line at a time, "
+            "then print a summary of each line's status to stderr and exit. "
+            "Blank lines and lines starting with '#' are ignored."
+        ),
+    )
+    parser.add_argument(
+        "-k",
+        "--keep-going",
+        action="store_true",
+        help="In --script mode, carry on after a line fails.",
     )
     parser.add_argument(
         "-p",
@@ -93,9 +127,99 @@ def main():
             "'a': Read/write if exists, create otherwise."
         ),
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Do not use the persistent metadata cache. "
+            "By default, files opened in mode 'r' have their hierarchy and attribute "
+            "metadata cached in $HCL_CACHE_DIR (default ~/.cache/hcl), "
+            "keyed by path, size and modification time; "
+            "it is not used if anyone else can access that directory."
+        ),
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=("text", "json", "ndjson"),
+        default="text",
+        help=(
+            "Output format for commands' results. "
+            "'text' (default): human-readable. "
+            "'ndjson': one JSON object per result per line, written as it is found. "
+            "'json': one JSON array of results per command."
+        ),
+    )
     parser.add_argument(
         "--version", "-V", action="store_true", help="Print version and exit."
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "After each command, report to stderr its wall and CPU time, "
+            "bytes read by the process (rchar), HDF5 objects opened "
+            "and time spent writing output; "
+            "at exit, report totals for each command."
+        ),
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help=(
+            "Also write a cProfile dump of each command to this directory, "
+            "named like '001-ls.prof'. Implies --profile."
+        ),
+    )
+    server_group = parser.add_argument_group(
+        "server",
+        "Keep a file open between `--command` calls, "
+        "so that they share its open handle and warm caches.",
+    )
+    server_group.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "Serve commands on the file (opened read-only) over a local socket, "
+            "until it is idle for --idle-timeout or interrupted."
+        ),
+    )
+    server_group.add_argument(
+        "--client",
+        action="store_true",
+        help=(
+            "With --command, run it on the server for this file if one is running "
+            "(streaming its output), or run it here otherwise."
+        ),
+    )
+    server_group.add_argument(
+        "--socket",
+        help=(
+            "Socket to serve on or connect to; by default, one per file in "
+            "$HCL_SOCKET_DIR, $XDG_RUNTIME_DIR/hcl or a per-user temporary directory, "
+            "which must be owned by you with mode 0700."
+        ),
+    )
+    server_group.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=600.0,
+        help="With --serve, stop after this many seconds without requests; "
+        "0 to never stop (default 600).",
+    )
+    server_group.add_argument(
+        "--max-clients",
+        type=int,
+        default=8,
+        help="With --serve, clients which may be connected at once; "
+        "further clients run their commands themselves (default 8).",
+    )
+    add_access_arguments(
+        parser.add_argument_group(
+            "file access",
+            "How HDF5 reads the file; by default, HDF5's own defaults. "
+            "These can be changed during a session with the `cache` command.",
+        )
+    )
     args = parser.parse_args()
 
     log_level = {
@@ -112,28 +236,37 @@ def main():
 
     piped = not sys.stdout.isatty() and bool(args.command)
 
+    profiler = None
+    if args.profile or args.profile_dir:
+        from .profiling import Profiler
+
+        profiler = Profiler(args.profile_dir)
+
     if not args.file:
-        retval = 0
-        if (
-            args.command
-            and ";" not in args.command
-            and (
-                args.command == "help"
-                or args.command.startswith("help ")
-                or "--help" in args.command
-            )
-        ):
-            with Cli(None, commands=COMMANDS, interactive=not piped) as cli:
-                result = cli.run_command(shlex.split(args.command))
-            if result != Signal.SUCCESS:
-                retval = 1
-        else:
-            logger.warning(
-                "No file given and other args not interpreted as help message command"
-            )
-            parser.print_help()
-            retval = 1
-        sys.exit(retval)
+        if args.command and ";" not in args.command:
+            with Cli(
+                None,
+                commands=COMMANDS,
+                interactive=not piped,
+                output_format=args.format,
+                profiler=profiler,
+            ) as cli:
+                argv = shlex.split(args.command)
+                cmd = cli.commands.get(argv[0]) if argv else None
+                if (
+                    args.command == "help"
+                    or args.command.startswith("help ")
+                    or "--help" in args.command
+                    or (cmd is not None and not cmd.needs_file)
+                ):
+                    result = cli.run_command(argv)
+                    sys.exit(0 if result == Signal.SUCCESS else 1)
+        logger.warning(
+            "No file given and other args not interpreted as help message command "
+            "or one which opens its own files"
+        )
+        parser.print_help()
+        sys.exit(1)
 
     fpath_gpath = args.file.split(":")
     els = len(fpath_gpath)
@@ -145,19 +278,88 @@ def main():
     else:
         raise ValueError(f"Got more than one group path from argument '{args.file}'")
 
+    if args.client and args.command:
+        from .server import check_socket_dir, default_socket_path, run_client
+
+        status = None
+        socket_path = args.socket or default_socket_path(fpath)
+        try:
+            if not args.socket:
+                check_socket_dir(os.path.dirname(socket_path))
+            status = run_client(socket_path, args.command, gpath, args.format)
+        except OSError as e:
+            logger.info("%s", e)
+        if status is not None:
+            sys.exit(status)
+        logger.info("No server available; running command here")
+
     for import_path in args.plugin:
         COMMANDS.extend(get_plugin_commands(import_path))
 
-    piped = not sys.stdout.isatty() and bool(args.command)
+    retval = 0
+    if args.serve:
+        if args.mode != "r":
+            parser.error("--serve only supports files opened read-only (--mode r)")
+        if args.command or args.script:
+            parser.error("--serve cannot be used with --command or --script")
+        from .server import Server, check_socket_dir, default_socket_path
+
+        socket_path = args.socket or default_socket_path(fpath)
+        if not args.socket:
+            try:
+                check_socket_dir(os.path.dirname(socket_path), create=True)
+            except OSError as e:
+                logger.error("%s", e)
+                sys.exit(1)
 
-    with Cli(fpath, gpath=gpath, commands=COMMANDS, interactive=not piped) as cli:
+        with Cli(
+            fpath,
+            gpath=gpath,
+            commands=COMMANDS,
+            interactive=False,
+            access=settings_from_args(args),
+            profiler=profiler,
+        ) as cli:
+            try:
+                Server(
+                    cli,
+                    socket_path,
+                    args.idle_timeout,
+                    args.max_clients,
+                ).serve()
+            except FileExistsError as e:
+                logger.error("%s", e)
+                retval = 1
+        sys.exit(retval)
+
+    piped = not sys.stdout.isatty() and bool(args.command or args.script)
+
+    with Cli(
+        fpath,
+        gpath=gpath,
+        commands=COMMANDS,
+        mode=args.mode,
+        interactive=not piped,
+        use_cache=not args.no_cache,
+        output_format=args.format,
+        access=settings_from_args(args),
+        profiler=profiler,
+    ) as cli:
         if args.command:
-            cli.run_command(shlex.split(args.command))
+            result = cli.run_line(args.command)
+            if result == Signal.FAILURE:
+                retval = 1
+        elif args.script:
+            results = run_script(cli, args.script, args.keep_going)
+            print_summary(results)
+            if any(r == Signal.FAILURE for _, r in results):
+                retval = 1
         else:
             try:
                 cli.run()
             except EOFError:
                 cli.commands["exit"]()
+    sys.exit(retval)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""
+File access settings: HDF5's raw data chunk cache, page buffer, driver
+and format version bounds, and the cache statistics HDF5 reports.
+
+h5py is not imported here, so that settings can be parsed before the file is opened.
+"""
+from argparse import ArgumentParser, Namespace
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from .utils import parse_size
+
+if TYPE_CHECKING:
+    from h5py import File
+
+Libver = Union[str, Tuple[str, str]]
+
+
+class AccessSettings(NamedTuple):
+    """
+    Keyword arguments for ``h5py.File`` which tune how the file is read;
+    None means HDF5's default.
+    """
+
+    #: total size of each dataset's raw data chunk cache
+    rdcc_nbytes: Optional[int] = None
+    #: number of hash slots in each chunk cache; ideally a prime ~100x the chunks held
+    rdcc_nslots: Optional[int] = None
+    #: chunk preemption policy, from 0 (least recently used) to 1 (fully read/written)
+    rdcc_w0: Optional[float] = None
+    #: size of the page buffer; only useful for files created with paged aggregation
+    page_buf_size: Optional[int] = None
+    #: e.g. 'sec2', 'stdio', or 'core' to read the whole file into memory
+    driver: Optional[str] = None
+    #: bounds on the file format version, e.g. 'latest' or ('earliest', 'v110')
+    libver: Optional[Libver] = None
+
+    def file_kwargs(self) -> Dict[str, Any]:
+        return {k: v for k, v in self._asdict().items() if v is not None}
+
+
+def parse_libver(s: str) -> Libver:
+    """Parse 'LOW' or 'LOW,HIGH' format version bounds"""
+    low, comma, high = s.partition(",")
+    if comma:
+        return (low.strip(), high.strip())
+    return s
+
+
+def add_access_arguments(parser: ArgumentParser):
+    """Options for each AccessSettings field"""
+    parser.add_argument(
+        "--rdcc-nbytes",
+        type=parse_size,
+        help="Size of each dataset's raw data chunk cache, e.g. 64M; "
+        "should hold all the chunks a typical read touches",
+    )
+    parser.add_argument(
+        "--rdcc-nslots",
+        type=int,
+        help="Number of hash slots in each chunk cache; "
+        "ideally a prime about 100 times the number of chunks it can hold",
+    )
+    parser.add_argument(
+        "--rdcc-w0",
+        type=float,
+        help="Chunk cache preemption policy: 0 evicts least recently used chunks "
+        "first, 1 evicts fully read or written chunks first",
+    )
+    parser.add_argument(
+        "--page-buf-size",
+        type=parse_size,
+        help="Size of the page buffer, e.g. 16M; "
+        "only for files created with paged file space aggregation",
+    )
+    parser.add_argument(
+        "--driver",
+        help="HDF5 file driver: e.g. 'sec2' (default), 'stdio' (buffered), "
+        "or 'core' (read the whole file into memory)",
+    )
+    parser.add_argument(
+        "--libver",
+        type=parse_libver,
+        help="File format version bounds as 'LOW' or 'LOW,HIGH', "
+        "e.g. 'latest' or 'earliest,v110'",
+    )
+
+
+def settings_from_args(
+    parsed_args: Namespace, base: AccessSettings = AccessSettings()
+) -> AccessSettings:
+    """Settings given as options, falling back to ``base``"""
+    given = {
+        name: getattr(parsed_args, name)
+        for name in AccessSettings._fields
+        if getattr(parsed_args, name) is not None
+    }
+    return base._replace(**given)
+
+
+def current_settings(f: "File") -> Dict[str, Any]:
+    """The settings the file was actually opened with"""
+    fapl = f.id.get_access_plist()
+    _mdc_nelmts, rdcc_nslots, rdcc_nbytes, rdcc_w0 = fapl.get_cache()
+    return {
+        "driver": f.driver,
+        "libver": list(f.libver),
+        "rdcc_nbytes": rdcc_nbytes,
+        "rdcc_nslots": rdcc_nslots,
+        "rdcc_w0": rdcc_w0,
+        "page_buf_size": fapl.get_page_buffer_size()[0],
+    }
+
+
+def cache_stats(f: "File") -> Dict[str, Any]:
+    """Statistics of the metadata cache, and of the page buffer if it is enabled.
+
+    HDF5 does not report statistics for the raw data chunk cache.
+    """
+    max_size, _min_clean_size, cur_size, n_entries = f.id.get_mdc_size()
+    out: Dict[str, Any] = {
+        "metadata_cache": {
+            "hit_rate": f.id.get_mdc_hit_rate(),
+            "size": cur_size,
+            "max_size": max_size,
+            "entries": n_entries,
+        }
+    }
+    try:
+        pb = f.id.get_page_buffering_stats()
+    except RuntimeError:
+        # page buffering not enabled
+        return out
+    out["page_buffer"] = {
+        kind: {"accesses": s.accesses, "hits": s.hits, "evictions": s.evictions}
+        for kind, s in (("meta", pb.meta), ("raw", pb.raw))
+    }
+    return out
+
+
+def reset_stats(f: "File"):
+    f.id.reset_mdc_hit_rate_stats()
+    try:
+        f.id.reset_page_buffering_stats()
+    except RuntimeError:
+        pass
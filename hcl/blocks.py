@@ -0,0 +1,85 @@
+"""
+Iteration over datasets in chunk-aligned blocks of bounded size.
+"""
+from itertools import product
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .utils import DEFAULT_BLOCK_BYTES
+
+Block = Tuple[slice, ...]
+
+
+def block_shape(
+    shape: Tuple[int, ...],
+    chunks: Optional[Tuple[int, ...]],
+    itemsize: int,
+    max_bytes: int = DEFAULT_BLOCK_BYTES,
+) -> Tuple[int, ...]:
+    """Shape of the largest block which is a whole number of chunks
+    and fits in ``max_bytes`` (or is a single chunk, if that is bigger).
+
+    Blocks are grown along the last axis first,
+    so that each block is as contiguous as possible.
+    For contiguous datasets (``chunks=None``), blocks are slabs along the first axes.
+    """
+    if chunks is None:
+        chunks = (1,) * len(shape)
+    # zero-length axes still get blocks of 1, so that iterating over them is valid
+    block = [max(min(c, s), 1) for c, s in zip(chunks, shape)]
+    for ax in reversed(range(len(shape))):
+        if block[ax] >= shape[ax]:
+            continue
+        other = itemsize
+        for i, b in enumerate(block):
+            if i != ax:
+                other *= b
+        max_mult = max(1, max_bytes // (other * block[ax]))
+        n_chunks = -(-shape[ax] // block[ax])
+        block[ax] = min(block[ax] * min(max_mult, n_chunks), shape[ax])
+        if block[ax] < shape[ax]:
+            break
+    return tuple(block)
+
+
+def iter_blocks(shape: Tuple[int, ...], block: Tuple[int, ...]) -> Iterator[Block]:
+    """Slices for each block of the given shape covering the dataset, in C order;
+    none if the dataset is empty.
+    """
+    starts = [range(0, s, max(b, 1)) for s, b in zip(shape, block)]
+    for offset in product(*starts):
+        yield tuple(slice(o, min(o + b, s)) for o, b, s in zip(offset, block, shape))
+
+
+def block_size(block: Block) -> Tuple[int, ...]:
+    return tuple(sl.stop - sl.start for sl in block)
+
+
+class BlockReader:
+    """
+    Reads blocks of a dataset into a single reusable buffer.
+
+    The arrays returned by ``read`` are views into the buffer,
+    so are only valid until the next call.
+
+    :param dataset: h5py.Dataset to read from.
+    :param block: Shape of the largest block which will be read.
+    """
+
+    def __init__(self, dataset, block: Tuple[int, ...]):
+        self.dataset = dataset
+        self.buffer = np.empty(block, dataset.dtype)
+        self.bytes_read = 0
+
+    def read(self, source: Block) -> np.ndarray:
+        dest = tuple(slice(0, n) for n in block_size(source))
+        if not source:
+            # scalar dataset
+            self.dataset.read_direct(self.buffer)
+            out = self.buffer
+        else:
+            self.dataset.read_direct(self.buffer, source, dest)
+            out = self.buffer[dest]
+        self.bytes_read += out.nbytes
+        return out
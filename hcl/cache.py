@@ -0,0 +1,222 @@
+"""
+Persistent cache of file metadata, for read-only sessions.
+
+Entries are keyed by the file's resolved path, size and modification time;
+if any of those change, the file's entries are dropped.
+
+Entries are pickled, so the cache is only used from a directory
+(and a database) which nobody else can write to.
+"""
+import logging
+import os
+from pathlib import Path
+import pickle
+import sqlite3
+import stat
+from threading import Lock
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+#: Sentinel returned by FileCache.get for keys which are not cached
+MISSING = object()
+
+DEFAULT_MAX_FILES = 256
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+#: Increment whenever the schema or the types of cached values change
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (file_id, kind, key)
+);
+"""
+
+
+def default_cache_dir() -> Path:
+    """``$HCL_CACHE_DIR``, or ``hcl`` in ``$XDG_CACHE_HOME`` (default ``~/.cache``)"""
+    env = os.environ.get("HCL_CACHE_DIR")
+    if env:
+        return Path(env)
+    xdg = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg) if xdg else Path.home() / ".cache"
+    return base / "hcl"
+
+
+def check_private(path: Path, directory: bool):
+    """Check that the path is owned by this user, and nobody else can change it,
+    as anyone who can write the cache can run code when it is unpickled.
+
+    :param directory: Whether the path should be a directory,
+        which nobody else may use at all; otherwise a regular file,
+        which nobody else may write.
+    :raises PermissionError: If it is not safe to use.
+    """
+    st = os.lstat(path)
+    if directory:
+        is_kind, others, rule = stat.S_ISDIR, 0o077, "a directory others cannot use"
+    else:
+        is_kind, others, rule = stat.S_ISREG, 0o022, "a file others cannot write"
+    if (
+        not is_kind(st.st_mode)
+        or st.st_uid != os.getuid()
+        or stat.S_IMODE(st.st_mode) & others
+    ):
+        raise PermissionError(f"{path} must be {rule}, owned by you")
+
+
+class FileCache:
+    """
+    Cached metadata for a single file, as of a particular size and mtime.
+
+    Lookups go straight to the database;
+    new entries are buffered and written by ``flush``.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, file_id: int):
+        self._conn = connection
+        self.file_id = file_id
+        self._pending: Dict[Tuple[str, str], bytes] = dict()
+        self._lock = Lock()
+
+    def get(self, kind: str, key: str) -> Any:
+        with self._lock:
+            b = self._pending.get((kind, key))
+            if b is not None:
+                return pickle.loads(b)
+
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE file_id = ? AND kind = ? AND key = ?",
+                (self.file_id, kind, key),
+            ).fetchone()
+        if row is None:
+            return MISSING
+        return pickle.loads(row[0])
+
+    def put(self, kind: str, key: str, value: Any, max_bytes: Optional[int] = None):
+        """Buffer a value to be cached.
+
+        Values which cannot be pickled, or which pickle to more than ``max_bytes``,
+        are silently skipped.
+        """
+        try:
+            b = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            logger.debug("Could not cache %s %s", kind, key)
+            return
+        if max_bytes is not None and len(b) > max_bytes:
+            return
+        with self._lock:
+            self._pending[(kind, key)] = b
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            rows = [(self.file_id, k, key, v) for (k, key), v in self._pending.items()]
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows
+                )
+            logger.debug("Wrote %s cache entries", len(rows))
+            self._pending.clear()
+
+
+class MetadataCache:
+    """
+    SQLite-backed store of file metadata, shared between sessions.
+
+    Files which have not been accessed for ``max_age`` seconds are evicted,
+    as are the least-recently accessed files beyond ``max_files``.
+
+    :param db_path: Path to the database; by default, in ``default_cache_dir()``.
+    :raises PermissionError: If others could change the database; see ``check_private``.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        max_files: int = DEFAULT_MAX_FILES,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        if db_path is None:
+            cache_dir = default_cache_dir()
+            cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            db_path = cache_dir / "metadata.sqlite"
+        self.db_path = Path(db_path)
+        self.max_files = max_files
+        self.max_age = max_age
+
+        check_private(self.db_path.parent, directory=True)
+        if not self.db_path.exists():
+            # so that sqlite does not create it with the umask's permissions
+            os.close(os.open(self.db_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        check_private(self.db_path, directory=False)
+        # FileCaches may be used from completion and prefetching threads
+        self._conn = sqlite3.connect(
+            str(self.db_path), timeout=5, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        with self._conn:
+            if version != SCHEMA_VERSION:
+                logger.info("Clearing metadata cache from schema version %s", version)
+                self._conn.execute("DROP TABLE IF EXISTS entries")
+                self._conn.execute("DROP TABLE IF EXISTS files")
+            self._conn.executescript(SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def open(self, fpath: os.PathLike) -> FileCache:
+        """Get the cache for the given file, dropping stale entries"""
+        fpath = Path(fpath).resolve()
+        st = fpath.stat()
+        now = time.time()
+        with self._conn:
+            row = self._conn.execute(
+                "SELECT id, size, mtime_ns FROM files WHERE path = ?", (str(fpath),)
+            ).fetchone()
+            if row is not None and row[1:] != (st.st_size, st.st_mtime_ns):
+                logger.info("Cached metadata for %s is stale", fpath)
+                self._conn.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                row = None
+
+            if row is None:
+                file_id = self._conn.execute(
+                    "INSERT INTO files (path, size, mtime_ns, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (str(fpath), st.st_size, st.st_mtime_ns, now),
+                ).lastrowid
+            else:
+                file_id = row[0]
+                self._conn.execute(
+                    "UPDATE files SET accessed = ? WHERE id = ?", (now, file_id)
+                )
+        return FileCache(self._conn, file_id)
+
+    def evict(self):
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM files WHERE accessed < ?", (time.time() - self.max_age,)
+            )
+            self._conn.execute(
+                "DELETE FROM files WHERE id NOT IN "
+                "(SELECT id FROM files ORDER BY accessed DESC LIMIT ?)",
+                (self.max_files,),
+            )
+
+    def close(self):
+        self._conn.close()
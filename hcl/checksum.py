@@ -0,0 +1,245 @@
+"""
+Digests of datasets' stored bytes, for checking files' integrity.
+
+Chunked datasets are hashed chunk by chunk from their raw, still-compressed bytes
+(``read_direct_chunk``), so nothing is decompressed;
+other datasets are hashed from their values, read in large sequential blocks.
+Either way, the hashing of each piece runs in a thread pool,
+while HDF5 reads each piece in turn.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from h5py import Dataset, File
+import numpy as np
+
+from .blocks import block_shape, iter_blocks
+from .chunks import get_chunk_shape, visit_chunks
+from .utils import DEFAULT_BLOCK_BYTES, H5Path
+
+DEFAULT_ALGORITHM = "blake2b"
+
+#: First line of a manifest, followed by the algorithm's name
+MANIFEST_HEADER = "# hcl checksum "
+
+#: Pieces which may be queued in the pool at once, per thread
+PENDING_PER_JOB = 4
+
+#: (digest, number of bytes hashed)
+PieceDigest = Tuple[bytes, int]
+
+
+class DatasetDigest(NamedTuple):
+    path: H5Path
+    #: hex digest
+    digest: str
+    #: bytes which were hashed: stored bytes for chunked datasets, otherwise data
+    n_bytes: int
+    #: whether the dataset was hashed from its raw chunks
+    raw: bool
+
+
+def _new(algorithm: str):
+    return hashlib.new(algorithm)
+
+
+def _vlen_bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8", "surrogateescape")
+    if isinstance(value, np.ndarray):
+        return value.tobytes()
+    return repr(value).encode("utf-8")
+
+
+def _hash_array(arr: np.ndarray, algorithm: str) -> PieceDigest:
+    h = _new(algorithm)
+    if not arr.dtype.hasobject:
+        data = np.ascontiguousarray(arr)
+        h.update(data)
+        return h.digest(), data.nbytes
+    n_bytes = 0
+    for value in arr.flat:
+        b = _vlen_bytes(value)
+        h.update(len(b).to_bytes(8, "little"))
+        h.update(b)
+        n_bytes += len(b)
+    return h.digest(), n_bytes
+
+
+def _chunk_task(dsid, offset, algorithm) -> Callable[[], PieceDigest]:
+    def fn():
+        filter_mask, data = dsid.read_direct_chunk(offset)
+        h = _new(algorithm)
+        h.update(filter_mask.to_bytes(4, "little"))
+        h.update(data)
+        return h.digest(), len(data)
+
+    return fn
+
+
+def _block_task(dataset: Dataset, block, algorithm) -> Callable[[], PieceDigest]:
+    def fn():
+        return _hash_array(dataset[block], algorithm)
+
+    return fn
+
+
+def dataset_pieces(
+    dataset: Dataset, algorithm: str, block_bytes=DEFAULT_BLOCK_BYTES
+) -> Tuple[bytes, bool, Iterator[Tuple[bytes, Callable[[], PieceDigest]]]]:
+    """Plan how to hash a dataset.
+
+    Chunked datasets with fixed-size dtypes are hashed from their raw chunks,
+    keyed by chunk offset and including each chunk's filter mask;
+    others (including variable-length data, whose chunks only hold references)
+    by their values in blocks.
+
+    :return: Header bytes describing the dataset, whether it is hashed raw,
+        and (key, task) for each piece, where the task returns a PieceDigest;
+        tasks are created as the pieces are iterated over.
+    """
+    dsid = dataset.id
+    chunks = get_chunk_shape(dsid)
+    raw = chunks is not None and not dataset.dtype.hasobject and not dataset.is_virtual
+    header = repr((dataset.dtype.str, dataset.shape, chunks if raw else None)).encode(
+        "utf-8"
+    )
+
+    pieces: Iterator[Tuple[bytes, Callable[[], PieceDigest]]] = iter(())
+    if raw:
+        offsets: List[Tuple[int, ...]] = []
+        visit_chunks(dsid, lambda info: offsets.append(info.chunk_offset))
+        pieces = (
+            (repr(offset).encode("ascii"), _chunk_task(dsid, offset, algorithm))
+            for offset in offsets
+        )
+    elif dataset.shape is None:
+        pass
+    elif not dataset.shape:
+        pieces = iter([(b"()", _block_task(dataset, (), algorithm))])
+    elif dataset.size:
+        block = block_shape(dataset.shape, chunks, dataset.dtype.itemsize, block_bytes)
+        pieces = (
+            (
+                repr(tuple(s.start for s in sl)).encode("ascii"),
+                _block_task(dataset, sl, algorithm),
+            )
+            for sl in iter_blocks(dataset.shape, block)
+        )
+    return header, raw, pieces
+
+
+class _Combiner:
+    """Digest of a dataset, from its header and its pieces' digests, in order"""
+
+    def __init__(self, path: H5Path, header: bytes, raw: bool, algorithm: str):
+        self.path = path
+        self.raw = raw
+        self.hash = _new(algorithm)
+        self.hash.update(header)
+        self.n_bytes = 0
+
+    def add(self, key: bytes, piece: PieceDigest):
+        digest, n = piece
+        self.hash.update(key)
+        self.hash.update(digest)
+        self.n_bytes += n
+
+    def result(self) -> DatasetDigest:
+        return DatasetDigest(self.path, self.hash.hexdigest(), self.n_bytes, self.raw)
+
+
+def iter_digests(
+    f: File,
+    paths: Iterable[H5Path],
+    algorithm=DEFAULT_ALGORITHM,
+    jobs=1,
+    block_bytes=DEFAULT_BLOCK_BYTES,
+) -> Iterator[DatasetDigest]:
+    """Digest of each dataset, in the order given, as each is finished.
+
+    At most ``jobs * PENDING_PER_JOB`` pieces are queued or being hashed at once,
+    including pieces of the next datasets while waiting for earlier ones.
+    """
+    max_pending = jobs * PENDING_PER_JOB
+    with ThreadPoolExecutor(jobs) as pool:
+        # (combiner, key, future) for each piece in order,
+        # then (combiner, None, None) once all of a dataset's pieces are queued
+        pending: Deque[
+            Tuple[_Combiner, Optional[bytes], Optional["Future[PieceDigest]"]]
+        ] = deque()
+        n_futures = 0
+
+        def drain(until: int) -> Iterator[DatasetDigest]:
+            nonlocal n_futures
+            while pending and (n_futures > until or pending[0][2] is None):
+                combiner, key, future = pending.popleft()
+                if future is None:
+                    yield combiner.result()
+                else:
+                    combiner.add(key, future.result())
+                    n_futures -= 1
+
+        for path in paths:
+            header, raw, pieces = dataset_pieces(f[str(path)], algorithm, block_bytes)
+            combiner = _Combiner(path, header, raw, algorithm)
+            for key, fn in pieces:
+                yield from drain(max_pending - 1)
+                pending.append((combiner, key, pool.submit(fn)))
+                n_futures += 1
+            pending.append((combiner, None, None))
+        yield from drain(0)
+
+
+def tree_digest(digests: Iterable[Tuple[str, str]], algorithm=DEFAULT_ALGORITHM) -> str:
+    """Digest of a tree, from (name relative to the tree's root, hex digest)
+    of each dataset in it, in any order.
+
+    Relative names are used so that copies of a tree at different paths,
+    or in different files, have the same digest.
+    """
+    h = _new(algorithm)
+    for name, digest in sorted(digests):
+        h.update(f"{digest}  {name}\n".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
+def format_manifest_line(digest: str, path) -> str:
+    return f"{digest}  {path}"
+
+
+def read_manifest(lines: Iterable[str]) -> Tuple[Optional[str], Dict[str, str]]:
+    """Parse manifest lines as written by the ``checksum`` command.
+
+    Tree digests have paths ending in '/'.
+
+    :return: The algorithm (if given in the header), and hex digest by path.
+    """
+    algorithm = None
+    out = dict()
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith(MANIFEST_HEADER):
+            algorithm = line[len(MANIFEST_HEADER) :].strip()
+            continue
+        if not line.strip() or line.startswith("#"):
+            continue
+        digest, sep, path = line.partition("  ")
+        if not sep:
+            raise ValueError(f"Not a manifest line: {line!r}")
+        out[path] = digest
+    return algorithm, out
@@ -0,0 +1,130 @@
+"""
+Inspection of datasets' chunk layout, from HDF5 metadata only.
+"""
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+
+from h5py import h5d
+
+
+def is_chunked(dsid: h5d.DatasetID) -> bool:
+    return dsid.get_create_plist().get_layout() == h5d.CHUNKED
+
+
+def get_chunk_shape(dsid: h5d.DatasetID) -> Optional[Tuple[int, ...]]:
+    if not is_chunked(dsid):
+        return None
+    return dsid.get_create_plist().get_chunk()
+
+
+def get_filters(dsid: h5d.DatasetID) -> Tuple[tuple, ...]:
+    """(filter ID, flags, options, name) of each filter in the pipeline, in order"""
+    dcpl = dsid.get_create_plist()
+    return tuple(dcpl.get_filter(i) for i in range(dcpl.get_nfilters()))
+
+
+def same_raw_layout(a, b) -> bool:
+    """Whether two h5py.Datasets store chunks the same way,
+    so that chunks' stored bytes can be compared or copied directly.
+    """
+    return (
+        a.chunks is not None
+        and a.chunks == b.chunks
+        and not a.is_virtual
+        and not b.is_virtual
+        and not a.dtype.hasobject
+        and a.dtype == b.dtype
+        and get_filters(a.id) == get_filters(b.id)
+    )
+
+
+def chunk_grid_size(shape: Tuple[int, ...], chunks: Tuple[int, ...]) -> int:
+    """Number of chunks needed to cover the whole dataset"""
+    n = 1
+    for s, c in zip(shape, chunks):
+        n *= -(-s // c)
+    return n
+
+
+def visit_chunks(dsid: h5d.DatasetID, fn: Callable):
+    """Call ``fn`` with the StoreInfo of every allocated chunk, in index order.
+
+    Uses ``chunk_iter`` where available (h5py >= 3.8, HDF5 >= 1.12.3),
+    which visits all chunks in a single pass over the chunk index;
+    falls back to ``get_chunk_info`` for each chunk.
+    """
+    if hasattr(dsid, "chunk_iter"):
+        dsid.chunk_iter(fn)
+        return
+    for idx in range(dsid.get_num_chunks()):
+        fn(dsid.get_chunk_info(idx))
+
+
+class ChunkSummary:
+    """
+    Running summary of a dataset's allocated chunks, which uses constant memory.
+
+    Call with the StoreInfo of each chunk, in index order;
+    contiguity is measured between consecutive chunks in that order.
+
+    :param n_grid: Total number of chunks in the dataset's chunk grid.
+    """
+
+    def __init__(self, n_grid: int):
+        self.n_grid = n_grid
+        self.n_allocated = 0
+        self.total_bytes = 0
+        self.min_bytes: Optional[int] = None
+        self.max_bytes: Optional[int] = None
+        self.min_address: Optional[int] = None
+        self.max_address: Optional[int] = None
+        self.n_filters_skipped = 0
+        self.n_discontinuities = 0
+        self.seek_distance = 0
+        #: number of chunks by floor(log2(size))
+        self.histogram: Counter = Counter()
+        self._prev_end: Optional[int] = None
+
+    def __call__(self, store_info):
+        size = store_info.size
+        start = store_info.byte_offset
+        end = start + size
+
+        self.n_allocated += 1
+        self.total_bytes += size
+        if self.min_bytes is None or size < self.min_bytes:
+            self.min_bytes = size
+        if self.max_bytes is None or size > self.max_bytes:
+            self.max_bytes = size
+        if self.min_address is None or start < self.min_address:
+            self.min_address = start
+        if self.max_address is None or end > self.max_address:
+            self.max_address = end
+        if store_info.filter_mask:
+            self.n_filters_skipped += 1
+        if self._prev_end is not None and start != self._prev_end:
+            self.n_discontinuities += 1
+            self.seek_distance += abs(start - self._prev_end)
+        self._prev_end = end
+        self.histogram[size.bit_length() - 1 if size else -1] += 1
+
+    @property
+    def n_unallocated(self) -> int:
+        return self.n_grid - self.n_allocated
+
+    @property
+    def span(self) -> int:
+        """Bytes between the start of the first chunk and the end of the last"""
+        if self.min_address is None:
+            return 0
+        return self.max_address - self.min_address
+
+    def histogram_rows(self) -> List[Tuple[int, int, int]]:
+        """(lower bound, upper bound, count) for each non-empty power-of-2 size bin"""
+        out = []
+        for exp in sorted(self.histogram):
+            if exp < 0:
+                out.append((0, 0, self.histogram[exp]))
+            else:
+                out.append((2**exp, 2 ** (exp + 1) - 1, self.histogram[exp]))
+        return out
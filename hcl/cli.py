@@ -1,18 +1,20 @@
-from typing import Sequence, Type
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple, Type
 import shlex
 from pathlib import Path
 import logging
-from functools import wraps
 import sys
+import time
 
-from h5py import File
-from prompt_toolkit import print_formatted_text, PromptSession
-from prompt_toolkit.completion import NestedCompleter
-from prompt_toolkit.formatted_text import to_formatted_text
-
-from .utils import H5Path, normalise_path, Signal, is_dataset, is_group
+from .access import AccessSettings
+from .utils import H5Path, normalise_path, Signal
 from .commands import Command
 
+# h5py, prompt_toolkit and sqlite are imported when first needed,
+# so that one-off commands start quickly
+if TYPE_CHECKING:
+    from h5py import File, Group
+    from .profiling import Profiler
+
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +29,10 @@ class Cli:
         print_kwargs=None,
         mode="r",
         interactive=True,
+        use_cache=False,
+        output_format="text",
+        access: AccessSettings = AccessSettings(),
+        profiler: Optional["Profiler"] = None,
     ):
         self.fpath = Path(fpath) if fpath else None
         if not gpath:
@@ -37,34 +43,165 @@ class Cli:
         self.print_kwargs = print_kwargs or dict()
 
         self.commands = dict()
-        completers = dict()
         for cmd_cls in commands:
             c = cmd_cls(self)
             self.commands[c.name()] = c
-            completers[c.name()] = c.completer()
 
-        self.session_kwargs = {"completer": NestedCompleter(completers)}
-        self.session_kwargs.update(session_kwargs or dict())
+        # completers are only built if an interactive session is started
+        self.session_kwargs = session_kwargs or dict()
         self.mode = mode
+        self.access = access
+        self.profiler = profiler
         self.interactive = interactive
+        self.use_cache = use_cache
+
+        self.output_format = output_format
+        self.records = None
+        self.set_output_format(output_format)
 
         self.session = None
-        self.file = None
-        self.group = None
+        self.prefetcher = None
+        self.index = None
+        self.metadata_cache = None
+        self._file = None
+        self._group = None
+        self._entered = False
+
+    def set_output_format(self, output_format: str):
+        """Switch between text and machine-readable output"""
+        self.output_format = output_format
+        if output_format == "text":
+            self.records = None
+        else:
+            from .output import RecordWriter
+
+            self.records = RecordWriter(output_format, self.print_kwargs.get("file"))
 
     def __enter__(self):
+        self._entered = True
         if self.fpath:
-            self.file = File(self.fpath, mode=self.mode)
-            self.group = self.file[str(self.gpath)]
-            if not is_group(self.group):
-                raise ValueError(f"Not a group: {self.H5Path}")
+            from .index import HierarchyIndex
+
+            cache = None
+            if self.use_cache and not self.writable:
+                cache = self._open_cache()
+            self.index = HierarchyIndex(lambda: self.file, cache)
+            if cache is None:
+                # fail early if the file can't be opened
+                self.file
+            if not self.index.info(self.gpath).is_group:
+                raise ValueError(f"Not a group: {self.gpath}")
         return self
 
     def __exit__(self, exc_type, value, traceback):
-        if self.file:
-            self.file.close()
-        self.file = None
-        self.group = None
+        if self.profiler is not None and len(self.profiler.profiles) > 1:
+            from .profiling import summary
+
+            self.print("\n".join(summary(self.profiler.profiles)), file=sys.stderr)
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        if self.index is not None and self.index.cache is not None:
+            import sqlite3
+
+            try:
+                self.index.cache.flush()
+                self.metadata_cache.evict()
+            except sqlite3.Error as e:
+                logger.warning("Could not write metadata cache: %s", e)
+        if self.metadata_cache is not None:
+            self.metadata_cache.close()
+        if self._file:
+            self._file.close()
+        self._file = None
+        self._group = None
+        self._entered = False
+        self.index = None
+        self.metadata_cache = None
+
+    def _open_cache(self):
+        import sqlite3
+        from .cache import MetadataCache
+
+        try:
+            self.metadata_cache = MetadataCache()
+            return self.metadata_cache.open(self.fpath)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Not using metadata cache: %s", e)
+            if self.metadata_cache is not None:
+                self.metadata_cache.close()
+                self.metadata_cache = None
+            return None
+
+    @property
+    def file(self) -> Optional["File"]:
+        """The open file; opened on first access."""
+        if self._file is None and self._entered and self.fpath:
+            from h5py import File
+
+            kwargs = self.access.file_kwargs()
+            logger.debug(
+                "Opening %s in mode '%s' with %s", self.fpath, self.mode, kwargs
+            )
+            self._file = File(self.fpath, mode=self.mode, **kwargs)
+        return self._file
+
+    def reopen(self, access: AccessSettings):
+        """Close the file and open it again with new access settings.
+
+        The index is kept, as the file's contents do not change.
+        If the file cannot be opened with the new settings,
+        it is opened with the old ones and the error is raised.
+        A file opened to be created is reopened with mode 'r+',
+        so that it is neither truncated nor refused for existing.
+        """
+        # it must not be reading from the file as it is closed
+        self.stop_prefetching()
+        old = self.access
+        if self._file:
+            self._file.close()
+        self._file = None
+        if self.mode in ("w", "w-", "x", "a"):
+            self.mode = "r+"
+        self._group = None
+        self.access = access
+        try:
+            self.file
+        except Exception:
+            self.access = old
+            self._file = None
+            self.file
+            raise
+
+    def stop_prefetching(self):
+        """Stop reading ahead, waiting for any read in progress to finish.
+
+        Prefetching starts again at the next prompt.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.close(wait=True)
+            self.prefetcher = None
+
+    def prepare_workers(self):
+        """Get ready to start worker processes which open the file themselves.
+
+        Prefetching is stopped, as forked workers would inherit any lock
+        its thread holds, and pending writes are flushed, so that workers see them.
+        """
+        self.stop_prefetching()
+        if self.writable:
+            self.file.flush()
+
+    @property
+    def group(self) -> Optional["Group"]:
+        """The current working group."""
+        if self._group is None and self.file is not None:
+            self._group = self.file[str(self.gpath)]
+        return self._group
+
+    @property
+    def writable(self) -> bool:
+        return self.fpath is not None and self.mode != "r"
 
     def run_line(self, s):
         out = Signal.SUCCESS
@@ -75,9 +212,30 @@ class Cli:
                 break
         return out
 
+    def run_script(
+        self, lines: Iterable[str], keep_going=False
+    ) -> List[Tuple[str, Signal]]:
+        """Run each line as with ``run_line``, skipping blank lines and # comments.
+
+        Stops after the first line which fails, unless ``keep_going``,
+        or after a line which quits.
+
+        :return: Each line which was run, with its result.
+        """
+        results = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            result = self.run_line(line)
+            results.append((line, result))
+            if result == Signal.QUIT or (result != Signal.SUCCESS and not keep_going):
+                break
+        return results
+
     def run_command(self, argv):
         if not argv:
-            return
+            return Signal.SUCCESS
         cmd, *args = argv
 
         try:
@@ -86,37 +244,115 @@ class Cli:
             self.print(f"Not a known command: {cmd}", file=sys.stderr)
             return Signal.FAILURE
 
-        return fn(argv[1:])
+        if self.writable:
+            # the hierarchy may have changed since the last command
+            self.index.invalidate()
+            if self.prefetcher is not None:
+                self.prefetcher.forget_failures()
+
+        if self.records is None:
+            return fn(argv[1:])
+        self.records.begin()
+        try:
+            return fn(argv[1:])
+        finally:
+            self.records.end()
+
+    def completer(self):
+        """Completer for command names, and each command's arguments."""
+        from prompt_toolkit.completion import NestedCompleter
+
+        return NestedCompleter(
+            {name: c.completer() for name, c in self.commands.items()}
+        )
 
     def run(self):
+        from prompt_toolkit import PromptSession
+
         prefix = f"{self.fpath}:{{}} $ "
         if not self.session:
-            self.session = PromptSession(**self.session_kwargs)
-
+            self.session = PromptSession(
+                **{"completer": self.completer(), **self.session_kwargs}
+            )
         while True:
+            if self.index is not None and self.prefetcher is None:
+                from .prefetch import Prefetcher
+
+                self.prefetcher = Prefetcher(self.index, on_late=self._retry_completion)
+            if self.prefetcher is not None:
+                # read ahead where completion is likely to look next
+                self.prefetcher.prefetch_around(self.gpath)
             line = self.session.prompt(prefix.format(self.gpath))
             result = self.run_line(line)
             if result == Signal.QUIT:
                 break
 
+    def _retry_completion(self):
+        """Recompute completions from another thread, e.g. once data has arrived"""
+        app = self.session.app
+        if app.is_running and app.loop is not None:
+            app.loop.call_soon_threadsafe(app.current_buffer.start_completion)
+
     def change_group(self, path: H5Path):
-        if self.file is None:
+        if self.index is None:
             raise RuntimeError("File not open")
         new_path = normalise_path(path, self.gpath)
-        new_obj = self.file[str(new_path)]
-        if is_dataset(new_obj):
-            raise ValueError(f"Object at path is a dataset: {new_path}")
+        info = self.index.info(new_path)
+        if not info.is_group:
+            raise ValueError(f"Object at path is a {info.kind.value}: {new_path}")
         self.gpath = new_path
-        self.group = self.file[str(new_path)]
+        self._group = None
+
+    def emit(self, record: dict, text: Optional[str] = None):
+        """Output one result of a command.
+
+        In text mode, ``text`` is printed (if given);
+        otherwise, ``record`` is written in the chosen machine-readable format.
+        """
+        if self.records is None:
+            if text is not None:
+                self.print(text)
+            return
+        if self.profiler is None:
+            self.records.write(record)
+            return
+        started = time.perf_counter()
+        self.records.write(record)
+        self.profiler.output_seconds += time.perf_counter() - started
 
-    @wraps(print_formatted_text)
     def print(self, *args, **kwargs):
+        """Print to a terminal with prompt_toolkit's ``print_formatted_text``,
+        or as plain text otherwise.
+
+        In a machine-readable output mode, each line printed to stdout
+        is written as a ``{"text": line}`` record instead.
+        """
+        if self.profiler is None:
+            return self._print(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return self._print(*args, **kwargs)
+        finally:
+            self.profiler.output_seconds += time.perf_counter() - started
+
+    def _print(self, *args, **kwargs):
         kwargs = {**self.print_kwargs, **kwargs}
-        if kwargs.get("file", sys.stdout).isatty():
+        file = kwargs.get("file") or sys.stdout
+        if self.records is not None and file is self.records.out:
+            sep = kwargs.get("sep")
+            text = (" " if sep is None else sep).join(str(a) for a in args)
+            for line in text.split("\n"):
+                self.records.write({"text": line})
+            return
+        if file.isatty():
+            from prompt_toolkit import print_formatted_text
+
             print_formatted_text(*args, **kwargs)
         else:
             keep = {"sep", "end", "file", "flush"}
-            if self.interactive:
+            if self.interactive and not all(isinstance(a, str) for a in args):
+                from prompt_toolkit.formatted_text import to_formatted_text
+
                 formatted_items = [tup[1] for tup in to_formatted_text(args)]
             else:
                 formatted_items = args
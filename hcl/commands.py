@@ -1,19 +1,67 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+import os
+import shutil
 import sys
+import time
 from abc import ABC, abstractmethod
-from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from argparse import REMAINDER, ArgumentParser, Namespace
 import logging
 import pprint
 from textwrap import indent
 
-from h5py import Dataset
-from tree_format import format_tree
+from .utils import (
+    H5Path,
+    normalise_path,
+    obj_name,
+    relative_name,
+    Signal,
+    is_dataset,
+    is_group,
+    format_size,
+    parse_size,
+    DEFAULT_BLOCK_BYTES,
+    DEFAULT_PREVIEW_ITEMS,
+)
 
-from prompt_toolkit.completion import Completer, ThreadedCompleter
-from .utils import H5Path, normalise_path, obj_name, Signal, H5PathCompleter, is_dataset
+#: Hash algorithms for the checksum command; the first is the default
+CHECKSUM_ALGORITHMS = ("blake2b", "sha256", "sha1", "md5")
+
+# h5py, numpy, prompt_toolkit and the modules which use them are slow to import,
+# so are imported by the commands which need them, when they are run
+if TYPE_CHECKING:
+    from contextlib import ExitStack
+    from h5py import Dataset, File
+    from prompt_toolkit.completion import Completer
+    from .chunks import ChunkSummary
+    from .index import HierarchyIndex, NodeInfo
+    from .storage import StorageInfo
+
+
+def path_completer(
+    context, include_groups=True, include_datasets=True, threaded=True
+) -> "Completer":
+    """Completer for paths of groups and/or datasets in the context's file"""
+    from .completion import path_completer
+
+    return path_completer(context, include_groups, include_datasets, threaded)
+
+
+def attr_completer(context, threaded=True) -> "Completer":
+    """Completer for an object path followed by names of its attributes"""
+    from .completion import attr_completer
+
+    return attr_completer(context, threaded)
 
 
 class Command(ABC):
+    #: Whether the command needs a file to be open; commands which open their own
+    #: can also be run with ``--command`` when no file is given
+    needs_file = True
+    #: Whether the command is measured when profiling;
+    #: False for commands which run others
+    profiled = True
+
     def __init__(self, context):
         self.context = context
         self.logger = logging.getLogger(f"{__name__}.{self.name()}")
@@ -23,6 +71,17 @@ class Command(ABC):
         pass
 
     def __call__(self, argv=()) -> Signal:
+        profiler = self.context.profiler
+        if profiler is None or not self.profiled:
+            return self._call(argv)
+        from .profiling import format_profile
+
+        with profiler.measure(self.name(), argv):
+            result = self._call(argv)
+        self.context.print(format_profile(profiler.profiles[-1]), file=sys.stderr)
+        return result
+
+    def _call(self, argv) -> Signal:
         self.logger.debug("Called with arguments %s", argv)
         parser = self.argument_parser()
         try:
@@ -48,49 +107,225 @@ class Command(ABC):
     def name(self) -> str:
         pass
 
-    def completer(self) -> Optional[Completer]:
+    def completer(self) -> Optional["Completer"]:
         return None
 
+    def emit(self, record: dict, text: Optional[str] = None):
+        """Output one result: ``text`` in text mode, otherwise ``record``.
+
+        See ``Cli.emit``.
+        """
+        self.context.emit(record, text)
+
+    def open_location(self, spec: str, stack: "ExitStack", files: dict, mode="r"):
+        """Open the file of a '[FILE:]PATH' argument.
+
+        FILE is only recognised if it names an existing file;
+        otherwise, PATH is in the current file, relative to the current group.
+        Other files are opened once each (keyed by real path) in ``files``,
+        and closed by ``stack``.
+
+        :return: File path, h5py.File, and absolute object path.
+        """
+        fname, sep, path = spec.partition(":")
+        if not sep or not fname or not os.path.isfile(fname):
+            if self.context.file is None:
+                raise ValueError(f"No file given for '{spec}', and none is open")
+            return (
+                self.context.fpath,
+                self.context.file,
+                normalise_path(spec, self.context.gpath),
+            )
+        path = H5Path("/") / (path or "/")
+        key = os.path.realpath(fname)
+        if self.context.fpath is not None and key == os.path.realpath(
+            self.context.fpath
+        ):
+            return self.context.fpath, self.context.file, path
+        if key not in files:
+            from h5py import File
+
+            files[key] = stack.enter_context(File(fname, mode))
+        return fname, files[key], path
+
+    def location_index(self, f: "File") -> "HierarchyIndex":
+        """Index of a file from ``open_location``"""
+        if f is self.context.file:
+            return self.context.index
+        from .index import HierarchyIndex
+
+        return HierarchyIndex(lambda: f)
+
 
 class Ls(Command):
+    # links have no details
+    sort_keys = {
+        "size": lambda row: (row[2] and row[2].storage) or 0,
+        "time": lambda row: (row[2] and row[2].mtime) or 0,
+    }
+
     def name(self):
         return "ls"
 
     def argument_parser(self):
-        parser = ArgumentParser(self.name(), description="List members of a group")
+        parser = ArgumentParser(
+            self.name(),
+            description="List members of a group. "
+            "The long format shows kind, number of attributes, storage size, "
+            "shape, dtype, chunk shape, filters, modification time "
+            "(if the file records them) and name.",
+            add_help=False,
+        )
+        parser.add_argument("--help", action="help", help="Show this help message")
         parser.add_argument(
             "path", nargs="*", help="Paths to list the members of", type=H5Path
         )
-
+        parser.add_argument(
+            "-l", "--long", action="store_true", help="Use a long listing format"
+        )
+        parser.add_argument(
+            "-h", "--human-readable", action="store_true", help="Show sizes like 1.5M"
+        )
+        sort = parser.add_mutually_exclusive_group()
+        sort.add_argument(
+            "-S",
+            dest="sort",
+            action="store_const",
+            const="size",
+            help="Sort by storage size, largest first",
+        )
+        sort.add_argument(
+            "-t",
+            dest="sort",
+            action="store_const",
+            const="time",
+            help="Sort by modification time, newest first",
+        )
+        parser.add_argument(
+            "-R", "--recursive", action="store_true", help="List subgroups recursively"
+        )
         return parser
 
-    def ls_object(self, path: H5Path):
-        obj_path = normalise_path(path, self.context.gpath, True)
+    def rows(self, obj_path: H5Path, parsed_args):
+        """(name, NodeInfo, ObjectDetails) for each member of a group,
+        or for the object itself if it is not a group.
+        """
+        index = self.context.index
+        info = index.info(obj_path)
+        if info.is_link:
+            # dangling, so there is no object to describe
+            return [(None, info, None)]
+        if not info.is_group:
+            return [(None, info, index.details(obj_path))]
+
+        if not parsed_args.long and not parsed_args.sort:
+            # names only, so no object headers need to be read
+            return [(name, None, None) for name in index.member_names(obj_path)]
+
+        # reads the members' info too, in the same pass
+        details = index.member_details(obj_path)
+        members = index.members(obj_path)
+        rows = [(name, info, details.get(name)) for name, info in members.items()]
+        if parsed_args.sort:
+            rows.sort(key=self.sort_keys[parsed_args.sort], reverse=True)
+        return rows
+
+    def format_long(self, name, info: "NodeInfo", details, human=False) -> List[str]:
+        if details is None:
+            return [info.kind.value, "-", "-", "-", "-", "-", "-", "-", name]
+
+        size = "-" if details.storage is None else format_size(details.storage, human)
+        shape = "-"
+        if info.is_dataset:
+            shape = "null" if info.shape is None else format_dims(info.shape)
+        chunks = "-" if details.chunks is None else format_dims(details.chunks)
+        mtime = "-"
+        if details.mtime:
+            mtime = time.strftime("%Y-%m-%d %H:%M", time.localtime(details.mtime))
+        return [
+            info.kind.value,
+            str(details.n_attrs),
+            size,
+            shape,
+            info.dtype or "-",
+            chunks,
+            ",".join(details.filters) or "-",
+            mtime,
+            name,
+        ]
+
+    def ls_object(self, path: H5Path, parsed_args):
+        obj_path = normalise_path(path, self.context.gpath)
         self.logger.debug("Normalised path to %s", obj_path)
 
-        obj = self.context.group[str(obj_path)]
-        self.logger.debug("Listing item at %s", obj.name)
-        if is_dataset(obj):
-            return str(path)
-        else:
-            rows = sorted(obj.keys())
-            return "  ".join(rows)
+        self.logger.debug("Listing item at %s", obj_path)
+        rows = self.rows(obj_path, parsed_args)
+        if not parsed_args.long:
+            return "  ".join(str(path) if name is None else name for name, _, _ in rows)
+
+        table = []
+        for name, info, details in rows:
+            if name is None:
+                name = str(path)
+            if info.is_link:
+                name = f"{name} -> {info.target}"
+            table.append(
+                self.format_long(name, info, details, parsed_args.human_readable)
+            )
+        return format_table(table, right_align=(1, 2))
+
+    def expand(self, paths: List[H5Path], recursive=False) -> List[H5Path]:
+        """Add every group below each of the given paths, if ``recursive``"""
+        if not recursive:
+            return paths
+        index = self.context.index
+        out = []
+        for path in paths:
+            obj_path = normalise_path(path, self.context.gpath)
+            for p, info in index.walk(obj_path):
+                if p == obj_path:
+                    out.append(path)
+                elif info.is_group:
+                    out.append(path / p.relative_to(obj_path))
+        return out
+
+    def emit_rows(self, path: H5Path, parsed_args):
+        from .index import node_record
+
+        obj_path = normalise_path(path, self.context.gpath)
+        for name, info, details in self.rows(obj_path, parsed_args):
+            p = obj_path if name is None else obj_path / name
+            if info is None:
+                record = {"path": str(p)}
+            else:
+                record = node_record(p, info)
+            if details is not None:
+                record.update(details._asdict())
+            self.emit(record)
 
     def run(self, parsed_args):
         paths = parsed_args.path
         if not paths:
             paths = [self.context.gpath]
+        paths = self.expand(paths, parsed_args.recursive)
+
+        if self.context.records is not None:
+            for path in paths:
+                self.emit_rows(path, parsed_args)
+            return Signal.SUCCESS
 
-        if len(paths) == 1:
-            out = self.ls_object(paths[0])
+        if len(paths) == 1 and not parsed_args.recursive:
+            out = self.ls_object(paths[0], parsed_args)
         else:
-            out = "\n\n".join(f"{path}:\n{self.ls_object(path)}" for path in paths)
+            out = "\n\n".join(
+                f"{path}:\n{self.ls_object(path, parsed_args)}" for path in paths
+            )
 
         self.context.print(out)
         return Signal.SUCCESS
 
     def completer(self):
-        return ThreadedCompleter(H5PathCompleter(self.context, include_datasets=False))
+        return path_completer(self.context, include_datasets=False)
 
 
 class Pwd(Command):
@@ -101,7 +336,8 @@ class Pwd(Command):
         return ArgumentParser(self.name(), description="Get working group")
 
     def run(self, parsed_args):
-        self.context.print(str(self.context.gpath))
+        path = str(self.context.gpath)
+        self.emit({"path": path}, path)
         return Signal.SUCCESS
 
 
@@ -132,7 +368,7 @@ class Cd(Command):
         return sig
 
     def completer(self):
-        return ThreadedCompleter(H5PathCompleter(self.context, include_datasets=False))
+        return path_completer(self.context, include_datasets=False)
 
 
 class Exit(Command):
@@ -153,7 +389,12 @@ class Attrs(Command):
 
     def argument_parser(self):
         parser = ArgumentParser(
-            "attrs", description="List attributes or look at one attribute"
+            "attrs",
+            description="List attributes or look at one attribute. "
+            "Large values are previewed: arrays with more than --max-items elements "
+            "show their dtype, shape and size, and a few elements from each end "
+            "of each axis; long text is cut down to its start and end. "
+            "Attributes which are not shown are never read.",
         )
         parser.add_argument(
             "path",
@@ -175,31 +416,86 @@ class Attrs(Command):
             action="store_true",
             help="Show all attribute values, in recfile-like format",
         )
+        parser.add_argument(
+            "-l",
+            "--long",
+            action="store_true",
+            help="Show the dtype, shape and stored size of each attribute, "
+            "without reading values",
+        )
+        parser.add_argument(
+            "-F",
+            "--full",
+            action="store_true",
+            help="Show values in full, however large",
+        )
+        parser.add_argument(
+            "-n",
+            "--max-items",
+            type=int,
+            default=DEFAULT_PREVIEW_ITEMS,
+            help="Preview arrays with more elements than this "
+            f"(default {DEFAULT_PREVIEW_ITEMS})",
+        )
         return parser
 
-    def run(self, parsed_args):
-        if not parsed_args.path:
-            obj = self.context.group
+    def format_value(self, value, parsed_args):
+        from .preview import preview
+
+        if parsed_args.full:
+            import numpy as np
+
+            with np.printoptions(threshold=sys.maxsize):
+                return pprint.pformat(value, indent=2)
+        return preview(value, parsed_args.max_items)
+
+    def value_record(self, path, name, value, parsed_args):
+        from .preview import is_large
+
+        info = self.context.index.attr_infos(path)[name]
+        record = {"path": str(path), "name": name, **info._asdict()}
+        if not parsed_args.full and is_large(value, parsed_args.max_items):
+            record["truncated"] = True
+            record["head"] = value.reshape(-1)[: parsed_args.max_items]
         else:
-            obj = self.context.group[str(parsed_args.path)]
+            record["value"] = value
+        return record
+
+    def run(self, parsed_args):
+        index = self.context.index
+        path = normalise_path(parsed_args.path or ".", self.context.gpath)
+        structured = self.context.records is not None
+
+        if parsed_args.long:
+            return self.run_long(path, parsed_args)
 
         keys = parsed_args.attr
-        if len(keys) == 1:
-            self.context.print(pprint.pformat(obj.attrs[parsed_args.attr]))
+        if len(keys) == 1 and not structured:
+            self.context.print(
+                self.format_value(index.attr(path, keys[0]), parsed_args)
+            )
             return
 
         if len(keys) == 0:
-            sorted_keys = sorted(obj.attrs.keys())
+            sorted_keys = index.attr_names(path)
             if parsed_args.all:
                 keys = sorted_keys
+            elif structured:
+                for k in sorted_keys:
+                    self.emit({"path": str(path), "name": k})
+                return
             else:
                 self.context.print("\n".join(sorted_keys))
                 return
 
-        for k in keys:
-            v = obj.attrs[k]
+        if structured:
+            for k, v in index.iter_attrs(path, keys):
+                self.emit(self.value_record(path, k, v, parsed_args))
+            return
+
+        for k, v in index.iter_attrs(path, keys):
             out = []
-            formatted = pprint.pformat(v, indent=2)
+            formatted = self.format_value(v, parsed_args)
             n_lines = formatted.count("\n") + 1
             if n_lines == 1:
                 out.append(f"{k}: {formatted}")
@@ -208,8 +504,21 @@ class Attrs(Command):
             self.context.print(*out, sep="\n")
         return Signal.SUCCESS
 
+    def run_long(self, path, parsed_args):
+        from .preview import describe
+
+        infos = self.context.index.attr_infos(path)
+        names = parsed_args.attr or list(infos)
+        for k in names:
+            info = infos[k]
+            self.emit(
+                {"path": str(path), "name": k, **info._asdict()},
+                f"{k}: {describe(*info)}",
+            )
+        return Signal.SUCCESS
+
     def completer(self):
-        return ThreadedCompleter(H5PathCompleter(self.context))
+        return attr_completer(self.context)
 
 
 class AttributePrint(Command):
@@ -241,20 +550,22 @@ class AttributePrint(Command):
             return str(obj)
 
     def run(self, parsed_args):
-        obj = self.context.group[str(parsed_args.path)]
+        path = normalise_path(parsed_args.path, self.context.gpath)
         try:
-            attr = getattr(obj, self._name)
+            attr = self.context.index.property(path, self._name)
         except AttributeError as e:
             self.context.print(str(e), file=sys.stderr)
             return Signal.FAILURE
 
-        if attr is not None:
+        if self.context.records is not None:
+            self.emit({"path": str(path), "name": self._name, "value": attr})
+        elif attr is not None:
             self.context.print(self._format(attr))
         return Signal.SUCCESS
 
     def completer(self):
-        return ThreadedCompleter(
-            H5PathCompleter(self.context, self._include_groups, self._include_datasets)
+        return path_completer(
+            self.context, self._include_groups, self._include_datasets
         )
 
 
@@ -365,6 +676,15 @@ class Help(Command):
 
     def run(self, parsed_args):
         commands = sorted(self.context.commands)
+        if self.context.records is not None:
+            for c in commands:
+                parser = self.context.commands[c].argument_parser()
+                record = {"name": c, "description": parser.description}
+                if parsed_args.long:
+                    record["help"] = parser.format_help()
+                self.emit(record)
+            return Signal.SUCCESS
+
         if parsed_args.long:
             self.context.print(
                 *(
@@ -390,11 +710,11 @@ class Help(Command):
         return Signal.SUCCESS
 
 
-def format_shape(ds: Dataset) -> str:
+def format_shape(ds: "Dataset") -> str:
     return "x".join(str(s) for s in ds.shape)
 
 
-def format_dataset(ds: Dataset):
+def format_dataset(ds: "Dataset"):
     try:
         dtype = str(ds.dtype)
     except Exception:
@@ -416,6 +736,146 @@ def get_children(obj):
         return [v for _, v in sorted(obj.items())]
 
 
+def format_info(info: "NodeInfo"):
+    if info.is_dataset:
+        if info.shape is None:
+            shape = "null"
+        else:
+            shape = "x".join(str(s) for s in info.shape)
+        return f"{info.name}\t{shape}\t{info.dtype}"
+    if info.is_link:
+        return f"{info.name} -> {info.target}"
+    return info.name
+
+
+def format_dims(dims) -> str:
+    return "x".join(str(d) for d in dims) or "scalar"
+
+
+def format_table(rows: List[List[str]], right_align=(), sep="  ") -> str:
+    """Pad columns to line up; the last column is not padded"""
+    if not rows:
+        return ""
+    columns = list(zip(*rows))[:-1]
+    template = sep.join(
+        [
+            f"{{:{'>' if i in right_align else '<'}{max(map(len, col))}}}"
+            for i, col in enumerate(columns)
+        ]
+        + ["{}"]
+    )
+    return "\n".join(template.format(*row) for row in rows)
+
+
+TREE_BRANCH = "├── "
+TREE_LAST = "└── "
+TREE_PIPE = "│   "
+TREE_SPACE = "    "
+
+
+def _tree_rows(
+    index: "HierarchyIndex",
+    path: H5Path,
+    seen: Dict[int, H5Path],
+    datasets=True,
+    max_children=None,
+):
+    """(path, NodeInfo, label, extra) for each member shown in a tree.
+
+    Objects already in ``seen`` are shown as a reference to where they were first seen,
+    with ``extra["see"]`` (so are not descended into);
+    others are added to it.
+    Members beyond ``max_children`` are summarised in a row with no path or info,
+    and ``extra["more"]``.
+    """
+    children = [
+        (child, info)
+        for child, info in index.children(path)
+        if datasets or info.is_group or info.is_link
+    ]
+    n_hidden = 0
+    if max_children is not None and len(children) > max_children:
+        n_hidden = len(children) - max_children
+        children = children[:max_children]
+
+    rows = []
+    for child, info in children:
+        label = format_info(info)
+        if info.object_id in seen:
+            see = str(seen[info.object_id])
+            rows.append((child, info, f"{label} [see {see}]", {"see": see}))
+            continue
+        if info.object_id is not None:
+            seen[info.object_id] = child
+        rows.append((child, info, label, {}))
+
+    if n_hidden:
+        rows.append((None, None, f"… {n_hidden} more", {"more": n_hidden}))
+    return rows
+
+
+def iter_tree_nodes(
+    index: "HierarchyIndex",
+    path: H5Path,
+    max_depth: Optional[int] = None,
+    max_children: Optional[int] = None,
+    datasets=True,
+) -> Iterator[Tuple[str, int, Optional[H5Path], Optional["NodeInfo"], dict]]:
+    """As ``iter_tree``, but yielding (line, depth, path, NodeInfo, extra)
+    for each line; see ``_tree_rows``.
+    """
+    path = H5Path(path)
+    root = index.info(path)
+    yield format_info(root), 0, path, root, {}
+    if not root.is_group or max_depth == 0:
+        return
+
+    seen = {root.object_id: path}
+    stack = [("", 1, _tree_rows(index, path, seen, datasets, max_children), 0)]
+    while stack:
+        prefix, depth, rows, idx = stack.pop()
+        if idx >= len(rows):
+            continue
+        stack.append((prefix, depth, rows, idx + 1))
+
+        child, info, label, extra = rows[idx]
+        is_last = idx == len(rows) - 1
+        yield prefix + (
+            TREE_LAST if is_last else TREE_BRANCH
+        ) + label, depth, child, info, extra
+
+        if info is None or not info.is_group or extra:
+            continue
+        if max_depth is not None and depth >= max_depth:
+            continue
+        stack.append(
+            (
+                prefix + (TREE_SPACE if is_last else TREE_PIPE),
+                depth + 1,
+                _tree_rows(index, child, seen, datasets, max_children),
+                0,
+            )
+        )
+
+
+def iter_tree(
+    index: "HierarchyIndex",
+    path: H5Path,
+    max_depth: Optional[int] = None,
+    max_children: Optional[int] = None,
+    datasets=True,
+) -> Iterator[str]:
+    """Lazily generate the lines of a tree representation of the hierarchy.
+
+    Each group is only listed when the walk reaches it,
+    so lines can be shown while the rest of the tree is being read.
+    Objects reachable by several hard links are only expanded the first time;
+    soft and external links are shown, but not followed.
+    """
+    for line, *_ in iter_tree_nodes(index, path, max_depth, max_children, datasets):
+        yield line
+
+
 class Tree(Command):
     def name(self):
         return "tree"
@@ -423,69 +883,1873 @@ class Tree(Command):
     def argument_parser(self):
         parser = ArgumentParser(self.name(), description="Show hierarchy as a tree")
         parser.add_argument("path", nargs="*", type=H5Path, help="Groups to show")
+        parser.add_argument(
+            "-L",
+            "--max-depth",
+            type=int,
+            help="Descend at most this many levels below each given group",
+        )
+        parser.add_argument(
+            "-n",
+            "--max-children",
+            type=int,
+            help="Show at most this many members of each group, "
+            "summarising the rest",
+        )
+        members = parser.add_mutually_exclusive_group()
+        members.add_argument(
+            "--datasets",
+            action="store_true",
+            default=True,
+            help="Show datasets as well as groups (default)",
+        )
+        members.add_argument(
+            "-g",
+            "--groups-only",
+            action="store_false",
+            dest="datasets",
+            help="Only show groups",
+        )
         return parser
 
     def run(self, parsed_args):
-        if not parsed_args.path:
-            objs = [self.context.group]
-        else:
-            objs = [self.context.group[str(p)] for p in parsed_args.path]
+        paths = [normalise_path(p, self.context.gpath) for p in parsed_args.path]
+        if not paths:
+            paths = [self.context.gpath]
+
+        from .index import node_record
+
+        structured = self.context.records is not None
+        started = time.perf_counter()
+        n_lines = 0
+        for path_idx, path in enumerate(paths):
+            if path_idx and not structured:
+                self.context.print("")
+            for line, depth, p, info, extra in iter_tree_nodes(
+                self.context.index,
+                path,
+                parsed_args.max_depth,
+                parsed_args.max_children,
+                parsed_args.datasets,
+            ):
+                if not n_lines:
+                    self.logger.debug(
+                        "First line after %.3fs", time.perf_counter() - started
+                    )
+                if structured:
+                    record = {} if p is None else node_record(p, info)
+                    record["depth"] = depth
+                    record.update(extra)
+                    self.emit(record)
+                else:
+                    self.context.print(line)
+                n_lines += 1
+        self.logger.debug(
+            "Printed %s lines in %.3fs", n_lines, time.perf_counter() - started
+        )
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context, include_datasets=False, threaded=False)
+
+
+class Find(Command):
+    def name(self):
+        return "find"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Search for objects below the given groups "
+            "which match all of the given tests, printing each as it is found. "
+            "Patterns are shell-style wildcards. "
+            "Each object is visited once, even if it is reachable by several paths; "
+            "soft and external links are reported but not followed.",
+            allow_abbrev=False,
+        )
+        parser.add_argument(
+            "path", nargs="*", type=H5Path, help="Groups to search (default current)"
+        )
+        parser.add_argument(
+            "-name", help="Match the last component of the path against a pattern"
+        )
+        parser.add_argument(
+            "-path",
+            dest="path_pattern",
+            metavar="PATTERN",
+            help="Match the whole absolute path against a pattern; "
+            "groups which cannot contain a match are not searched",
+        )
+        parser.add_argument(
+            "-type",
+            choices=["g", "d", "t", "l"],
+            help="g: group, d: dataset, t: named datatype, l: soft or external link",
+        )
+        parser.add_argument("-dtype", help="Dataset dtype, e.g. float32 or f4")
+        parser.add_argument(
+            "-shape", help="Dataset shape, e.g. 100x3 or *x3 ('*' matches any length)"
+        )
+        parser.add_argument("-ndim", type=int, help="Number of dataset dimensions")
+        parser.add_argument(
+            "-minsize",
+            type=parse_size,
+            help="Minimum storage allocated in the file, e.g. 1G",
+        )
+        parser.add_argument(
+            "-maxsize",
+            type=parse_size,
+            help="Maximum storage allocated in the file, e.g. 10M",
+        )
+        parser.add_argument(
+            "-attr",
+            action="append",
+            default=[],
+            help="Has an attribute with this name, or NAME=VALUE for a given value; "
+            "can be used multiple times",
+        )
+        parser.add_argument(
+            "-prune",
+            action="append",
+            default=[],
+            metavar="PATTERN",
+            help="Do not search inside groups whose path matches this pattern; "
+            "can be used multiple times",
+        )
+        parser.add_argument(
+            "-maxdepth",
+            type=int,
+            help="Descend at most this many levels below each given group",
+        )
+        parser.add_argument(
+            "-mindepth",
+            type=int,
+            default=0,
+            help="Only match objects at least this many levels below each given group",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Search below each member group of the given groups "
+            "in this many processes; 0 means one per CPU (default 1). "
+            "Matches below different groups are then interleaved, "
+            "and objects with several hard links may be found at any of their paths",
+        )
+        parser.add_argument(
+            "--ndjson",
+            action="store_true",
+            help="Print a JSON record (path, kind, shape, dtype, target) per line",
+        )
+        return parser
+
+    def criteria(self, parsed_args):
+        from .find import Criteria, KINDS, normalise_dtype, parse_attr, parse_shape
+
+        return Criteria(
+            name=parsed_args.name,
+            path=parsed_args.path_pattern,
+            kinds=KINDS[parsed_args.type] if parsed_args.type else None,
+            dtype=normalise_dtype(parsed_args.dtype) if parsed_args.dtype else None,
+            shape=None if parsed_args.shape is None else parse_shape(parsed_args.shape),
+            ndim=parsed_args.ndim,
+            min_size=parsed_args.minsize,
+            max_size=parsed_args.maxsize,
+            attrs=tuple(parse_attr(a) for a in parsed_args.attr),
+            min_depth=parsed_args.mindepth,
+            prune=tuple(parsed_args.prune),
+        )
+
+    def run(self, parsed_args):
+        import json
+        from .find import iter_matches, iter_matches_parallel
+        from .index import node_record
+
+        try:
+            criteria = self.criteria(parsed_args)
+        except ValueError as e:
+            self.context.print(str(e), file=sys.stderr)
+            return Signal.FAILURE
+
+        paths = [normalise_path(p, self.context.gpath) for p in parsed_args.path]
+        if not paths:
+            paths = [self.context.gpath]
+
+        jobs = parsed_args.jobs or os.cpu_count() or 1
+        if jobs > 1:
+            self.context.prepare_workers()
+
+        index = self.context.index
+        for path in paths:
+            if jobs > 1:
+                matches = iter_matches_parallel(
+                    index,
+                    self.context.fpath,
+                    path,
+                    criteria,
+                    parsed_args.maxdepth,
+                    jobs,
+                )
+            else:
+                matches = iter_matches(index, path, criteria, parsed_args.maxdepth)
+            for p, info in matches:
+                record = node_record(p, info)
+                if parsed_args.ndjson and self.context.records is None:
+                    self.context.print(json.dumps(record))
+                else:
+                    self.emit(record, str(p))
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context, include_datasets=False)
+
+
+class Du(Command):
+    sort_keys = {
+        "name": None,
+        "allocated": lambda row: row[1].allocated,
+        "logical": lambda row: row[1].logical,
+        "ratio": lambda row: row[1].ratio or 0,
+        "chunks": lambda row: row[1].n_chunks or 0,
+    }
+
+    def name(self):
+        return "du"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Show storage used by groups and datasets. "
+            "Columns are allocated bytes, logical (uncompressed) bytes, "
+            "compression ratio, number of allocated chunks, and path. "
+            "Groups include everything below them; "
+            "objects reachable by several hard links are counted once.",
+            add_help=False,
+        )
+        parser.add_argument("--help", action="help", help="Show this help message")
+        parser.add_argument("path", nargs="*", type=H5Path, help="Objects to measure")
+        parser.add_argument(
+            "-s",
+            "--summarize",
+            action="store_true",
+            help="Only show a total for each given path",
+        )
+        parser.add_argument(
+            "-d",
+            "--max-depth",
+            type=int,
+            help="Only show objects this many levels below each given path",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=list(self.sort_keys),
+            default="name",
+            help="Sort by this column, largest first (default: hierarchy order)",
+        )
+        parser.add_argument(
+            "-h", "--human-readable", action="store_true", help="Show sizes like 1.5M"
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of processes to read dataset metadata with; "
+            "0 means one per CPU (default 1)",
+        )
+        return parser
+
+    def read_storage(self, paths: List[H5Path], jobs: int) -> List["StorageInfo"]:
+        from h5py import h5d
+        from .storage import read_storage, read_storage_parallel
+
+        if jobs == 0:
+            jobs = os.cpu_count() or 1
+        if jobs > 1 and len(paths) > 1:
+            self.context.prepare_workers()
+            return read_storage_parallel(self.context.fpath, paths, jobs)
+        fid = self.context.file.id
+        return [read_storage(h5d.open(fid, str(p).encode())) for p in paths]
+
+    def du_object(self, path: H5Path, parsed_args):
+        from .storage import sum_storage
+
+        max_depth = 0 if parsed_args.summarize else parsed_args.max_depth
+        index = self.context.index
+
+        nodes = []
+        datasets = []
+        for p, info in index.walk(path):
+            if info.is_group or info.is_dataset:
+                nodes.append((p, info))
+            if info.is_dataset:
+                datasets.append(p)
+
+        storage = dict(zip(datasets, self.read_storage(datasets, parsed_args.jobs)))
+        # children come after their parents, so totals can be built bottom-up
+        for p, info in reversed(nodes):
+            if info.is_group:
+                storage[p] = sum_storage(
+                    storage[c] for c, _ in index.children(p) if c in storage
+                )
+
+        n_parts = len(path.parts)
+        return [
+            (p, storage[p])
+            for p, _ in nodes
+            if max_depth is None or len(p.parts) - n_parts <= max_depth
+        ]
+
+    def run(self, parsed_args):
+        paths = [normalise_path(p, self.context.gpath) for p in parsed_args.path]
+        if not paths:
+            paths = [self.context.gpath]
+
+        rows = []
+        for path in paths:
+            rows.extend(self.du_object(path, parsed_args))
+
+        key = self.sort_keys[parsed_args.sort]
+        if key is not None:
+            rows.sort(key=key, reverse=True)
+
+        human = parsed_args.human_readable
+        for p, info in rows:
+            ratio = "-" if info.ratio is None else f"{info.ratio:.2f}"
+            chunks = "-" if info.n_chunks is None else str(info.n_chunks)
+            text = "\t".join(
+                [
+                    format_size(info.allocated, human),
+                    format_size(info.logical, human),
+                    ratio,
+                    chunks,
+                    str(p),
+                ]
+            )
+            self.emit({"path": str(p), **info._asdict(), "ratio": info.ratio}, text)
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+class Chunkinfo(Command):
+    def name(self):
+        return "chunkinfo"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Show where a chunked dataset's chunks are stored. "
+            "For each allocated chunk, show its offset in the dataset, "
+            "its size in bytes, its address in the file, "
+            "and its filter mask (non-zero if any filters were skipped); "
+            "then summarise the chunk sizes and how contiguously they are stored. "
+            "Chunks are read from the chunk index, not decompressed.",
+            add_help=False,
+        )
+        parser.add_argument("--help", action="help", help="Show this help message")
+        parser.add_argument("path", type=H5Path, help="Path to dataset")
+        parser.add_argument(
+            "-s", "--summary", action="store_true", help="Only show the summary"
+        )
+        parser.add_argument(
+            "-h", "--human-readable", action="store_true", help="Show sizes like 1.5M"
+        )
+        return parser
+
+    def print_chunk(self, store_info):
+        text = "\t".join(
+            [
+                ",".join(str(o) for o in store_info.chunk_offset),
+                str(store_info.size),
+                str(store_info.byte_offset),
+                hex(store_info.filter_mask),
+            ]
+        )
+        record = {
+            "offset": list(store_info.chunk_offset),
+            "size": store_info.size,
+            "address": store_info.byte_offset,
+            "filter_mask": store_info.filter_mask,
+        }
+        self.emit(record, text)
+
+    def summary_record(self, chunk_shape, summary: "ChunkSummary") -> dict:
+        return {
+            "summary": {
+                "chunk_shape": list(chunk_shape),
+                "n_allocated": summary.n_allocated,
+                "n_unallocated": summary.n_unallocated,
+                "n_grid": summary.n_grid,
+                "total_bytes": summary.total_bytes,
+                "min_bytes": summary.min_bytes,
+                "max_bytes": summary.max_bytes,
+                "span": summary.span,
+                "n_discontinuities": summary.n_discontinuities,
+                "seek_distance": summary.seek_distance,
+                "n_filters_skipped": summary.n_filters_skipped,
+                "histogram": [list(row) for row in summary.histogram_rows()],
+            }
+        }
+
+    def print_summary(self, chunk_shape, summary: "ChunkSummary", human=False):
+        if self.context.records is not None:
+            self.emit(self.summary_record(chunk_shape, summary))
+            return
+
+        def size(n):
+            return format_size(n, human)
+
         out = [
-            format_tree(obj, format_node=format_obj, get_children=get_children)
-            for obj in objs
+            f"chunk shape: {chunk_shape}",
+            f"chunks: {summary.n_allocated} allocated, "
+            f"{summary.n_unallocated} unallocated, {summary.n_grid} in grid",
         ]
-        self.context.print(*out, sep="\n\n")
+        if summary.n_allocated:
+            mean = summary.total_bytes // summary.n_allocated
+            occupied = 100 * summary.total_bytes / summary.span if summary.span else 0
+            out.extend(
+                [
+                    f"bytes: {size(summary.total_bytes)} total, "
+                    f"min {size(summary.min_bytes)}, mean {size(mean)}, "
+                    f"max {size(summary.max_bytes)}",
+                    f"file span: {size(summary.span)} ({occupied:.1f}% occupied)",
+                    f"discontinuities: {summary.n_discontinuities} "
+                    f"(total seek {size(summary.seek_distance)})",
+                    f"chunks with skipped filters: {summary.n_filters_skipped}",
+                    "size histogram:",
+                ]
+            )
+            for lower, upper, count in summary.histogram_rows():
+                out.append(f"  {size(lower)}-{size(upper)}\t{count}")
+        self.context.print(*out, sep="\n")
+
+    def run(self, parsed_args):
+        from h5py import h5d
+        from .chunks import ChunkSummary, chunk_grid_size, get_chunk_shape, visit_chunks
+
+        path = normalise_path(parsed_args.path, self.context.gpath)
+        dsid = h5d.open(self.context.file.id, str(path).encode())
+        chunk_shape = get_chunk_shape(dsid)
+        if chunk_shape is None:
+            self.context.print(f"Dataset is not chunked: {path}", file=sys.stderr)
+            return Signal.FAILURE
+
+        summary = ChunkSummary(chunk_grid_size(dsid.shape, chunk_shape))
+        if parsed_args.summary:
+            callback = summary
+        else:
+
+            def callback(store_info):
+                summary(store_info)
+                self.print_chunk(store_info)
+
+        visit_chunks(dsid, callback)
+        self.print_summary(chunk_shape, summary, parsed_args.human_readable)
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context, include_groups=False)
+
+
+class Stats(Command):
+    def name(self):
+        return "stats"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Show summary statistics of a numeric dataset. "
+            "Shows the count of non-NaN values, min, max, mean and standard deviation "
+            "(all ignoring NaNs), the number of NaNs, "
+            "and the number of elements equal to the fill value. "
+            "The dataset is read in chunk-aligned blocks, "
+            "so it does not need to fit in memory.",
+        )
+        parser.add_argument("path", type=H5Path, help="Path to dataset")
+        parser.add_argument(
+            "-a",
+            "--axis",
+            type=int,
+            help="Reduce over this axis only, showing arrays of statistics",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of processes to read and reduce blocks with; "
+            "0 means one per CPU (default 1)",
+        )
+        parser.add_argument(
+            "-b",
+            "--block-size",
+            type=parse_size,
+            help="Approximate memory to use per process for each block of data, "
+            f"e.g. 256M (default {format_size(DEFAULT_BLOCK_BYTES, True)})",
+        )
+        return parser
+
+    def run(self, parsed_args):
+        from .stats import STAT_NAMES, check_dtype, dataset_stats
+
+        path = normalise_path(parsed_args.path, self.context.gpath)
+        dataset = self.context.file[str(path)]
+        if not is_dataset(dataset):
+            self.context.print(f"Not a dataset: {path}", file=sys.stderr)
+            return Signal.FAILURE
+        if dataset.shape is None:
+            self.context.print(f"Dataset has a null dataspace: {path}", file=sys.stderr)
+            return Signal.FAILURE
+        try:
+            check_dtype(dataset.dtype)
+        except TypeError as e:
+            self.context.print(str(e), file=sys.stderr)
+            return Signal.FAILURE
+
+        jobs = parsed_args.jobs or os.cpu_count() or 1
+        if jobs > 1:
+            self.context.prepare_workers()
+
+        started = time.perf_counter()
+        running, bytes_read = dataset_stats(
+            dataset, parsed_args.axis, parsed_args.block_size, jobs, self.context.fpath
+        )
+        elapsed = time.perf_counter() - started
+
+        results = running.results()
+        if self.context.records is not None:
+            record = {"path": str(path), "axis": parsed_args.axis}
+            record.update((name, results[name]) for name in STAT_NAMES)
+            record["fillvalue"] = dataset.fillvalue
+            record["bytes_read"] = bytes_read
+            record["seconds"] = elapsed
+            self.emit(record)
+            return Signal.SUCCESS
+
+        for name in STAT_NAMES:
+            value = results[name]
+            if name == "fill":
+                name = f"fill ({dataset.fillvalue})"
+            if value.ndim:
+                self.context.print(f"{name}:\n{indent(str(value), '  ')}")
+            else:
+                self.context.print(f"{name}: {value}")
+
+        rate = bytes_read / elapsed / 1e6 if elapsed else float("inf")
+        self.context.print(
+            f"read {format_size(bytes_read, True)} in {elapsed:.2f}s ({rate:.1f} MB/s)",
+            file=sys.stderr,
+        )
         return Signal.SUCCESS
 
     def completer(self):
-        return H5PathCompleter(self.context, include_datasets=False)
-
-
-# class Cp(Command):
-#     def name(self):
-#         return "cp"
-
-#     def argument_parser(self):
-#         parser = ArgumentParser(
-#             self.name(),
-#             description="Copy an object from one path to another; always recursive.",
-#         )
-#         parser.add_argument(
-#             "source",
-#             nargs="+",
-#             help="Original object to copy. "
-#             "Trailing slash means copy all objects from the given group, not the group itself.",
-#         )
-#         parser.add_argument(
-#             "dest",
-#             help="Destination to copy to. "
-#             "Trailing slash OR multiple sources means copy *into* the given group, keeping original names. "
-#             "Otherwise, copy to new group/dataset of the given name.",
-#         )
-#         return parser
-
-#     def run(self, parsed_args):
-#         sources = []
-#         for src in parsed_args.source:
-#             if src.endswith("/") and len(src) > 1:
-#                 for member in self.context.group[str(src[:-1])].values():
-#                     sources.append(member)
-#             else:
-#                 sources.append(self.context.group[str(src)])
-
-#         dest = parsed_args.dest
-#         into_group = len(sources) > 1 or dest.endswith("/")
-#         if len(dest) > 1:
-#             dest = dest.rstrip("/")
-
-#         if into_group:
-#             for src in sources:
-#                 self.context.group.copy(src, dest)
-#         else:
-#             src = sources.pop()
-#             dest_path = H5Path(dest)
-#             self.context.group.copy(src, str(dest_path.parent), dest_path.name)
-#         return Signal.SUCCESS
+        return path_completer(self.context, include_groups=False)
+
+
+class Slice(Command):
+    def name(self):
+        return "slice"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Show a selection of a dataset's values. "
+            "Only the selected elements are read. "
+            "When piped from --command mode, the selection is written to stdout "
+            "in .npy format instead.",
+        )
+        parser.add_argument(
+            "selection",
+            nargs="+",
+            help="Path to dataset, followed by a NumPy-style selection "
+            "of integers, slices and '...', e.g. 'ds[100:200, ::10, 3]'",
+        )
+        self.add_output_arguments(parser)
+        return parser
+
+    def add_output_arguments(self, parser):
+        parser.add_argument(
+            "-f",
+            "--full",
+            action="store_true",
+            help="Print every value, rather than summarising large arrays",
+        )
+        parser.add_argument(
+            "-t",
+            "--text",
+            action="store_true",
+            help="Print text even when piped",
+        )
+
+    def get_selection(self, parsed_args):
+        from .selection import parse_selection
+
+        return parse_selection(" ".join(parsed_args.selection))
+
+    def write_npy(self, arr):
+        import numpy as np
+
+        out = sys.stdout.buffer
+        # np.ascontiguousarray would make a 0-d array 1-d
+        np.lib.format.write_array(
+            out, np.require(arr, requirements="C"), allow_pickle=False
+        )
+        out.flush()
+
+    def print_array(self, arr, full=False):
+        import numpy as np
+
+        kwargs = {"linewidth": shutil.get_terminal_size().columns}
+        if full:
+            kwargs["threshold"] = sys.maxsize
+        with np.printoptions(**kwargs):
+            self.context.print(str(arr))
+
+    def run(self, parsed_args):
+        path, selection = self.get_selection(parsed_args)
+        path = normalise_path(path, self.context.gpath)
+        dataset = self.context.file[str(path)]
+        if not is_dataset(dataset):
+            self.context.print(f"Not a dataset: {path}", file=sys.stderr)
+            return Signal.FAILURE
+        if dataset.shape is None:
+            return self.show_null(path, dataset, parsed_args)
+        from .selection import read_selection
+
+        try:
+            arr = read_selection(dataset, selection)
+        except (IndexError, ValueError) as e:
+            self.context.print(str(e), file=sys.stderr)
+            return Signal.FAILURE
+
+        if self.context.records is not None:
+            self.emit(
+                {
+                    "path": str(path),
+                    "shape": list(arr.shape),
+                    "dtype": str(arr.dtype),
+                    "data": arr,
+                }
+            )
+        elif not self.context.interactive and not parsed_args.text:
+            self.write_npy(arr)
+        else:
+            self.print_array(arr, parsed_args.full)
+        return Signal.SUCCESS
+
+    def show_null(self, path, dataset, parsed_args):
+        """A dataset with a null dataspace has no values to select"""
+        if self.context.records is not None:
+            self.emit(
+                {
+                    "path": str(path),
+                    "shape": None,
+                    "dtype": str(dataset.dtype),
+                    "data": None,
+                }
+            )
+        elif not self.context.interactive and not parsed_args.text:
+            self.context.print(f"Null dataspace: {path}", file=sys.stderr)
+        else:
+            self.context.print("null dataspace")
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+class Head(Slice):
+    def name(self):
+        return "head"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Show the first values of a dataset along its first axis. "
+            "Only those values are read. "
+            "When piped from --command mode, they are written to stdout "
+            "in .npy format instead.",
+        )
+        parser.add_argument("path", type=H5Path, help="Path to dataset")
+        parser.add_argument(
+            "-n",
+            "--lines",
+            type=int,
+            default=10,
+            help="Number of elements along the first axis (default 10)",
+        )
+        self.add_output_arguments(parser)
+        return parser
+
+    def get_selection(self, parsed_args):
+        path = normalise_path(parsed_args.path, self.context.gpath)
+        info = self.context.index.info(path)
+        if not info.is_dataset or not info.shape:
+            return str(path), ()
+        return str(path), (slice(0, parsed_args.lines),)
+
+
+class Export(Command):
+    formats = ("npy", "csv", "raw")
+
+    def name(self):
+        return "export"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Write a dataset, or a selection of it, to another format. "
+            "Data is streamed in blocks, so it does not need to fit in memory. "
+            "npy files are memory-mapped and filled in place; "
+            "csv (2D at most; trailing axes are flattened into columns) "
+            "and raw (C order, little-endian) are written sequentially, "
+            "so can be written to stdout.",
+        )
+        parser.add_argument(
+            "selection",
+            nargs="+",
+            help="Path to dataset, optionally followed by a NumPy-style selection "
+            "as for the 'slice' command",
+        )
+        parser.add_argument("output", help="File to write to; '-' for stdout")
+        parser.add_argument(
+            "-f",
+            "--format",
+            choices=self.formats,
+            help="Output format; by default, inferred from the output file extension "
+            "(.npy, .csv; raw otherwise)",
+        )
+        parser.add_argument(
+            "-b",
+            "--block-size",
+            type=parse_size,
+            default=DEFAULT_BLOCK_BYTES,
+            help="Approximate memory to use for each block of data, e.g. 256M "
+            f"(default {format_size(DEFAULT_BLOCK_BYTES, True)})",
+        )
+        parser.add_argument(
+            "-t",
+            "--threaded",
+            action="store_true",
+            help="For csv and raw, read the next block in a background thread "
+            "while writing the current one (uses 3 blocks of memory)",
+        )
+        parser.add_argument(
+            "-q", "--quiet", action="store_true", help="Do not show progress"
+        )
+        return parser
+
+    def get_format(self, parsed_args):
+        if parsed_args.format:
+            return parsed_args.format
+        suffix = Path(parsed_args.output).suffix.lower()
+        return {".npy": "npy", ".csv": "csv"}.get(suffix, "raw")
+
+    def run(self, parsed_args):
+        import numpy as np
+        from .export import Progress, export_npy, export_stream
+        from .selection import normalise_selection, parse_selection, selection_shape
+
+        path, selection = parse_selection(" ".join(parsed_args.selection))
+        path = normalise_path(path, self.context.gpath)
+        dataset = self.context.file[str(path)]
+        if not is_dataset(dataset):
+            self.context.print(f"Not a dataset: {path}", file=sys.stderr)
+            return Signal.FAILURE
+        if dataset.dtype.kind == "O":
+            self.context.print(
+                f"Cannot export variable-length dtype {dataset.dtype}", file=sys.stderr
+            )
+            return Signal.FAILURE
+        if dataset.shape is None:
+            self.context.print(
+                f"Cannot export a null dataspace: {path}", file=sys.stderr
+            )
+            return Signal.FAILURE
+        try:
+            selection = normalise_selection(selection, dataset.shape)
+        except (IndexError, ValueError) as e:
+            self.context.print(str(e), file=sys.stderr)
+            return Signal.FAILURE
+
+        fmt = self.get_format(parsed_args)
+        to_stdout = parsed_args.output == "-"
+        if fmt == "npy" and to_stdout:
+            self.context.print(
+                "npy cannot be streamed to stdout; use the 'slice' command",
+                file=sys.stderr,
+            )
+            return Signal.FAILURE
+
+        n_bytes = int(np.prod(selection_shape(selection))) * dataset.dtype.itemsize
+        progress = Progress(n_bytes, enabled=not parsed_args.quiet)
+        self.logger.debug("Exporting %s bytes as %s", n_bytes, fmt)
+
+        if fmt == "npy":
+            export_npy(
+                dataset, selection, parsed_args.output, parsed_args.block_size, progress
+            )
+        elif to_stdout:
+            export_stream(
+                dataset,
+                selection,
+                sys.stdout.buffer,
+                fmt,
+                parsed_args.block_size,
+                parsed_args.threaded,
+                progress,
+            )
+            sys.stdout.buffer.flush()
+        else:
+            with open(parsed_args.output, "wb") as f:
+                export_stream(
+                    dataset,
+                    selection,
+                    f,
+                    fmt,
+                    parsed_args.block_size,
+                    parsed_args.threaded,
+                    progress,
+                )
+        progress.finish()
+        if self.context.records is not None and not to_stdout:
+            self.emit(
+                {
+                    "path": str(path),
+                    "output": parsed_args.output,
+                    "format": fmt,
+                    "shape": list(selection_shape(selection)),
+                    "dtype": str(dataset.dtype),
+                    "bytes": n_bytes,
+                }
+            )
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+class Diff(Command):
+    needs_file = False
+
+    def name(self):
+        return "diff"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Compare two groups or datasets, which may be in different files, "
+            "and show each difference in hierarchy, link targets, attributes, "
+            "shape, dtype and data. "
+            "Metadata is compared first; then data, chunk by chunk. "
+            "Where both datasets have the same chunking and filters, "
+            "chunks with identical stored bytes are not decompressed. "
+            "Data differences are shown as the bounding hyperslab "
+            "of the differing elements in each differing chunk or block. "
+            "Fails if there are any differences.",
+        )
+        parser.add_argument(
+            "first",
+            help="'[FILE:]PATH' of a group or dataset; "
+            "without FILE, in the current file",
+        )
+        parser.add_argument("second", help="'[FILE:]PATH' to compare with")
+        parser.add_argument(
+            "-q",
+            "--quiet",
+            action="store_true",
+            help="Show nothing, and stop at the first difference",
+        )
+        parser.add_argument(
+            "--no-attrs", action="store_true", help="Do not compare attributes"
+        )
+        parser.add_argument(
+            "--no-data", action="store_true", help="Do not compare dataset values"
+        )
+        parser.add_argument(
+            "--rtol",
+            type=float,
+            default=0.0,
+            help="Relative tolerance for comparing floats (default 0)",
+        )
+        parser.add_argument(
+            "--atol",
+            type=float,
+            default=0.0,
+            help="Absolute tolerance for comparing floats (default 0)",
+        )
+        parser.add_argument(
+            "-n",
+            "--max-regions",
+            type=int,
+            default=10,
+            help="Show at most this many differing regions per dataset (default 10)",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of processes to compare datasets' data with; "
+            "0 means one per CPU (default 1)",
+        )
+        parser.add_argument(
+            "-b",
+            "--block-size",
+            type=parse_size,
+            default=DEFAULT_BLOCK_BYTES,
+            help="Approximate memory to use for each block of data "
+            "where chunks cannot be compared directly, "
+            f"e.g. 256M (default {format_size(DEFAULT_BLOCK_BYTES, True)})",
+        )
+        return parser
+
+    def format_difference(self, d, labels) -> str:
+        from .diff import ONLY_FIRST, ONLY_SECOND
+
+        if d.kind == ONLY_FIRST:
+            return f"Only in {labels[0]}: {d.path}"
+        if d.kind == ONLY_SECOND:
+            return f"Only in {labels[1]}: {d.path}"
+        return f"{d.path}: {d.kind} {d.detail}"
+
+    def run(self, parsed_args):
+        from contextlib import ExitStack
+        from .diff import DataOptions, compare_structure, iter_data_differences
+
+        quiet = parsed_args.quiet
+        options = DataOptions(
+            parsed_args.rtol,
+            parsed_args.atol,
+            parsed_args.block_size,
+            1 if quiet else parsed_args.max_regions,
+        )
+        jobs = parsed_args.jobs or os.cpu_count() or 1
+
+        with ExitStack() as stack:
+            files = dict()
+            fpath_a, file_a, path_a = self.open_location(
+                parsed_args.first, stack, files
+            )
+            fpath_b, file_b, path_b = self.open_location(
+                parsed_args.second, stack, files
+            )
+            index_a = self.location_index(file_a)
+            index_b = self.location_index(file_b)
+            labels = (f"{fpath_a}:{path_a}", f"{fpath_b}:{path_b}")
+            if jobs > 1:
+                self.context.prepare_workers()
+
+            pairs = []
+            differences = compare_structure(
+                index_a,
+                path_a,
+                index_b,
+                path_b,
+                attrs=not parsed_args.no_attrs,
+                pairs=None if parsed_args.no_data else pairs,
+            )
+            n_found = 0
+            for d in differences:
+                n_found += 1
+                if quiet:
+                    return Signal.FAILURE
+                self.emit_difference(d, labels)
+
+            for d in iter_data_differences(
+                pairs, file_a, file_b, options, jobs, (fpath_a, fpath_b)
+            ):
+                n_found += 1
+                if quiet:
+                    return Signal.FAILURE
+                self.emit_difference(d, labels)
+
+        if n_found:
+            self.context.print(f"{n_found} differences", file=sys.stderr)
+            return Signal.FAILURE
+        return Signal.SUCCESS
+
+    def emit_difference(self, d, labels):
+        record = {"path": d.path, "kind": d.kind, "detail": d.detail}
+        if d.region is not None:
+            record["region"] = [list(r) for r in d.region]
+        self.emit(record, self.format_difference(d, labels))
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+class Checksum(Command):
+    def name(self):
+        return "checksum"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Write or check a manifest of dataset digests. "
+            "Chunked datasets are hashed from their raw, compressed chunks, "
+            "without decompressing them; other datasets from their values, "
+            "read in large sequential blocks. "
+            "Each dataset's digest is printed as 'DIGEST  PATH', "
+            "then each given group's tree digest as 'DIGEST  PATH/', "
+            "which covers every dataset below it "
+            "and does not depend on where the group is.",
+        )
+        parser.add_argument(
+            "path",
+            nargs="*",
+            type=H5Path,
+            help="Datasets or groups to hash (default current group); "
+            "with --check, only check manifest entries at or below these",
+        )
+        parser.add_argument(
+            "-a",
+            "--algorithm",
+            choices=CHECKSUM_ALGORITHMS,
+            help=f"Hash algorithm (default {CHECKSUM_ALGORITHMS[0]}, "
+            "or the manifest's when checking)",
+        )
+        parser.add_argument(
+            "-c",
+            "--check",
+            metavar="MANIFEST",
+            help="Check digests against a manifest written by this command, "
+            "printing OK, FAILED or MISSING for each entry",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=0,
+            help="Number of threads to hash with; 0 means one per CPU (default 0)",
+        )
+        parser.add_argument(
+            "-b",
+            "--block-size",
+            type=parse_size,
+            default=DEFAULT_BLOCK_BYTES,
+            help="Approximate memory to use for each block of unchunked data, "
+            f"e.g. 256M (default {format_size(DEFAULT_BLOCK_BYTES, True)})",
+        )
+        return parser
+
+    def datasets_below(self, path: H5Path) -> List[H5Path]:
+        return [p for p, info in self.context.index.walk(path) if info.is_dataset]
+
+    def digests(self, paths, algorithm, parsed_args):
+        from .checksum import iter_digests
+
+        jobs = parsed_args.jobs or os.cpu_count() or 1
+        yield from iter_digests(
+            self.context.file, paths, algorithm, jobs, parsed_args.block_size
+        )
+
+    def run(self, parsed_args):
+        if parsed_args.check:
+            return self.run_check(parsed_args)
+        from .checksum import (
+            MANIFEST_HEADER,
+            format_manifest_line,
+            tree_digest,
+        )
+
+        algorithm = parsed_args.algorithm or CHECKSUM_ALGORITHMS[0]
+        roots = [normalise_path(p, self.context.gpath) for p in parsed_args.path]
+        if not roots:
+            roots = [self.context.gpath]
+
+        started = time.perf_counter()
+        n_bytes = 0
+        if self.context.records is None:
+            self.context.print(MANIFEST_HEADER + algorithm)
+        for root in roots:
+            paths = self.datasets_below(root)
+            tree = []
+            for d in self.digests(paths, algorithm, parsed_args):
+                n_bytes += d.n_bytes
+                tree.append((relative_name(d.path, root), d.digest))
+                self.emit(
+                    {
+                        "path": str(d.path),
+                        "digest": d.digest,
+                        "algorithm": algorithm,
+                        "bytes": d.n_bytes,
+                        "raw": d.raw,
+                    },
+                    format_manifest_line(d.digest, d.path),
+                )
+            if self.context.index.info(root).is_group:
+                digest = tree_digest(tree, algorithm)
+                tree_path = str(root).rstrip("/") + "/"
+                self.emit(
+                    {
+                        "path": tree_path,
+                        "digest": digest,
+                        "algorithm": algorithm,
+                        "n_datasets": len(tree),
+                    },
+                    format_manifest_line(digest, tree_path),
+                )
+
+        elapsed = time.perf_counter() - started
+        rate = n_bytes / elapsed / 1e6 if elapsed else float("inf")
+        self.logger.info(
+            "Hashed %s in %.2fs (%.1f MB/s)",
+            format_size(n_bytes, True),
+            elapsed,
+            rate,
+        )
+        return Signal.SUCCESS
+
+    def run_check(self, parsed_args):
+        from .checksum import read_manifest, tree_digest
+
+        with open(parsed_args.check) as f:
+            manifest_algorithm, expected = read_manifest(f)
+        algorithm = (
+            parsed_args.algorithm or manifest_algorithm or CHECKSUM_ALGORITHMS[0]
+        )
+
+        only = [normalise_path(p, self.context.gpath) for p in parsed_args.path]
+
+        def selected(path: H5Path):
+            return not only or any(path == o or o in path.parents for o in only)
+
+        index = self.context.index
+        trees = dict()
+        to_hash = dict()
+        statuses = dict()
+        for key in expected:
+            path = H5Path(key)
+            if not selected(path):
+                continue
+            is_tree = key.endswith("/")
+            try:
+                info = index.info(path)
+            except KeyError:
+                statuses[key] = "MISSING"
+                continue
+            if is_tree != info.is_group:
+                statuses[key] = "FAILED"
+            elif is_tree:
+                trees[key] = self.datasets_below(path)
+                to_hash.update(dict.fromkeys(trees[key]))
+            else:
+                to_hash[path] = None
+
+        for d in self.digests(list(to_hash), algorithm, parsed_args):
+            to_hash[d.path] = d.digest
+            key = str(d.path)
+            if key in expected and key not in statuses:
+                statuses[key] = "OK" if expected[key] == d.digest else "FAILED"
+        for key, paths in trees.items():
+            root = H5Path(key)
+            digest = tree_digest(
+                [(relative_name(p, root), to_hash[p]) for p in paths], algorithm
+            )
+            statuses[key] = "OK" if expected[key] == digest else "FAILED"
+
+        n_bad = 0
+        for key in expected:
+            if key not in statuses:
+                continue
+            status = statuses[key]
+            n_bad += status != "OK"
+            self.emit({"path": key, "status": status}, f"{key}: {status}")
+        if n_bad:
+            self.context.print(
+                f"{n_bad} of {len(statuses)} entries did not match", file=sys.stderr
+            )
+            return Signal.FAILURE
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+class Cp(Command):
+    needs_file = False
+
+    def name(self):
+        return "cp"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Copy objects, within the file or between files; "
+            "always recursive. "
+            "New objects are copied by HDF5 itself (H5Ocopy), "
+            "which copies compressed chunks without decompressing them. "
+            "Copying a dataset over an existing one of the same shape and dtype "
+            "overwrites its data: chunk by chunk, still compressed, "
+            "where both have the same chunking and filters; "
+            "otherwise decompressing and recompressing in blocks. "
+            "Paths in other files are given as FILE:PATH, where FILE exists; "
+            "the destination's file must be writable "
+            "(for the current file, open it with --mode r+ or a).",
+        )
+        parser.add_argument(
+            "source",
+            nargs="+",
+            help="'[FILE:]PATH' of the original object to copy. "
+            "Trailing slash means copy all objects from the given group, "
+            "not the group itself.",
+        )
+        parser.add_argument(
+            "dest",
+            help="'[FILE:]PATH' to copy to. "
+            "An existing group, trailing slash OR multiple sources means "
+            "copy *into* the given group, keeping original names. "
+            "Otherwise, copy to new group/dataset of the given name.",
+        )
+        parser.add_argument(
+            "-s",
+            "--shallow",
+            action="store_true",
+            help="Only copy the immediate members of groups",
+        )
+        parser.add_argument(
+            "-L",
+            "--dereference",
+            action="store_true",
+            help="Copy the objects which soft and external links point to, "
+            "rather than the links",
+        )
+        parser.add_argument(
+            "--no-attrs", action="store_true", help="Do not copy attributes"
+        )
+        parser.add_argument(
+            "-b",
+            "--block-size",
+            type=parse_size,
+            default=DEFAULT_BLOCK_BYTES,
+            help="Approximate memory to use for each block of data "
+            "where chunks cannot be copied directly, "
+            f"e.g. 256M (default {format_size(DEFAULT_BLOCK_BYTES, True)})",
+        )
+        parser.add_argument(
+            "-v", "--verbose", action="store_true", help="Show each object copied"
+        )
+        parser.add_argument(
+            "-q", "--quiet", action="store_true", help="Do not show progress"
+        )
+        return parser
+
+    def run(self, parsed_args):
+        from contextlib import ExitStack
+        from .copy import (
+            H5OCOPY,
+            copy_data,
+            copy_object,
+            copy_plist,
+            stored_bytes,
+            transfer_bytes,
+        )
+        from .export import Progress
+
+        ocpypl = copy_plist(
+            shallow=parsed_args.shallow,
+            expand_soft=parsed_args.dereference,
+            expand_external=parsed_args.dereference,
+            without_attrs=parsed_args.no_attrs,
+        )
+
+        with ExitStack() as stack:
+            files = dict()
+            dest = parsed_args.dest
+            dst_fpath, dst_file, dst_path = self.open_location(
+                dest.rstrip("/") or "/", stack, files, "a"
+            )
+            if dst_file is self.context.file and not self.context.writable:
+                self.context.print(
+                    f"File is read-only: {self.context.fpath}", file=sys.stderr
+                )
+                return Signal.FAILURE
+
+            sources = []
+            for spec in parsed_args.source:
+                fpath, f, path = self.open_location(
+                    spec.rstrip("/") or "/", stack, files
+                )
+                if spec.endswith("/") and len(spec) > 1:
+                    for name in f[str(path)]:
+                        sources.append((fpath, f, path / name))
+                else:
+                    sources.append((fpath, f, path))
+
+            into_group = (
+                len(sources) > 1
+                or dest.endswith("/")
+                or (str(dst_path) in dst_file and is_group(dst_file[str(dst_path)]))
+            )
+
+            # check every copy before making any, so that none is left half-done
+            plans = []
+            for fpath, f, path in sources:
+                target = dst_path / path.name if into_group else dst_path
+                src = f[str(path)]
+                parent = dst_file.get(str(target.parent))
+                if not is_group(parent):
+                    self.context.print(
+                        f"No such group: {dst_fpath}:{target.parent}", file=sys.stderr
+                    )
+                    return Signal.FAILURE
+                existing = dst_file.get(str(target))
+                if existing is None:
+                    plans.append((fpath, f, path, src, target, existing))
+                    continue
+                if not (is_dataset(src) and is_dataset(existing)):
+                    self.context.print(f"Already exists: {target}", file=sys.stderr)
+                    return Signal.FAILURE
+                if src.id == existing.id:
+                    self.context.print(
+                        f"Source and destination are the same object: "
+                        f"{fpath}:{path} and {dst_fpath}:{target}",
+                        file=sys.stderr,
+                    )
+                    return Signal.FAILURE
+                if src.shape != existing.shape or src.dtype != existing.dtype:
+                    self.context.print(
+                        f"Cannot copy {fpath}:{path} (shape {src.shape}, "
+                        f"dtype {src.dtype}) over {dst_fpath}:{target} "
+                        f"(shape {existing.shape}, dtype {existing.dtype})",
+                        file=sys.stderr,
+                    )
+                    return Signal.FAILURE
+                plans.append((fpath, f, path, src, target, existing))
+
+            progress = Progress(
+                0, enabled=not parsed_args.quiet and self.context.records is None
+            )
+            sizes = [0] * len(plans)
+            if progress.enabled:
+                sizes = [
+                    (
+                        stored_bytes(src)
+                        if existing is None
+                        else transfer_bytes(src, existing)
+                    )
+                    for *_, src, _, existing in plans
+                ]
+                progress.total = sum(sizes)
+
+            for (fpath, f, path, src, target, existing), size in zip(plans, sizes):
+                if existing is None:
+                    copy_object(f, str(path), dst_file, str(target), ocpypl)
+                    method = H5OCOPY
+                    progress(size)
+                else:
+                    method = copy_data(src, existing, parsed_args.block_size, progress)
+                self.emit(
+                    {
+                        "source": f"{fpath}:{path}",
+                        "dest": f"{dst_fpath}:{target}",
+                        "method": method,
+                    },
+                    (
+                        f"{fpath}:{path} -> {dst_fpath}:{target} ({method})"
+                        if parsed_args.verbose
+                        else None
+                    ),
+                )
+            progress.finish()
+        return Signal.SUCCESS
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+def parse_chunks(s: str):
+    """Parse a chunk shape like ``100x100``; 'auto' lets HDF5 choose one,
+    and 'none' means contiguous.
+    """
+    if s == "auto":
+        return True
+    if s in ("none", "contiguous"):
+        return None
+    try:
+        return tuple(int(c) for c in s.replace(",", "x").split("x"))
+    except ValueError:
+        raise ValueError(f"Not a valid chunk shape: '{s}'")
+
+
+def parse_optional(s: str):
+    """Parse a setting which can be 'none', a number, or a string"""
+    if s == "none":
+        return None
+    from ast import literal_eval
+
+    try:
+        return literal_eval(s)
+    except (ValueError, SyntaxError):
+        return s
+
+
+class Rechunk(Command):
+    needs_file = False
+
+    def name(self):
+        return "rechunk"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Rewrite a dataset, or every dataset below a group, "
+            "with new storage settings: those reported by the "
+            "chunks, compression, compression_opts, shuffle, scaleoffset "
+            "and fletcher32 commands. "
+            "Settings which are not given are kept. "
+            "Data is read in blocks aligned to both the old and new chunks "
+            "where they fit in the memory budget, so that each chunk is read once. "
+            "With --jobs, where the new filters are only shuffle and gzip, "
+            "chunks are compressed in a pool of processes "
+            "and written in order as raw chunks. "
+            "Datasets are replaced in place, unless --output is given; "
+            "datasets with several hard links, dimension scales "
+            "and datasets with scales attached can only be written elsewhere, "
+            "and other references to replaced datasets are not updated.",
+        )
+        parser.add_argument(
+            "path", help="'[FILE:]PATH' of a dataset, or a group to rewrite below"
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="'[FILE:]PATH' to write to, which must not exist, "
+            "instead of replacing in place; "
+            "for a group, its hierarchy and attributes are copied there too",
+        )
+        parser.add_argument(
+            "--chunks",
+            type=parse_chunks,
+            help="Chunk shape like 100x100, clipped to each dataset's maximum shape; "
+            "'auto' to let HDF5 choose; 'none' for contiguous storage",
+        )
+        parser.add_argument(
+            "--compression",
+            help="Compression filter: gzip, lzf, szip, a filter number, or 'none'",
+        )
+        parser.add_argument(
+            "--compression-opts",
+            help="Options for the compression filter, e.g. gzip level; "
+            "by default, the filter's own default if --compression is given",
+        )
+        parser.add_argument(
+            "--shuffle", action="store_const", const=True, help="Use the shuffle filter"
+        )
+        parser.add_argument(
+            "--no-shuffle", dest="shuffle", action="store_const", const=False
+        )
+        parser.add_argument(
+            "--scaleoffset",
+            help="Scale-offset filter setting, or 'none'",
+        )
+        parser.add_argument(
+            "--fletcher32",
+            action="store_const",
+            const=True,
+            help="Use the fletcher32 checksum filter",
+        )
+        parser.add_argument(
+            "--no-fletcher32", dest="fletcher32", action="store_const", const=False
+        )
+        parser.add_argument(
+            "-b",
+            "--block-size",
+            type=parse_size,
+            default=DEFAULT_BLOCK_BYTES,
+            help="Approximate memory to use for each block of data, e.g. 256M "
+            f"(default {format_size(DEFAULT_BLOCK_BYTES, True)})",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=1,
+            help="Number of processes to compress chunks with; "
+            "0 means one per CPU (default 1)",
+        )
+        parser.add_argument(
+            "-n",
+            "--dry-run",
+            action="store_true",
+            help="Write nothing; estimate each dataset's new size "
+            "(by compressing a sample of its new chunks) and read amplification",
+        )
+        parser.add_argument(
+            "-q", "--quiet", action="store_true", help="Do not show progress"
+        )
+        return parser
+
+    def changes(self, parsed_args) -> dict:
+        changes = dict()
+        for name in ("chunks", "shuffle", "fletcher32"):
+            value = getattr(parsed_args, name)
+            if value is not None:
+                changes[name] = value
+        for name in ("compression", "compression_opts", "scaleoffset"):
+            value = getattr(parsed_args, name)
+            if value is not None:
+                changes[name] = parse_optional(value)
+        if "compression" in changes and "compression_opts" not in changes:
+            changes["compression_opts"] = None
+        return changes
+
+    def plan(self, f, root, index):
+        """Datasets to rewrite, as (source path, relative name),
+        and (path, reason) for those which are skipped.
+        """
+        datasets = []
+        skipped = []
+        for path, info in index.walk(root):
+            if not info.is_dataset:
+                continue
+            name = relative_name(path, root)
+            ds = f[str(path)]
+            if not ds.shape:
+                skipped.append((path, "scalar or empty"))
+            elif 0 in ds.maxshape:
+                # can never hold any data, and cannot be chunked
+                skipped.append((path, "fixed at zero length"))
+            elif ds.is_virtual:
+                skipped.append((path, "virtual"))
+            else:
+                datasets.append((path, name))
+        return datasets, skipped
+
+    def run(self, parsed_args):
+        from contextlib import ExitStack
+        from .export import Progress
+        from .rechunk import resolve_layout
+
+        changes = self.changes(parsed_args)
+        jobs = parsed_args.jobs or os.cpu_count() or 1
+        if jobs > 1:
+            self.context.prepare_workers()
+        output = parsed_args.output
+        in_place = output is None and not parsed_args.dry_run
+
+        with ExitStack() as stack:
+            files = dict()
+            if output is not None:
+                _, dst_file, dst_root = self.open_location(output, stack, files, "a")
+            _, src_file, root = self.open_location(
+                parsed_args.path, stack, files, "a" if in_place else "r"
+            )
+            if output is None:
+                dst_file, dst_root = src_file, root
+            if (
+                not parsed_args.dry_run
+                and dst_file is self.context.file
+                and not self.context.writable
+            ):
+                self.context.print(
+                    f"File is read-only: {self.context.fpath}", file=sys.stderr
+                )
+                return Signal.FAILURE
+            if output is not None and str(dst_root) in dst_file:
+                self.context.print(f"Already exists: {dst_root}", file=sys.stderr)
+                return Signal.FAILURE
+
+            index = self.location_index(src_file)
+            datasets, skipped = self.plan(src_file, root, index)
+            for path, reason in skipped:
+                self.context.print(f"Skipping {path}: {reason}", file=sys.stderr)
+
+            layouts = dict()
+            for path, _ in datasets:
+                try:
+                    layouts[path] = resolve_layout(src_file[str(path)], changes)
+                except (ValueError, TypeError) as e:
+                    self.context.print(f"{path}: {e}", file=sys.stderr)
+                    return Signal.FAILURE
+
+            if parsed_args.dry_run:
+                return self.run_dry(src_file, datasets, layouts, parsed_args)
+
+            if output is not None and index.info(root).is_group:
+                self.copy_hierarchy(src_file, root, index, dst_file, dst_root)
+
+            progress = Progress(
+                sum(src_file[str(p)].nbytes for p, _ in datasets),
+                enabled=not parsed_args.quiet and self.context.records is None,
+            )
+            n_failed = 0
+            try:
+                for path, name in datasets:
+                    dst_path = dst_root if name == "." else dst_root / name
+                    ok = self.rewrite(
+                        src_file[str(path)],
+                        dst_file,
+                        dst_path,
+                        layouts[path],
+                        in_place,
+                        jobs,
+                        parsed_args.block_size,
+                        progress,
+                    )
+                    n_failed += not ok
+            except BaseException:
+                # don't leave a partial copy behind
+                if output is not None and str(dst_root) in dst_file:
+                    del dst_file[str(dst_root)]
+                raise
+            progress.finish()
+        return Signal.FAILURE if n_failed else Signal.SUCCESS
+
+    def rewrite(
+        self, src, dst_file, dst_path, layout, in_place, jobs, block_bytes, progress
+    ) -> bool:
+        from .rechunk import (
+            create_like,
+            dataset_layout,
+            describe_layout,
+            hard_link_count,
+            read_block_shape,
+            replace_dataset,
+            rewrite_data,
+            uses_dimension_scales,
+        )
+
+        before = dataset_layout(src)
+        n_before = src.id.get_storage_size()
+        block = read_block_shape(
+            src.shape, src.chunks, layout.chunks, src.dtype.itemsize, block_bytes
+        )
+        if in_place:
+            reason = None
+            if hard_link_count(src) > 1:
+                reason = "has several hard links"
+            elif uses_dimension_scales(src):
+                reason = "is or has a dimension scale"
+            if reason is not None:
+                self.context.print(
+                    f"Skipping {src.name}: {reason}; use --output", file=sys.stderr
+                )
+                return False
+            dst = replace_dataset(src, layout, block, jobs, progress)
+        else:
+            parent = dst_file.require_group(str(dst_path.parent))
+            dst = create_like(parent, dst_path.name, src, layout)
+            rewrite_data(src, dst, block, jobs, progress)
+        n_after = dst.id.get_storage_size()
+        self.emit(
+            {
+                "path": str(dst_path),
+                "before": describe_layout(before),
+                "after": describe_layout(layout),
+                "bytes_before": n_before,
+                "bytes_after": n_after,
+            },
+            f"{dst_path}: {describe_layout(before)} -> {describe_layout(layout)}; "
+            f"{format_size(n_before, True)} -> {format_size(n_after, True)}",
+        )
+        return True
+
+    def run_dry(self, f, datasets, layouts, parsed_args):
+        from .rechunk import dataset_layout, describe_layout, estimate
+
+        for path, _ in datasets:
+            src = f[str(path)]
+            layout = layouts[path]
+            est = estimate(src, layout, parsed_args.block_size)
+            before = describe_layout(dataset_layout(src))
+            after = describe_layout(layout)
+            self.emit(
+                {
+                    "path": str(path),
+                    "before": before,
+                    "after": after,
+                    "bytes_before": est.current,
+                    "estimated_bytes_after": est.estimated,
+                    "block": list(est.block),
+                    "read_amplification": est.read_amplification,
+                },
+                f"{path}: {before} -> {after}; "
+                f"{format_size(est.current, True)} -> "
+                f"~{format_size(est.estimated, True)}; "
+                f"blocks of {'x'.join(str(b) for b in est.block)}, "
+                f"read amplification {est.read_amplification:.2f}",
+            )
+        return Signal.SUCCESS
+
+    def copy_hierarchy(self, src_file, root, index, dst_file, dst_root):
+        """Recreate groups, links, named datatypes and attributes below ``root``
+        at ``dst_root``, without datasets.
+        """
+        from h5py import ExternalLink, SoftLink
+        from .copy import copy_object
+        from .index import NodeKind
+        from .rechunk import copy_attrs
+
+        for path, info in index.walk(root):
+            name = relative_name(path, root)
+            dst_path = dst_root if name == "." else dst_root / name
+            if info.is_group:
+                copy_attrs(src_file[str(path)], dst_file.require_group(str(dst_path)))
+            elif info.kind == NodeKind.SOFT_LINK:
+                dst_file[str(dst_path)] = SoftLink(info.target)
+            elif info.kind == NodeKind.EXTERNAL_LINK:
+                fname, _, target = info.target.partition(":")
+                dst_file[str(dst_path)] = ExternalLink(fname, target)
+            elif info.kind == NodeKind.DATATYPE:
+                copy_object(src_file, str(path), dst_file, str(dst_path))
+
+    def completer(self):
+        return path_completer(self.context)
+
+
+class Cache(Command):
+    def name(self):
+        return "cache"
+
+    def argument_parser(self):
+        from .access import add_access_arguments
+
+        parser = ArgumentParser(
+            self.name(),
+            description="Show or change how HDF5 reads the file: "
+            "the raw data chunk cache, page buffer, driver and format version bounds, "
+            "with the cache statistics HDF5 reports "
+            "(it has none for the chunk cache). "
+            "Changing settings reopens the file. "
+            "Settings can also be given when starting hcl.",
+        )
+        add_access_arguments(parser)
+        parser.add_argument(
+            "--defaults",
+            action="store_true",
+            help="Forget settings which are not given, and use HDF5's defaults",
+        )
+        parser.add_argument(
+            "--reset-stats", action="store_true", help="Reset the statistics shown"
+        )
+        return parser
+
+    def run(self, parsed_args):
+        from .access import (
+            AccessSettings,
+            cache_stats,
+            current_settings,
+            reset_stats,
+            settings_from_args,
+        )
+
+        base = AccessSettings() if parsed_args.defaults else self.context.access
+        access = settings_from_args(parsed_args, base)
+        if access != self.context.access:
+            try:
+                self.context.reopen(access)
+            except Exception as e:
+                self.context.print(
+                    f"Could not reopen file with {access.file_kwargs()}: {e}",
+                    file=sys.stderr,
+                )
+                return Signal.FAILURE
+        f = self.context.file
+        if parsed_args.reset_stats:
+            reset_stats(f)
+
+        settings = current_settings(f)
+        stats = cache_stats(f)
+        if self.context.records is not None:
+            self.emit({**settings, **stats})
+            return Signal.SUCCESS
+
+        rows = [
+            ("driver", settings["driver"]),
+            ("libver", ", ".join(settings["libver"])),
+            ("rdcc_nbytes", format_size(settings["rdcc_nbytes"], True)),
+            ("rdcc_nslots", settings["rdcc_nslots"]),
+            ("rdcc_w0", settings["rdcc_w0"]),
+            (
+                "page_buf_size",
+                (
+                    format_size(settings["page_buf_size"], True)
+                    if settings["page_buf_size"]
+                    else "off"
+                ),
+            ),
+        ]
+        mdc = stats["metadata_cache"]
+        rows.append(
+            (
+                "metadata cache",
+                f"{mdc['entries']} entries, {format_size(mdc['size'], True)} "
+                f"of {format_size(mdc['max_size'], True)}; "
+                f"hit rate {mdc['hit_rate']:.2f}",
+            )
+        )
+        for kind, s in stats.get("page_buffer", {}).items():
+            rows.append(
+                (
+                    f"page buffer ({kind})",
+                    f"{s['hits']} hits of {s['accesses']} accesses, "
+                    f"{s['evictions']} evictions",
+                )
+            )
+        width = max(len(name) for name, _ in rows)
+        for name, value in rows:
+            self.context.print(f"{name:<{width}}  {value}")
+        return Signal.SUCCESS
+
+
+class Time(Command):
+    needs_file = False
+    profiled = False
+
+    def name(self):
+        return "time"
+
+    def argument_parser(self):
+        parser = ArgumentParser(
+            self.name(),
+            description="Run a command, then report to stderr its wall and CPU time, "
+            "bytes read by the process from any file (its rchar, "
+            "including from the OS page cache), HDF5 objects opened by the command, "
+            "and time spent writing output. "
+            "To measure every command, start hcl with --profile.",
+        )
+        parser.add_argument(
+            "command", nargs=REMAINDER, help="Command to run, with its arguments"
+        )
+        return parser
+
+    def run(self, parsed_args):
+        if not parsed_args.command:
+            self.context.print("No command given", file=sys.stderr)
+            return Signal.FAILURE
+        name, *argv = parsed_args.command
+        try:
+            cmd = self.context.commands[name]
+        except KeyError:
+            self.context.print(f"Not a known command: {name}", file=sys.stderr)
+            return Signal.FAILURE
+
+        session = self.context.profiler
+        if session is not None:
+            # already measured
+            return cmd(argv)
+        from .profiling import Profiler
+
+        self.context.profiler = Profiler()
+        try:
+            return cmd(argv)
+        finally:
+            self.context.profiler = None
+
+    def completer(self):
+        from prompt_toolkit.completion import NestedCompleter
+
+        return NestedCompleter(
+            {
+                name: c.completer()
+                for name, c in self.context.commands.items()
+                if c is not self
+            }
+        )
 
 
 all_commands = [
@@ -514,5 +2778,17 @@ all_commands = [
     IsVirtual,
     Help,
     Tree,
-    # Cp,
+    Find,
+    Du,
+    Chunkinfo,
+    Stats,
+    Slice,
+    Head,
+    Export,
+    Checksum,
+    Diff,
+    Cp,
+    Rechunk,
+    Cache,
+    Time,
 ]
@@ -0,0 +1,144 @@
+"""
+Tab completion for the interactive prompt.
+"""
+import shlex
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from prompt_toolkit.completion import Completion, Completer, ThreadedCompleter
+from prompt_toolkit.document import Document
+
+from .utils import H5Path, normalise_path
+
+if TYPE_CHECKING:
+    from .index import NodeInfo
+
+
+class H5PathCompleter(Completer):
+    """
+    Complete for Path variables.
+    :param get_paths: Callable which returns a list of directories to look into
+                      when the user enters a relative path.
+    :param file_filter: Callable which takes a filename and returns whether
+                        this file should show up in the completion. ``None``
+                        when no filtering has to be done.
+    :param min_input_len: Don't do autocompletion when the input string is shorter.
+    """
+
+    def __init__(
+        self,
+        context,
+        include_groups: bool = True,
+        include_datasets: bool = True,
+    ) -> None:
+        self.context = context
+        self.include_groups = include_groups
+        self.include_datasets = include_datasets
+
+    @property
+    def gpath(self):
+        return self.context.gpath
+
+    @property
+    def group(self):
+        return self.context.group
+
+    def members(self, path: H5Path) -> Optional[Dict[str, "NodeInfo"]]:
+        """Members of the group at the given path, or None.
+
+        In an interactive session, these come from memory or the session's
+        Prefetcher, waiting at most its latency budget,
+        so that typing never blocks on reading the file.
+        """
+        prefetcher = getattr(self.context, "prefetcher", None)
+        if prefetcher is not None:
+            return prefetcher.wait(path)
+        try:
+            return self.context.index.members(path)
+        except (KeyError, ValueError):
+            return None
+
+    def get_completions(self, document, complete_event) -> Iterable[Completion]:
+        text = document.text_before_cursor
+
+        curr_path = H5Path(text)
+        if text.endswith("/"):
+            parent = curr_path
+            prefix = ""
+        else:
+            parent = curr_path.parent
+            prefix = curr_path.name
+
+        if self.context.index is None:
+            return
+        members = self.members(normalise_path(parent, self.gpath))
+        if members is None:
+            return
+
+        for name, info in members.items():
+            if not name.startswith(prefix):
+                continue
+
+            # links are offered without resolving them, as they may point to groups
+            if (self.include_groups and (info.is_group or info.is_link)) or (
+                self.include_datasets and info.is_dataset
+            ):
+                yield Completion(name[len(prefix) :], 0, display=name)
+
+
+def path_completer(
+    context, include_groups=True, include_datasets=True, threaded=True
+) -> Completer:
+    completer = H5PathCompleter(context, include_groups, include_datasets)
+    if threaded:
+        return ThreadedCompleter(completer)
+    return completer
+
+
+class H5AttrCompleter(Completer):
+    """
+    Complete an object path as the first argument,
+    then the names of that object's attributes as any later arguments.
+
+    Options (words starting with '-') are skipped.
+    Names come from the index's per-object cache of attribute names,
+    so are only read from the file once per object.
+    """
+
+    def __init__(self, context) -> None:
+        self.context = context
+        self.paths = H5PathCompleter(context)
+
+    def get_completions(self, document, complete_event) -> Iterable[Completion]:
+        text = document.text_before_cursor
+        words = text.split()
+        current = ""
+        if words and not text[-1].isspace():
+            current = words.pop()
+        if current.startswith("-"):
+            return
+        args = [w for w in words if not w.startswith("-")]
+        if not args:
+            yield from self.paths.get_completions(Document(current), complete_event)
+            return
+
+        index = self.context.index
+        if index is None:
+            return
+        try:
+            names = index.attr_names(
+                normalise_path(H5Path(args[0]), self.context.gpath)
+            )
+        except (KeyError, ValueError):
+            return
+
+        given = set(args[1:])
+        for name in names:
+            if name.startswith(current) and name not in given:
+                yield Completion(shlex.quote(name), -len(current), display=name)
+
+
+def attr_completer(context, threaded=True) -> Completer:
+    completer = H5AttrCompleter(context)
+    if threaded:
+        return ThreadedCompleter(completer)
+    return completer
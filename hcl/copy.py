@@ -0,0 +1,144 @@
+"""
+Copying objects within and between files.
+
+New objects are copied with ``H5Ocopy``, which moves chunks' stored bytes
+without decompressing them wherever the filters and dtype allow.
+Data copied over an existing dataset is transferred chunk by chunk
+with ``read_direct_chunk``/``write_direct_chunk`` where both datasets have the same
+chunking and filters, and otherwise decompressed and rewritten in blocks.
+"""
+from typing import Callable, Optional, Set, Tuple
+
+from h5py import Dataset, Group, h5o, h5p, h5t
+
+from .blocks import block_shape, iter_blocks
+from .chunks import same_raw_layout, visit_chunks
+from .diff import values_equal
+from .utils import DEFAULT_BLOCK_BYTES
+
+#: How an object's data was copied
+H5OCOPY = "h5ocopy"
+RAW_CHUNKS = "raw chunks"
+BLOCKS = "blocks"
+
+
+def copy_plist(
+    shallow=False, expand_soft=False, expand_external=False, without_attrs=False
+):
+    """Object copy property list for ``H5Ocopy``"""
+    flags = 0
+    if shallow:
+        flags |= h5o.COPY_SHALLOW_HIERARCHY_FLAG
+    if expand_soft:
+        flags |= h5o.COPY_EXPAND_SOFT_LINK_FLAG
+    if expand_external:
+        flags |= h5o.COPY_EXPAND_EXT_LINK_FLAG
+    if without_attrs:
+        flags |= h5o.COPY_WITHOUT_ATTR_FLAG
+    ocpypl = h5p.create(h5p.OBJECT_COPY)
+    ocpypl.set_copy_object(flags)
+    return ocpypl
+
+
+def copy_object(src: Group, src_name: str, dst: Group, dst_name: str, ocpypl=None):
+    """Copy the object at ``src_name`` below ``src`` to ``dst_name`` below ``dst``,
+    which may be in another file.
+    """
+    lcpl = h5p.create(h5p.LINK_CREATE)
+    lcpl.set_char_encoding(h5t.CSET_UTF8)
+    h5o.copy(
+        src.id,
+        src_name.encode("utf-8"),
+        dst.id,
+        dst_name.encode("utf-8"),
+        ocpypl,
+        lcpl,
+    )
+
+
+def stored_bytes(obj) -> int:
+    """Bytes allocated for the data of a dataset, or all datasets below a group"""
+    if isinstance(obj, Dataset):
+        return obj.id.get_storage_size()
+    if not isinstance(obj, Group):
+        return 0
+    total = 0
+
+    def fn(_name, member):
+        nonlocal total
+        if isinstance(member, Dataset):
+            total += member.id.get_storage_size()
+
+    obj.visititems(fn)
+    return total
+
+
+def transfer_bytes(src: Dataset, dst: Dataset) -> int:
+    """Bytes which ``copy_data`` will move: stored bytes if chunks are copied raw,
+    otherwise the size of the data.
+    """
+    if same_raw_layout(src, dst):
+        return src.id.get_storage_size()
+    if src.shape is None:
+        return 0
+    return src.size * src.dtype.itemsize
+
+
+def _chunk_offsets(dataset: Dataset) -> Set[Tuple[int, ...]]:
+    out = set()
+    visit_chunks(dataset.id, lambda info: out.add(info.chunk_offset))
+    return out
+
+
+def copy_data(
+    src: Dataset,
+    dst: Dataset,
+    block_bytes=DEFAULT_BLOCK_BYTES,
+    progress: Optional[Callable[[int], None]] = None,
+) -> str:
+    """Overwrite the values of ``dst`` with those of ``src``,
+    which must have the same shape and dtype.
+
+    Chunks which are not allocated in ``src`` end up holding its fill value.
+
+    :param progress: Called with the number of bytes moved after each piece.
+    :return: RAW_CHUNKS or BLOCKS
+    """
+    if src.shape != dst.shape or src.dtype != dst.dtype:
+        raise ValueError(
+            f"Cannot copy data of shape {src.shape} and dtype {src.dtype} "
+            f"into shape {dst.shape} and dtype {dst.dtype}"
+        )
+    if progress is None:
+        progress = _ignore
+
+    if same_raw_layout(src, dst):
+        src_offsets = _chunk_offsets(src)
+        dst_offsets = _chunk_offsets(dst)
+        same_fill = values_equal(src.fillvalue, dst.fillvalue)
+        for block in iter_blocks(src.shape, src.chunks):
+            offset = tuple(sl.start for sl in block)
+            if offset in src_offsets:
+                filter_mask, data = src.id.read_direct_chunk(offset)
+                dst.id.write_direct_chunk(offset, data, filter_mask)
+                progress(len(data))
+            elif offset in dst_offsets or not same_fill:
+                dst[block] = src.fillvalue
+        return RAW_CHUNKS
+
+    if src.shape is None:
+        return BLOCKS
+    if not src.shape:
+        dst[()] = src[()]
+        progress(src.dtype.itemsize)
+        return BLOCKS
+    block = block_shape(src.shape, dst.chunks, src.dtype.itemsize, block_bytes)
+    for sl in iter_blocks(src.shape, block):
+        arr = src[sl]
+        dst[sl] = arr
+        progress(arr.size * src.dtype.itemsize)
+    return BLOCKS
+
+
+def _ignore(_n_bytes: int):
+    pass
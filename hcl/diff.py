@@ -0,0 +1,309 @@
+"""
+Comparison of two groups or datasets, possibly in different files.
+
+Cheap checks come first: structure, kinds, link targets, attributes,
+then each dataset's shape and dtype, all from metadata.
+Data is then compared chunk by chunk: where both datasets have the same chunking
+and filters, chunks whose stored bytes are identical are equal without decompressing;
+anything else is decompressed and compared, within a tolerance for floats.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from h5py import Dataset, File
+import numpy as np
+
+from .blocks import Block, block_shape, iter_blocks
+from .chunks import same_raw_layout, visit_chunks
+from .index import HierarchyIndex, NodeInfo
+from .utils import DEFAULT_BLOCK_BYTES, H5Path, relative_name
+
+#: Kinds of Difference
+ONLY_FIRST = "only in first"
+ONLY_SECOND = "only in second"
+KIND = "kind"
+LINK = "link"
+ATTRS = "attributes"
+SHAPE = "shape"
+DTYPE = "dtype"
+DATA = "data"
+
+#: (start, stop) along each axis
+Region = Tuple[Tuple[int, int], ...]
+
+
+class Difference(NamedTuple):
+    #: path relative to the roots being compared
+    path: str
+    kind: str
+    detail: str = ""
+    region: Optional[Region] = None
+
+
+class DataOptions(NamedTuple):
+    rtol: float = 0.0
+    atol: float = 0.0
+    block_bytes: int = DEFAULT_BLOCK_BYTES
+    #: stop comparing a dataset after finding this many differing regions
+    max_regions: Optional[int] = None
+
+
+def format_region(region: Region) -> str:
+    if not region:
+        return "[()]"
+    return "[" + ", ".join(f"{start}:{stop}" for start, stop in region) + "]"
+
+
+def values_equal(a, b) -> bool:
+    """Whether two attribute values are equal, treating NaNs as equal"""
+    try:
+        return bool(np.array_equal(a, b, equal_nan=True))
+    except TypeError:
+        # equal_nan is not supported for non-numeric dtypes
+        pass
+    try:
+        return bool(np.array_equal(a, b))
+    except Exception:
+        return False
+
+
+def differing(a: np.ndarray, b: np.ndarray, rtol=0.0, atol=0.0) -> np.ndarray:
+    """Boolean mask of elements which differ; NaNs equal each other,
+    and floats within ``atol + rtol * abs(b)`` are equal.
+    """
+    if a.dtype.kind in "fc" and b.dtype.kind in "fc":
+        return ~np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True)
+    return np.asarray(a != b, dtype=bool).reshape(a.shape)
+
+
+def _bounding_region(mask: np.ndarray, block: Block) -> Region:
+    if not block:
+        return ()
+    indices = np.nonzero(mask)
+    return tuple(
+        (sl.start + int(idx.min()), sl.start + int(idx.max()) + 1)
+        for sl, idx in zip(block, indices)
+    )
+
+
+def _chunk_map(dataset: Dataset) -> Dict[Tuple[int, ...], Tuple[int, int]]:
+    """(filter mask, size) of each allocated chunk, by chunk offset"""
+    out = dict()
+
+    def fn(info):
+        out[info.chunk_offset] = (info.filter_mask, info.size)
+
+    visit_chunks(dataset.id, fn)
+    return out
+
+
+def _raw_equal(a: Dataset, b: Dataset, offset, info_a, info_b) -> bool:
+    if info_a is None and info_b is None:
+        return values_equal(a.fillvalue, b.fillvalue)
+    if info_a is None or info_b is None or info_a != info_b:
+        return False
+    return a.id.read_direct_chunk(offset) == b.id.read_direct_chunk(offset)
+
+
+def iter_candidate_blocks(
+    a: Dataset, b: Dataset, options: DataOptions
+) -> Iterator[Block]:
+    """Blocks of two same-shaped datasets which might differ.
+
+    With the same chunking and filters, these are the chunks whose
+    stored bytes differ; otherwise, every block.
+    """
+    shape = a.shape
+    if not shape:
+        yield ()
+        return
+    if same_raw_layout(a, b):
+        chunks_a = _chunk_map(a)
+        chunks_b = _chunk_map(b)
+        for block in iter_blocks(shape, a.chunks):
+            offset = tuple(sl.start for sl in block)
+            if not _raw_equal(a, b, offset, chunks_a.get(offset), chunks_b.get(offset)):
+                yield block
+        return
+    block = block_shape(shape, a.chunks, a.dtype.itemsize, options.block_bytes)
+    yield from iter_blocks(shape, block)
+
+
+def compare_data(a: Dataset, b: Dataset, options: DataOptions) -> Iterator[Region]:
+    """Bounding region of the differing elements in each differing block
+    of two datasets with the same shape.
+    """
+    if a.shape is None or a.size == 0:
+        return
+    n_found = 0
+    for block in iter_candidate_blocks(a, b, options):
+        mask = differing(
+            np.asarray(a[block]), np.asarray(b[block]), options.rtol, options.atol
+        )
+        if not mask.any():
+            continue
+        yield _bounding_region(mask, block)
+        n_found += 1
+        if options.max_regions is not None and n_found >= options.max_regions:
+            return
+
+
+def compare_datasets(
+    a: Dataset, b: Dataset, name: str, options: DataOptions
+) -> List[Difference]:
+    return [
+        Difference(name, DATA, format_region(region), region)
+        for region in compare_data(a, b, options)
+    ]
+
+
+def _compare_worker(
+    fpath_a, path_a, fpath_b, path_b, name, options
+) -> List[Difference]:
+    with File(fpath_a, "r") as fa, File(fpath_b, "r") as fb:
+        return compare_datasets(fa[str(path_a)], fb[str(path_b)], name, options)
+
+
+class DataPair(NamedTuple):
+    name: str
+    path_a: H5Path
+    path_b: H5Path
+
+
+def _describe_kind(info: NodeInfo) -> str:
+    return info.kind.value
+
+
+def compare_structure(
+    index_a: HierarchyIndex,
+    root_a: H5Path,
+    index_b: HierarchyIndex,
+    root_b: H5Path,
+    attrs=True,
+    pairs: Optional[List[DataPair]] = None,
+) -> Iterator[Difference]:
+    """Differences in hierarchy, links, attributes, shapes and dtypes,
+    from metadata only, in pre-order.
+
+    Datasets with matching shape and dtype are appended to ``pairs``,
+    for their data to be compared afterwards.
+    Pairs of objects reached by several hard links are only compared once;
+    soft and external links are compared by target, not followed.
+    """
+    root_a = H5Path(root_a)
+    root_b = H5Path(root_b)
+    seen = set()
+    stack = [(root_a, index_a.info(root_a), root_b, index_b.info(root_b))]
+    while stack:
+        pa, ia, pb, ib = stack.pop()
+        name = relative_name(pa, root_a)
+        if ia.kind is not ib.kind:
+            yield Difference(
+                name, KIND, f"{_describe_kind(ia)} != {_describe_kind(ib)}"
+            )
+            continue
+        if ia.is_link:
+            if ia.target != ib.target:
+                yield Difference(name, LINK, f"{ia.target} != {ib.target}")
+            continue
+        if (ia.object_id, ib.object_id) in seen:
+            continue
+        seen.add((ia.object_id, ib.object_id))
+
+        if attrs:
+            yield from _compare_attrs(index_a, pa, index_b, pb, name)
+
+        if ia.is_dataset:
+            if ia.shape != ib.shape:
+                yield Difference(name, SHAPE, f"{_dims(ia.shape)} != {_dims(ib.shape)}")
+            elif ia.dtype != ib.dtype:
+                yield Difference(name, DTYPE, f"{ia.dtype} != {ib.dtype}")
+            elif pairs is not None:
+                pairs.append(DataPair(name, pa, pb))
+            continue
+        if not ia.is_group:
+            continue
+
+        members_a = index_a.members(pa)
+        members_b = index_b.members(pb)
+        children = []
+        for member in sorted(set(members_a) | set(members_b)):
+            if member not in members_b:
+                yield Difference(relative_name(pa / member, root_a), ONLY_FIRST)
+            elif member not in members_a:
+                yield Difference(relative_name(pb / member, root_b), ONLY_SECOND)
+            else:
+                children.append(
+                    (pa / member, members_a[member], pb / member, members_b[member])
+                )
+        stack.extend(reversed(children))
+
+
+def _dims(shape) -> str:
+    if shape is None:
+        return "empty"
+    return "x".join(str(d) for d in shape) or "scalar"
+
+
+def _compare_attrs(index_a, pa, index_b, pb, name) -> Iterator[Difference]:
+    names_a = index_a.attr_names(pa)
+    names_b = index_b.attr_names(pb)
+    set_b = set(names_b)
+    common = []
+    for attr in names_a:
+        if attr in set_b:
+            common.append(attr)
+        else:
+            yield Difference(name, ATTRS, f"'{attr}' only in first")
+    set_a = set(names_a)
+    for attr in names_b:
+        if attr not in set_a:
+            yield Difference(name, ATTRS, f"'{attr}' only in second")
+    values_b = index_b.iter_attrs(pb, common)
+    for (attr, va), (_, vb) in zip(index_a.iter_attrs(pa, common), values_b):
+        if not values_equal(va, vb):
+            yield Difference(name, ATTRS, f"'{attr}' differs")
+
+
+def iter_data_differences(
+    pairs: List[DataPair],
+    file_a: File,
+    file_b: File,
+    options: DataOptions,
+    jobs=1,
+    fpaths: Optional[Tuple[os.PathLike, os.PathLike]] = None,
+) -> Iterator[Difference]:
+    """Data differences of each pair of datasets, in order.
+
+    :param jobs: If more than 1, compare datasets in this many processes,
+        each of which opens the files at ``fpaths`` read-only.
+    """
+    if jobs <= 1 or len(pairs) <= 1:
+        for pair in pairs:
+            yield from compare_datasets(
+                file_a[str(pair.path_a)], file_b[str(pair.path_b)], pair.name, options
+            )
+        return
+
+    fpath_a, fpath_b = fpaths
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [
+            pool.submit(
+                _compare_worker,
+                fpath_a,
+                pair.path_a,
+                fpath_b,
+                pair.path_b,
+                pair.name,
+                options,
+            )
+            for pair in pairs
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            # e.g. if the caller stops at the first difference
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,224 @@
+"""
+Streaming export of datasets to other formats, with bounded memory.
+"""
+from queue import Queue
+import sys
+from threading import Thread
+import time
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .blocks import DEFAULT_BLOCK_BYTES, Block, block_shape, block_size, iter_blocks
+from .selection import Selection, selection_shape
+
+
+def source_selection(selection: Selection, out_block: Block) -> Selection:
+    """Map a block of the output array back to a selection of the dataset"""
+    out_block = list(out_block)
+    src = []
+    for idx in selection:
+        if isinstance(idx, slice):
+            o = out_block.pop(0)
+            start = idx.start + o.start * idx.step
+            src.append(slice(start, start + (o.stop - o.start) * idx.step, idx.step))
+        else:
+            src.append(idx)
+    return tuple(src)
+
+
+def output_chunks(dataset, selection: Selection) -> Optional[Tuple[int, ...]]:
+    """The dataset's chunk shape, in terms of elements of the selection"""
+    if dataset.chunks is None:
+        return None
+    return tuple(
+        max(1, c // idx.step)
+        for idx, c in zip(selection, dataset.chunks)
+        if isinstance(idx, slice)
+    )
+
+
+def row_block_shape(shape: Tuple[int, ...], itemsize: int, max_bytes: int):
+    """Largest block of whole rows (along the first axis) which fits in ``max_bytes``"""
+    return block_shape(shape, (1,) + tuple(shape[1:]), itemsize, max_bytes)
+
+
+class Progress:
+    """
+    Report bytes written to a terminal, at most every ``interval`` seconds.
+
+    Does nothing if the output is not a terminal, or if not ``enabled``.
+    """
+
+    def __init__(self, total: int, file=sys.stderr, interval=0.5, enabled=True):
+        self.total = total
+        self.done = 0
+        self.file = file
+        self.interval = interval
+        self.enabled = enabled and file.isatty()
+        self.started = time.perf_counter()
+        self._last = 0.0
+
+    def __call__(self, n_bytes: int):
+        self.done += n_bytes
+        now = time.perf_counter()
+        if self.enabled and (
+            now - self._last > self.interval or self.done == self.total
+        ):
+            self._last = now
+            pct = 100 * self.done / self.total if self.total else 100
+            rate = self.done / (now - self.started) / 1e6 if now > self.started else 0
+            self.file.write(f"\r{pct:5.1f}% ({rate:.1f} MB/s)")
+            self.file.flush()
+
+    def finish(self):
+        if self.enabled:
+            self.file.write("\n")
+            self.file.flush()
+
+
+def export_npy(
+    dataset,
+    selection: Selection,
+    fpath,
+    max_bytes: int = DEFAULT_BLOCK_BYTES,
+    progress: Callable[[int], None] = lambda n: None,
+):
+    """Write a selection of a dataset to a .npy file.
+
+    The output file is memory-mapped and each chunk-aligned block is read directly
+    into its place in the mapping, so no intermediate buffer is used.
+    """
+    shape = selection_shape(selection)
+    itemsize = dataset.dtype.itemsize
+    out = np.lib.format.open_memmap(fpath, "w+", dataset.dtype, shape)
+    if not shape:
+        dataset.read_direct(out, selection or None)
+        progress(itemsize)
+    else:
+        chunks = output_chunks(dataset, selection)
+        for out_block in iter_blocks(
+            shape, block_shape(shape, chunks, itemsize, max_bytes)
+        ):
+            dataset.read_direct(out, source_selection(selection, out_block), out_block)
+            progress(int(np.prod(block_size(out_block))) * itemsize)
+    out.flush()
+
+
+def iter_row_blocks(
+    dataset,
+    selection: Selection,
+    dtype: np.dtype,
+    max_bytes: int = DEFAULT_BLOCK_BYTES,
+    n_buffers: int = 1,
+) -> Iterator[np.ndarray]:
+    """Read a selection of a dataset in C order, as blocks of whole rows.
+
+    Blocks are read into ``n_buffers`` reusable buffers in rotation;
+    each yielded array is a view into one of them,
+    so is only valid until that buffer is reused.
+    The data is converted to ``dtype`` by HDF5 as it is read.
+    """
+    shape = selection_shape(selection)
+    if not shape:
+        out = np.empty((), dtype)
+        dataset.read_direct(out, selection or None)
+        yield out
+        return
+
+    block = row_block_shape(shape, dtype.itemsize, max_bytes)
+    block_len = int(np.prod(block))
+    buffers = [np.empty(block_len, dtype) for _ in range(n_buffers)]
+    for idx, out_block in enumerate(iter_blocks(shape, block)):
+        size = block_size(out_block)
+        # a contiguous prefix of the buffer, so that it can be written without copying
+        arr = buffers[idx % n_buffers][: int(np.prod(size))].reshape(size)
+        if arr.size:
+            dataset.read_direct(arr, source_selection(selection, out_block))
+        yield arr
+
+
+def _read_ahead(blocks: Iterator[np.ndarray], queue: Queue):
+    try:
+        for arr in blocks:
+            queue.put(arr)
+    except Exception as e:
+        queue.put(e)
+        return
+    queue.put(None)
+
+
+def threaded(blocks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+    """Read blocks in a background thread, one block ahead of the consumer.
+
+    The underlying iterator must rotate between at least 3 buffers:
+    one being read, one queued, and one being consumed.
+    """
+    queue: Queue = Queue(maxsize=1)
+    thread = Thread(target=_read_ahead, args=(blocks, queue), daemon=True)
+    thread.start()
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    thread.join()
+
+
+def csv_format(dtype: np.dtype) -> str:
+    if dtype.kind in "biu":
+        return "%d"
+    if dtype.kind == "f":
+        return "%.17g"
+    return "%s"
+
+
+def write_csv(blocks: Iterator[np.ndarray], out: BinaryIO, dtype: np.dtype, progress):
+    """Write blocks of whole rows as CSV, with trailing axes flattened into columns"""
+    fmt = csv_format(dtype)
+    for arr in blocks:
+        rows = arr.reshape(-1, 1) if arr.ndim < 2 else arr.reshape(arr.shape[0], -1)
+        np.savetxt(out, rows, fmt=fmt, delimiter=",")
+        progress(arr.nbytes)
+
+
+def write_raw(blocks: Iterator[np.ndarray], out: BinaryIO, progress):
+    """Write the bytes of each (contiguous) block in turn"""
+    for arr in blocks:
+        out.write(memoryview(arr).cast("B"))
+        progress(arr.nbytes)
+
+
+def export_stream(
+    dataset,
+    selection: Selection,
+    out: BinaryIO,
+    fmt: str,
+    max_bytes: int = DEFAULT_BLOCK_BYTES,
+    background=False,
+    progress: Callable[[int], None] = lambda n: None,
+):
+    """Write a selection of a dataset to an open binary stream as CSV or raw binary.
+
+    Raw binary is written in C order, little-endian.
+
+    :param background: Read the next block in a background thread
+        while the current one is being written.
+    """
+    dtype = dataset.dtype
+    if fmt == "raw":
+        dtype = dtype.newbyteorder("<")
+    blocks = iter_row_blocks(
+        dataset, selection, dtype, max_bytes, n_buffers=3 if background else 1
+    )
+    if background:
+        blocks = threaded(blocks)
+
+    if fmt == "csv":
+        write_csv(blocks, out, dtype, progress)
+    elif fmt == "raw":
+        write_raw(blocks, out, progress)
+    else:
+        raise ValueError(f"Unknown streaming format '{fmt}'")
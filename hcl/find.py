@@ -0,0 +1,285 @@
+"""
+Searching the hierarchy for objects matching name, kind, shape, dtype, size
+and attribute predicates.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from multiprocessing import Manager
+import os
+from queue import Empty, Queue
+import re
+import time
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+from h5py import File
+import numpy as np
+
+from .index import HierarchyIndex, NodeInfo, NodeKind
+from .utils import H5Path
+
+#: Arguments to ``-type``, as in ``find``
+KINDS = {
+    "g": (NodeKind.GROUP,),
+    "d": (NodeKind.DATASET,),
+    "t": (NodeKind.DATATYPE,),
+    "l": (NodeKind.SOFT_LINK, NodeKind.EXTERNAL_LINK),
+}
+
+Match = Tuple[H5Path, NodeInfo]
+
+#: Matches a worker of ``iter_matches_parallel`` sends at once
+BATCH_SIZE = 256
+
+#: Seconds after which a worker sends the matches it has, however few
+BATCH_INTERVAL = 0.1
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+
+def parse_shape(s: str) -> Tuple[Optional[int], ...]:
+    """Parse a shape like ``100x*x3``, where ``*`` matches any length"""
+    if s in ("", "scalar"):
+        return ()
+    return tuple(None if d == "*" else int(d) for d in s.split("x"))
+
+
+def normalise_dtype(s: str) -> str:
+    """Spell a dtype the way NodeInfo does, e.g. ``f4`` -> ``float32``"""
+    try:
+        return str(np.dtype(s))
+    except TypeError:
+        return s
+
+
+def parse_attr(s: str) -> Tuple[str, Optional[str]]:
+    """Split ``name=value`` into name and value; a bare name has no value"""
+    name, eq, value = s.partition("=")
+    return name, value if eq else None
+
+
+def attr_equals(value: Any, expected: str) -> bool:
+    """Whether an attribute value matches a string from the command line.
+
+    Strings are compared exactly, numbers numerically,
+    and anything else by its string representation.
+    """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if isinstance(value, str):
+        return value == expected
+    if np.ndim(value) == 0 and np.issubdtype(np.asarray(value).dtype, np.number):
+        try:
+            return bool(value == float(expected))
+        except ValueError:
+            return False
+    return str(value) == expected
+
+
+def literal_prefix(pattern: str) -> str:
+    """The part of a path pattern before its first wildcard, up to the last '/'"""
+    m = _GLOB_CHARS.search(pattern)
+    if m is None:
+        return pattern
+    return pattern[: pattern.rfind("/", 0, m.start()) + 1]
+
+
+class Criteria(NamedTuple):
+    """
+    Predicates which an object must all satisfy to match.
+
+    Cheap checks on the object's path and index entry are made first;
+    sizes and attributes are only read for objects which pass them.
+    """
+
+    name: Optional[str] = None
+    path: Optional[str] = None
+    kinds: Optional[Tuple[NodeKind, ...]] = None
+    dtype: Optional[str] = None
+    shape: Optional[Tuple[Optional[int], ...]] = None
+    ndim: Optional[int] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    attrs: Tuple[Tuple[str, Optional[str]], ...] = ()
+    min_depth: int = 0
+    prune: Tuple[str, ...] = ()
+
+    def prunes(self, path: H5Path, info: NodeInfo) -> bool:
+        """Whether nothing below this group can match"""
+        p = str(path)
+        if any(fnmatchcase(p, pattern) for pattern in self.prune):
+            return True
+        if self.path is not None:
+            prefix = literal_prefix(self.path)
+            below = p.rstrip("/") + "/"
+            return not (below.startswith(prefix) or prefix.startswith(below))
+        return False
+
+    def matches(
+        self, index: HierarchyIndex, path: H5Path, info: NodeInfo, depth: int
+    ) -> bool:
+        if depth < self.min_depth:
+            return False
+        if self.name is not None and not fnmatchcase(path.name or "/", self.name):
+            return False
+        if self.path is not None and not fnmatchcase(str(path), self.path):
+            return False
+        if self.kinds is not None and info.kind not in self.kinds:
+            return False
+        if self.dtype is not None and info.dtype != self.dtype:
+            return False
+        if self.ndim is not None or self.shape is not None:
+            if not info.is_dataset or info.shape is None:
+                return False
+            if self.ndim is not None and len(info.shape) != self.ndim:
+                return False
+            if self.shape is not None and not _shape_matches(info.shape, self.shape):
+                return False
+        if self.min_size is not None or self.max_size is not None:
+            if info.is_link:
+                return False
+            size = index.details(path).storage or 0
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        if self.attrs:
+            if info.is_link:
+                return False
+            names = index.attr_names(path)
+            for name, expected in self.attrs:
+                if name not in names:
+                    return False
+                if expected is not None and not attr_equals(
+                    index.attr(path, name), expected
+                ):
+                    return False
+        return True
+
+
+def _shape_matches(shape: Tuple[int, ...], pattern: Tuple[Optional[int], ...]):
+    return len(shape) == len(pattern) and all(
+        p is None or p == s for s, p in zip(shape, pattern)
+    )
+
+
+def iter_matches(
+    index: HierarchyIndex,
+    path: H5Path,
+    criteria: Criteria,
+    max_depth: Optional[int] = None,
+    depth: int = 0,
+) -> Iterator[Match]:
+    """Objects at and below ``path`` which match, in pre-order, as they are found.
+
+    :param depth: Depth of ``path`` below where the search started,
+        for the ``min_depth`` criterion.
+    """
+    for p, info in index.walk(path, max_depth, criteria.prunes):
+        if criteria.matches(index, p, info, depth + len(p.parts) - len(path.parts)):
+            yield p, info
+
+
+def _find_worker(
+    fpath, path, criteria, max_depth, depth, claims, results: "Queue[Optional[list]]"
+):
+    """Search below ``path``, putting batches of matches on the ``results`` queue
+    as they are found, then None when done (or failed).
+
+    Objects with several hard links may also be reached from other workers' groups,
+    so each is only considered by the worker which first claims it in ``claims``,
+    keyed by ``NodeInfo.object_id``, with the path it was submitted for.
+    """
+    token = str(path)
+    # multiply-linked groups claimed elsewhere, so not to be descended into
+    skipped = set()
+    batch: List[Match] = []
+    flushed = time.monotonic()
+
+    def prune(p: H5Path, info: NodeInfo) -> bool:
+        return p in skipped or criteria.prunes(p, info)
+
+    try:
+        with File(fpath, "r") as f:
+            index = HierarchyIndex(lambda: f)
+            for p, info in index.walk(path, max_depth, prune):
+                if (
+                    info.n_links > 1
+                    and claims.setdefault(info.object_id, token) != token
+                ):
+                    skipped.add(p)
+                    continue
+                rel_depth = depth + len(p.parts) - len(path.parts)
+                if criteria.matches(index, p, info, rel_depth):
+                    batch.append((p, info))
+                if batch and (
+                    len(batch) >= BATCH_SIZE
+                    or time.monotonic() - flushed > BATCH_INTERVAL
+                ):
+                    results.put(batch)
+                    batch = []
+                    flushed = time.monotonic()
+    finally:
+        if batch:
+            results.put(batch)
+        results.put(None)
+
+
+def iter_matches_parallel(
+    index: HierarchyIndex,
+    fpath: os.PathLike,
+    path: H5Path,
+    criteria: Criteria,
+    max_depth: Optional[int],
+    jobs: int,
+) -> Iterator[Match]:
+    """As ``iter_matches``, but searching below each member group of ``path``
+    in a pool of processes, each of which opens the file read-only.
+
+    Matches are yielded as workers find them,
+    so those below different member groups are interleaved.
+    Objects reachable through several hard links are only considered once,
+    at whichever of their paths is found first.
+    """
+    info = index.info(path)
+    if criteria.matches(index, path, info, 0):
+        yield path, info
+    if not info.is_group or (max_depth is not None and max_depth < 1):
+        return
+    if criteria.prunes(path, info):
+        return
+    sub_depth = None if max_depth is None else max_depth - 1
+
+    with Manager() as manager, ProcessPoolExecutor(jobs) as pool:
+        claims = manager.dict()
+        results = manager.Queue()
+        if info.n_links > 1:
+            claims[info.object_id] = str(path)
+        futures = []
+        for p, info in index.children(path):
+            if info.n_links > 1 and claims.setdefault(info.object_id, str(p)) != str(p):
+                continue
+            if info.is_group:
+                futures.append(
+                    pool.submit(
+                        _find_worker, fpath, p, criteria, sub_depth, 1, claims, results
+                    )
+                )
+            elif criteria.matches(index, p, info, 1):
+                yield p, info
+
+        n_running = len(futures)
+        while n_running:
+            try:
+                batch = results.get(timeout=BATCH_INTERVAL)
+            except Empty:
+                # a worker process which died could not say it is done
+                for future in futures:
+                    if future.done():
+                        future.result()
+                continue
+            if batch is None:
+                n_running -= 1
+            else:
+                yield from batch
+        for future in futures:
+            future.result()
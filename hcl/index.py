@@ -0,0 +1,665 @@
+"""
+In-memory index of the file's hierarchy, shared between commands and completers.
+"""
+from enum import Enum
+import logging
+from threading import RLock
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from h5py import File, check_string_dtype, h5a, h5d, h5f, h5g, h5l, h5o, h5s
+
+from .cache import FileCache, MISSING
+from .utils import H5Path, LRUDict
+
+logger = logging.getLogger(__name__)
+
+#: Attribute values which pickle to more bytes than this are not persisted
+MAX_CACHED_ATTR_BYTES = 64 * 1024
+
+#: Number of objects whose attribute names and AttrInfo are kept in memory
+MAX_ATTR_OBJECTS = 1024
+
+#: Object properties which depend on how the file was opened, not its contents
+UNCACHED_PROPERTIES = {"filename"}
+
+
+class NodeKind(Enum):
+    GROUP = "group"
+    DATASET = "dataset"
+    DATATYPE = "datatype"
+    SOFT_LINK = "soft link"
+    EXTERNAL_LINK = "external link"
+
+
+_KINDS = {
+    h5o.TYPE_GROUP: NodeKind.GROUP,
+    h5o.TYPE_DATASET: NodeKind.DATASET,
+    h5o.TYPE_NAMED_DATATYPE: NodeKind.DATATYPE,
+}
+
+
+class NodeInfo(NamedTuple):
+    name: str
+    kind: NodeKind
+    shape: Optional[Tuple[int, ...]] = None
+    dtype: Optional[str] = None
+    addr: Optional[int] = None
+    target: Optional[str] = None
+    #: name of the file holding the object, if it was reached through an external
+    #: link; None for objects in the indexed file
+    file: Optional[str] = None
+    #: number of hard links to the object
+    n_links: int = 1
+
+    @property
+    def object_id(self) -> Optional[Tuple[Optional[str], int]]:
+        """Identifies the object, across files; None for unresolved links"""
+        if self.addr is None:
+            return None
+        return (self.file, self.addr)
+
+    @property
+    def is_group(self):
+        return self.kind is NodeKind.GROUP
+
+    @property
+    def is_dataset(self):
+        return self.kind is NodeKind.DATASET
+
+    @property
+    def is_link(self):
+        return self.kind in (NodeKind.SOFT_LINK, NodeKind.EXTERNAL_LINK)
+
+
+class ObjectDetails(NamedTuple):
+    """Metadata shown in long listings, beyond what is in NodeInfo.
+
+    ``mtime`` is 0 if the file does not track modification times.
+    ``storage``, ``chunks`` and ``filters`` only apply to datasets.
+    """
+
+    n_attrs: int
+    mtime: int = 0
+    storage: Optional[int] = None
+    chunks: Optional[Tuple[int, ...]] = None
+    filters: Tuple[str, ...] = ()
+
+
+class AttrInfo(NamedTuple):
+    """Metadata of an attribute, read without reading its value.
+
+    ``shape`` is None for an empty (null dataspace) attribute.
+    ``nbytes`` is the size stored in the object header,
+    which for variable-length strings does not include the strings themselves.
+    """
+
+    shape: Optional[Tuple[int, ...]]
+    dtype: str
+    nbytes: int
+
+
+def node_record(path: H5Path, info: NodeInfo) -> dict:
+    """JSON-compatible description of the object at a path, for machine-readable output"""
+    return {
+        "path": str(path),
+        "kind": info.kind.value,
+        "shape": None if info.shape is None else list(info.shape),
+        "dtype": info.dtype,
+        "target": info.target,
+    }
+
+
+def _decode(name: bytes) -> str:
+    return name.decode("utf-8", "surrogateescape")
+
+
+def _encode(name: str) -> bytes:
+    return name.encode("utf-8", "surrogateescape")
+
+
+def _filter_name(dcpl, idx: int) -> str:
+    code, _, _, name = dcpl.get_filter(idx)
+    return _decode(name) if name else f"filter {code}"
+
+
+def file_number(f: File) -> int:
+    """HDF5's number for an open file, as in objects' ``h5o.get_info().fileno``"""
+    return h5o.get_info(f.id).fileno
+
+
+def read_object(
+    loc, name: str, key: bytes = b".", details=False, fileno: Optional[int] = None
+) -> Tuple[NodeInfo, Optional[ObjectDetails]]:
+    """Get the NodeInfo of the object at ``key``, relative to the low-level ``loc``,
+    and optionally its ObjectDetails, sharing the same header lookup.
+
+    Only reads object headers and dataset creation properties, never data.
+
+    :param fileno: ``file_number`` of the indexed file; objects in any other file
+        (through external links) have ``NodeInfo.file`` set.
+    """
+    oinfo = h5o.get_info(loc, key)
+    kind = _KINDS[oinfo.type]
+    file = None
+    if fileno is not None and oinfo.fileno != fileno:
+        file = _decode(h5f.get_name(h5o.open(loc, key)))
+    shape = None
+    dtype = None
+    dsid = None
+    if kind is NodeKind.DATASET:
+        dsid = h5d.open(loc, key)
+        shape = dsid.shape
+        try:
+            dtype = str(dsid.dtype)
+        except Exception:
+            dtype = "<UNKNOWN>"
+    info = NodeInfo(name, kind, shape, dtype, oinfo.addr, file=file, n_links=oinfo.rc)
+    if not details:
+        return info, None
+    if dsid is None:
+        return info, ObjectDetails(oinfo.num_attrs, oinfo.mtime)
+
+    dcpl = dsid.get_create_plist()
+    chunks = None
+    if dcpl.get_layout() == h5d.CHUNKED:
+        chunks = dcpl.get_chunk()
+    filters = tuple(_filter_name(dcpl, i) for i in range(dcpl.get_nfilters()))
+    return info, ObjectDetails(
+        oinfo.num_attrs, oinfo.mtime, dsid.get_storage_size(), chunks, filters
+    )
+
+
+def _dtype_name(dtype) -> str:
+    string_info = check_string_dtype(dtype)
+    if string_info is not None and string_info.length is None:
+        return "str" if string_info.encoding == "utf-8" else "bytes"
+    return str(dtype)
+
+
+def read_attr_info(aid: h5a.AttrID) -> AttrInfo:
+    if aid.get_space().get_simple_extent_type() == h5s.NULL:
+        return AttrInfo(None, _dtype_name(aid.dtype), 0)
+    try:
+        nbytes = aid.get_storage_size()
+    except RuntimeError:
+        # HDF5 reports a size of 0 as an error
+        nbytes = 0
+    return AttrInfo(aid.shape, _dtype_name(aid.dtype), nbytes)
+
+
+def read_attr_infos(oid) -> Dict[str, AttrInfo]:
+    """AttrInfo of each attribute of an open low-level object, in name order.
+
+    Only the attribute messages in the object header are read, not the values.
+    """
+    out = dict()
+
+    def fn(name: bytes):
+        out[_decode(name)] = read_attr_info(h5a.open(oid, name))
+
+    h5a.iterate(oid, fn)
+    return out
+
+
+def read_info(
+    loc, name: str, key: bytes = b".", fileno: Optional[int] = None
+) -> NodeInfo:
+    """Get the NodeInfo of the object at ``key``, relative to the low-level ``loc``"""
+    return read_object(loc, name, key, fileno=fileno)[0]
+
+
+def read_details(loc, key: bytes = b".") -> ObjectDetails:
+    """Get the ObjectDetails of the object at ``key``, relative to the low-level ``loc``"""
+    return read_object(loc, _decode(key), key, details=True)[1]
+
+
+def read_member_info(
+    gid,
+    name: str,
+    key: bytes,
+    ltype: Optional[int] = None,
+    fileno: Optional[int] = None,
+) -> Optional[NodeInfo]:
+    """Get the NodeInfo of a group member, without following soft or external links.
+
+    Returns None for link types which cannot be interpreted.
+
+    :param ltype: The member's link type, if already known from iterating over the group.
+    :param fileno: As for ``read_object``.
+    """
+    if ltype is None:
+        ltype = gid.links.get_info(key).type
+    if ltype == h5l.TYPE_HARD:
+        return read_info(gid, name, key, fileno)
+    if ltype == h5l.TYPE_SOFT:
+        target = _decode(gid.links.get_val(key))
+        return NodeInfo(name, NodeKind.SOFT_LINK, target=target)
+    if ltype == h5l.TYPE_EXTERNAL:
+        fname, obj_path = gid.links.get_val(key)
+        target = f"{_decode(fname)}:{_decode(obj_path)}"
+        return NodeInfo(name, NodeKind.EXTERNAL_LINK, target=target)
+    return None
+
+
+def iter_links(gid) -> List[Tuple[bytes, int]]:
+    """(name, link type) of every member of an open low-level group, in one pass"""
+    out: List[Tuple[bytes, int]] = []
+    # the link info object is reused between calls, so only its type is kept
+    gid.links.iterate(lambda key, linfo: out.append((key, linfo.type)), info=True)
+    return out
+
+
+class HierarchyIndex:
+    """
+    Lazily-populated record of the members of each group in a file.
+
+    Each group is scanned the first time it is visited;
+    its members' NodeInfo are kept for the lifetime of the index
+    (or until ``invalidate`` is called).
+    Listings are keyed by object address (and file; see ``NodeInfo.object_id``),
+    so a group hard-linked from several places is only scanned once.
+    Listings contain soft and external links as they are, without resolving them;
+    looking up the info of a single path does follow links.
+    Objects in other files, reached through external links,
+    are not persisted to the cache, which only tracks changes to this file.
+
+    If a FileCache is given, anything not yet in memory is looked for there
+    before falling back to the file itself, and anything read from the file
+    is added to it;
+    the file is not opened until it is needed.
+
+    :param get_file: Callable returning the open h5py.File to index.
+    :param cache: Persistent cache for this file's metadata.
+    """
+
+    def __init__(self, get_file: Callable[[], File], cache: Optional[FileCache] = None):
+        self._get_file = get_file
+        self.cache = cache
+        self._lock = RLock()
+        self._nodes: Dict[str, NodeInfo] = dict()
+        # keyed by NodeInfo.object_id, so hard links to an object share an entry
+        self._members: Dict[Any, Dict[str, NodeInfo]] = dict()
+        self._properties: Dict[str, Tuple[bool, Any]] = dict()
+        self._attr_names: Dict[Any, List[str]] = LRUDict(MAX_ATTR_OBJECTS)
+        self._attr_infos: Dict[Any, Dict[str, AttrInfo]] = LRUDict(MAX_ATTR_OBJECTS)
+        self._details: Dict[Any, Dict[str, ObjectDetails]] = dict()
+
+    @property
+    def file(self) -> File:
+        return self._get_file()
+
+    def invalidate(self):
+        with self._lock:
+            self._nodes.clear()
+            self._members.clear()
+            self._properties.clear()
+            self._attr_names.clear()
+            self._attr_infos.clear()
+            self._details.clear()
+
+    def _cached(self, kind: str, key: str) -> Any:
+        if self.cache is None:
+            return MISSING
+        return self.cache.get(kind, key)
+
+    def _cache(self, kind: str, key: str, value: Any, max_bytes=None):
+        if self.cache is not None:
+            self.cache.put(kind, key, value, max_bytes)
+
+    @staticmethod
+    def _group_key(info: NodeInfo) -> Optional[str]:
+        """Persistent cache key for a group's listings; None if it is in another file"""
+        return None if info.file is not None else str(info.addr)
+
+    def _cached_group(self, kind: str, info: NodeInfo) -> Any:
+        key = self._group_key(info)
+        return MISSING if key is None else self._cached(kind, key)
+
+    def _cache_group(self, kind: str, info: NodeInfo, value: Any):
+        key = self._group_key(info)
+        if key is not None:
+            self._cache(kind, key, value)
+
+    def info(self, path: H5Path) -> NodeInfo:
+        """Get information about the object at the given absolute path.
+
+        Links are followed; if one cannot be, the info is of the link itself.
+
+        :raises KeyError: if there is no object at that path.
+        """
+        path = H5Path(path)
+        key = str(path)
+        with self._lock:
+            try:
+                return self._nodes[key]
+            except KeyError:
+                pass
+
+            info = self._cached("node", key)
+            if info is MISSING:
+                info = self._read_info(path)
+                if info is None or info.file is None:
+                    self._cache("node", key, info)
+            if info is None:
+                raise KeyError(f"No object at path: {key}")
+            self._nodes[key] = info
+            return info
+
+    def _read_info(self, path: H5Path) -> Optional[NodeInfo]:
+        key = str(path)
+        if key == "/":
+            return read_info(self.file.id, "/")
+        parent = self._nodes.get(str(path.parent))
+        if parent is not None and parent.object_id in self._members:
+            info = self._members[parent.object_id].get(path.name)
+            if info is None or not info.is_link:
+                return info
+        if key in self.file:
+            try:
+                return read_info(
+                    self.file.id, path.name, _encode(key), file_number(self.file)
+                )
+            except (KeyError, RuntimeError):
+                # a dangling soft or external link, e.g. to a missing file
+                gid = h5g.open(self.file.id, _encode(str(path.parent)))
+                return read_member_info(gid, path.name, _encode(path.name))
+        return None
+
+    def members(self, path: H5Path) -> Dict[str, NodeInfo]:
+        """Get the members of the group at the given absolute path, sorted by name.
+
+        :raises KeyError: if there is no object at that path.
+        :raises ValueError: if the object at that path is not a group.
+        """
+        info = self.info(path)
+        if not info.is_group:
+            raise ValueError(f"Object at path is a {info.kind.value}: {path}")
+        return self._group_members(path, info)
+
+    def peek_members(self, path: H5Path) -> Optional[Dict[str, NodeInfo]]:
+        """Get the members of the group at the given absolute path
+        if they are already in memory, otherwise None.
+
+        Never reads the file or the persistent cache, or waits for another thread,
+        so is safe to call while typing.
+        """
+        info = self._peek_info(H5Path(path))
+        if info is None or not info.is_group:
+            return None
+        return self._members.get(info.object_id)
+
+    def _peek_info(self, path: H5Path) -> Optional[NodeInfo]:
+        info = self._nodes.get(str(path))
+        if info is None and path.name:
+            parent = self._peek_info(path.parent)
+            if parent is not None:
+                info = self._members.get(parent.object_id, {}).get(path.name)
+        return info
+
+    def _group_members(self, path: H5Path, info: NodeInfo) -> Dict[str, NodeInfo]:
+        with self._lock:
+            try:
+                return self._members[info.object_id]
+            except KeyError:
+                pass
+
+            out = self._cached_group("members", info)
+            if out is MISSING:
+                out, _ = self._read_members(path)
+                self._cache_group("members", info, out)
+            self._members[info.object_id] = out
+            return out
+
+    def member_names(self, path: H5Path) -> List[str]:
+        """Get the sorted names of the members of the group at the given absolute path.
+
+        If the group has not been indexed, only its links are read,
+        not its members' object headers,
+        so this includes members which ``members`` would skip as unresolvable.
+
+        :raises KeyError: if there is no object at that path.
+        :raises ValueError: if the object at that path is not a group.
+        """
+        info = self.info(path)
+        if not info.is_group:
+            raise ValueError(f"Object at path is a {info.kind.value}: {path}")
+
+        with self._lock:
+            members = self._members.get(info.object_id)
+            if members is None:
+                members = self._cached_group("members", info)
+            if members is not MISSING:
+                return list(members)
+            gid = h5g.open(self.file.id, _encode(str(path)))
+            return sorted(_decode(key) for key, _ in iter_links(gid))
+
+    def _read_members(
+        self, path: H5Path, details=False
+    ) -> Tuple[Dict[str, NodeInfo], Dict[str, ObjectDetails]]:
+        """Scan a group once for its members' NodeInfo,
+        and the ObjectDetails of hard-linked members if ``details``.
+        """
+        logger.debug("Indexing group at %s", path)
+        gid = h5g.open(self.file.id, _encode(str(path)))
+        fileno = file_number(self.file)
+        found = dict()
+        found_details = dict()
+        for key, ltype in iter_links(gid):
+            name = _decode(key)
+            try:
+                if details and ltype == h5l.TYPE_HARD:
+                    info, found_details[name] = read_object(
+                        gid, name, key, True, fileno
+                    )
+                else:
+                    info = read_member_info(gid, name, key, ltype, fileno)
+            except (KeyError, RuntimeError):
+                info = None
+            if info is None:
+                logger.debug("Could not resolve member %s of %s", name, path)
+            else:
+                found[name] = info
+        return {k: found[k] for k in sorted(found)}, found_details
+
+    def details(self, path: H5Path) -> ObjectDetails:
+        """Get the ObjectDetails of the object at the given absolute path.
+
+        :raises KeyError: if there is no object at that path.
+        """
+        path = H5Path(path)
+        parent = path.parent
+        if str(path) != "/" and self.info(parent).is_group:
+            found = self.member_details(parent).get(path.name)
+            if found is not None:
+                return found
+        # raises KeyError for missing objects
+        info = self.info(path)
+        key = str(path)
+        details = self._cached("details", key) if info.file is None else MISSING
+        if details is MISSING:
+            details = read_details(self.file.id, _encode(key))
+            if info.file is None:
+                self._cache("details", key, details)
+        return details
+
+    def member_details(self, path: H5Path) -> Dict[str, ObjectDetails]:
+        """Get the ObjectDetails of the hard-linked members of the group at the given
+        absolute path, read in one pass over the group.
+
+        :raises KeyError: if there is no object at that path.
+        :raises ValueError: if the object at that path is not a group.
+        """
+        info = self.info(path)
+        if not info.is_group:
+            raise ValueError(f"Object at path is a {info.kind.value}: {path}")
+
+        with self._lock:
+            try:
+                return self._details[info.object_id]
+            except KeyError:
+                pass
+
+            out = self._cached_group("member_details", info)
+            if out is MISSING:
+                members, out = self._read_members(path, details=True)
+                self._cache_group("member_details", info, out)
+                if info.object_id not in self._members:
+                    self._members[info.object_id] = members
+                    self._cache_group("members", info, members)
+            self._details[info.object_id] = out
+            return out
+
+    def children(self, path: H5Path) -> List[Tuple[H5Path, NodeInfo]]:
+        """Get (path, NodeInfo) pairs for the members of the given object.
+
+        Datasets and named datatypes have no children.
+        """
+        path = H5Path(path)
+        if not self.info(path).is_group:
+            return []
+        return [(path / name, info) for name, info in self.members(path).items()]
+
+    def walk(
+        self,
+        path: H5Path,
+        max_depth: Optional[int] = None,
+        prune: Optional[Callable[[H5Path, NodeInfo], bool]] = None,
+    ) -> Iterator[Tuple[H5Path, NodeInfo]]:
+        """Pre-order traversal of the object at the given path and everything below it.
+
+        Each object is yielded once, at the first path it is found;
+        groups reachable by several hard links (including cycles)
+        are only descended into once.
+        Soft and external links are yielded but not followed.
+
+        :param max_depth: Do not descend more than this many levels below ``path``.
+        :param prune: Called with each group's path and info;
+            if it returns True, the group is yielded but not descended into.
+        """
+        path = H5Path(path)
+        seen = set()
+        stack = [(path, self.info(path), 0)]
+        while stack:
+            p, info, depth = stack.pop()
+            if info.object_id is not None:
+                if info.object_id in seen:
+                    continue
+                seen.add(info.object_id)
+            yield p, info
+            if (
+                info.is_group
+                and (max_depth is None or depth < max_depth)
+                and not (prune and prune(p, info))
+            ):
+                members = self._group_members(p, info)
+                stack.extend(
+                    (p / name, i, depth + 1) for name, i in reversed(members.items())
+                )
+
+    def property(self, path: H5Path, name: str) -> Any:
+        """Get a property (e.g. ``chunks``) of the high-level object at the given path.
+
+        :raises KeyError: if there is no object at that path.
+        :raises AttributeError: if the object does not have that property.
+        """
+        key = "\0".join((str(H5Path(path)), name))
+        cacheable = name not in UNCACHED_PROPERTIES
+        with self._lock:
+            try:
+                found, value = self._properties[key]
+            except KeyError:
+                cached = self._cached("property", key) if cacheable else MISSING
+                if cached is MISSING:
+                    cached = self._read_property(path, name)
+                    if cacheable:
+                        self._cache("property", key, cached)
+                found, value = self._properties[key] = cached
+        if not found:
+            raise AttributeError(value)
+        return value
+
+    def _read_property(self, path: H5Path, name: str) -> Tuple[bool, Any]:
+        obj = self.file[str(path)]
+        try:
+            return True, getattr(obj, name)
+        except AttributeError as e:
+            return False, str(e)
+
+    def attr_names(self, path: H5Path) -> List[str]:
+        """Get the sorted names of the HDF5 attributes on the object at the given path.
+
+        The most recently used objects' names are kept in memory
+        (see ``MAX_ATTR_OBJECTS``), so this is fast enough to call while typing.
+
+        :raises KeyError: if there is no object at that path.
+        """
+        key = str(H5Path(path))
+        with self._lock:
+            obj_key = self._object_key(key)
+            try:
+                return self._attr_names[obj_key]
+            except KeyError:
+                pass
+
+            if obj_key in self._attr_infos:
+                names = list(self._attr_infos[obj_key])
+            else:
+                names = self._cached("attr_names", key)
+            if names is MISSING:
+                names = []
+                h5a.iterate(self.file[key].id, lambda name: names.append(_decode(name)))
+                self._cache("attr_names", key, names)
+            self._attr_names[obj_key] = names
+            return names
+
+    def attr_infos(self, path: H5Path) -> Dict[str, AttrInfo]:
+        """Get the AttrInfo of each HDF5 attribute on the object at the given path,
+        in name order, without reading their values.
+
+        :raises KeyError: if there is no object at that path.
+        """
+        key = str(H5Path(path))
+        with self._lock:
+            obj_key = self._object_key(key)
+            try:
+                return self._attr_infos[obj_key]
+            except KeyError:
+                pass
+
+            infos = self._cached("attr_infos", key)
+            if infos is MISSING:
+                infos = read_attr_infos(self.file[key].id)
+                self._cache("attr_infos", key, infos)
+            self._attr_infos[obj_key] = infos
+            return infos
+
+    def _object_key(self, path: str):
+        # an unresolvable link has no address
+        object_id = self.info(H5Path(path)).object_id
+        return path if object_id is None else object_id
+
+    def attr(self, path: H5Path, name: str) -> Any:
+        """Get the value of an HDF5 attribute on the object at the given path.
+
+        Small values are persisted to the cache, if there is one;
+        values are not kept in memory.
+
+        :raises KeyError: if there is no object or attribute.
+        """
+        return next(self.iter_attrs(path, [name]))[1]
+
+    def iter_attrs(self, path: H5Path, names: List[str]) -> Iterator[Tuple[str, Any]]:
+        """Lazily get (name, value) of several HDF5 attributes on one object,
+        which is only opened once; as ``attr``.
+        """
+        path = str(H5Path(path))
+        attrs = None
+        for name in names:
+            key = "\0".join((path, name))
+            value = self._cached("attr", key)
+            if value is MISSING:
+                if attrs is None:
+                    attrs = self.file[path].attrs
+                value = attrs[name]
+                self._cache("attr", key, value, MAX_CACHED_ATTR_BYTES)
+            yield name, value
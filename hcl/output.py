@@ -0,0 +1,139 @@
+"""
+Machine-readable output: commands' results as JSON records, written as they are produced.
+"""
+import base64
+import json
+import math
+import sys
+from typing import Any, Optional, TextIO
+
+import numpy as np
+
+FORMATS = ("text", "json", "ndjson")
+
+#: Arrays with more elements than this are base64-encoded (if numeric)
+#: or truncated (otherwise)
+DEFAULT_MAX_ITEMS = 1000
+
+#: dtype kinds whose raw bytes are meaningful as base64
+_BINARY_KINDS = "biufc"
+
+
+def _float(x: float):
+    # NaN and infinity are not valid JSON
+    return x if math.isfinite(x) else str(x)
+
+
+def _bytes(b: bytes):
+    try:
+        return b.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(b).decode("ascii")}
+
+
+def _nonfinite(items):
+    if isinstance(items, list):
+        return [_nonfinite(i) for i in items]
+    return _float(items)
+
+
+def array_to_jsonable(arr: np.ndarray, max_items=DEFAULT_MAX_ITEMS):
+    """Nested lists for small arrays.
+
+    Large numeric arrays are encoded as
+    ``{"dtype", "shape", "base64"}`` with little-endian, C-ordered data;
+    other large arrays as ``{"dtype", "shape", "truncated": true, "head"}``
+    with the first ``max_items`` elements, flattened.
+    """
+    if arr.size > max_items:
+        if arr.dtype.kind in _BINARY_KINDS:
+            data = np.ascontiguousarray(arr, arr.dtype.newbyteorder("<"))
+            return {
+                "dtype": data.dtype.str,
+                "shape": list(arr.shape),
+                "base64": base64.b64encode(data).decode("ascii"),
+            }
+        return {
+            "dtype": str(arr.dtype),
+            "shape": list(arr.shape),
+            "truncated": True,
+            "head": to_jsonable(arr.reshape(-1)[:max_items].tolist(), max_items),
+        }
+    if arr.dtype.kind in "biu":
+        return arr.tolist()
+    if arr.dtype.kind == "f":
+        if np.isfinite(arr).all():
+            return arr.tolist()
+        return _nonfinite(arr.tolist())
+    return to_jsonable(arr.tolist(), max_items)
+
+
+def to_jsonable(value: Any, max_items=DEFAULT_MAX_ITEMS):
+    """Convert a value (e.g. an attribute) into something ``json.dumps`` accepts.
+
+    NumPy scalars become Python scalars, arrays become lists or are encoded
+    (see ``array_to_jsonable``), bytes are decoded as UTF-8 if possible,
+    non-finite floats become strings like ``"nan"``,
+    and anything else unknown becomes its string representation.
+    """
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return _float(value)
+    if isinstance(value, bytes):
+        return _bytes(value)
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v, max_items) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v, max_items) for v in value]
+    if isinstance(value, np.ndarray):
+        return array_to_jsonable(value, max_items)
+    if isinstance(value, np.generic):
+        return to_jsonable(value.item(), max_items)
+    return str(value)
+
+
+class RecordWriter:
+    """
+    Writes records (dicts) as they are produced.
+
+    ``ndjson`` writes one JSON object per line.
+    ``json`` writes one JSON array per command, between ``begin`` and ``end``,
+    with one element per line.
+
+    :param fmt: "json" or "ndjson".
+    :param file: Stream to write to; default stdout at the time of writing.
+    :param max_items: See ``to_jsonable``.
+    """
+
+    def __init__(
+        self, fmt="ndjson", file: Optional[TextIO] = None, max_items=DEFAULT_MAX_ITEMS
+    ):
+        if fmt not in ("json", "ndjson"):
+            raise ValueError(f"Unknown record format '{fmt}'")
+        self.fmt = fmt
+        self.file = file
+        self.max_items = max_items
+        self.n_written = 0
+
+    @property
+    def out(self) -> TextIO:
+        return self.file or sys.stdout
+
+    def begin(self):
+        self.n_written = 0
+        if self.fmt == "json":
+            self.out.write("[")
+
+    def write(self, record: dict):
+        line = json.dumps(to_jsonable(record, self.max_items))
+        if self.fmt == "json":
+            self.out.write(("\n" if not self.n_written else ",\n") + line)
+        else:
+            self.out.write(line + "\n")
+        self.n_written += 1
+
+    def end(self):
+        if self.fmt == "json":
+            self.out.write("\n]\n" if self.n_written else "]\n")
+        self.out.flush()
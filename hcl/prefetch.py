@@ -0,0 +1,162 @@
+"""
+Background reading of groups into the index, so that completion never waits on HDF5.
+"""
+from collections import deque
+import logging
+from threading import Condition, Thread
+import time
+from typing import Callable, Deque, Dict, Optional, Set
+
+from .index import HierarchyIndex, NodeInfo
+from .utils import H5Path
+
+logger = logging.getLogger(__name__)
+
+#: Member groups of the current group to read ahead, in name order
+DEFAULT_MAX_TARGETS = 32
+
+#: Longest a completion waits for a group which has not been read yet, in seconds
+DEFAULT_LATENCY_BUDGET = 0.05
+
+
+class Prefetcher:
+    """
+    Reads the members of groups into a HierarchyIndex in a background thread.
+
+    ``prefetch_around`` queues a group and then its member groups,
+    which are likely to be completed or visited next.
+    ``wait`` is for a completion which needs a group right now:
+    it jumps the queue, replacing any earlier such request which has not started
+    (as it is stale once the user has typed more),
+    and waits for at most a latency budget;
+    if it gives up, ``on_late`` is called from the background thread
+    once the group has been read, so that completion can be retried.
+
+    Each group is read at most once; HDF5 calls cannot be interrupted,
+    so a read which has started always finishes.
+
+    :param index: Index to populate.
+    :param max_targets: Number of member groups to read after each group.
+    :param on_late: Called with no arguments when a group which ``wait``
+        gave up on has been read.
+    """
+
+    def __init__(
+        self,
+        index: HierarchyIndex,
+        max_targets=DEFAULT_MAX_TARGETS,
+        on_late: Optional[Callable[[], None]] = None,
+    ):
+        self.index = index
+        self.max_targets = max_targets
+        self.on_late = on_late
+        self._late: Optional[H5Path] = None
+        self._cond = Condition()
+        self._urgent: Optional[H5Path] = None
+        self._queue: Deque[H5Path] = deque()
+        self._around: Set[H5Path] = set()
+        self._failed: Set[H5Path] = set()
+        self._closed = False
+        self._thread: Optional[Thread] = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._work, name="hcl-prefetch", daemon=True)
+            self._thread.start()
+
+    def prefetch_around(self, path: H5Path):
+        """Replace queued reads with this group and then its member groups"""
+        with self._cond:
+            self._queue.clear()
+            self._around = {path}
+            self._queue.append(path)
+            self._start()
+            self._cond.notify_all()
+
+    def wait(
+        self, path: H5Path, timeout=DEFAULT_LATENCY_BUDGET
+    ) -> Optional[Dict[str, NodeInfo]]:
+        """Members of the group at ``path``, if they can be read within ``timeout``.
+
+        :return: None if the path is not a readable group, or it took too long.
+        """
+        members = self.index.peek_members(path)
+        if members is not None:
+            return members
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if path in self._failed:
+                return None
+            self._urgent = path
+            self._start()
+            self._cond.notify_all()
+            while True:
+                members = self.index.peek_members(path)
+                remaining = deadline - time.monotonic()
+                if members is not None or path in self._failed:
+                    return members
+                if remaining <= 0:
+                    self._late = path
+                    return None
+                self._cond.wait(remaining)
+
+    def forget_failures(self):
+        """Try again to read groups which could not be read, e.g. after the file changes"""
+        with self._cond:
+            self._failed.clear()
+
+    def close(self, wait=False):
+        """Stop the background thread.
+
+        :param wait: Wait for any read in progress to finish.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _next(self) -> Optional[H5Path]:
+        with self._cond:
+            while not self._closed:
+                if self._urgent is not None:
+                    path, self._urgent = self._urgent, None
+                    return path
+                if self._queue:
+                    return self._queue.popleft()
+                self._cond.wait()
+            return None
+
+    def _work(self):
+        while True:
+            path = self._next()
+            if path is None:
+                return
+            members = self.index.peek_members(path)
+            if members is None and path not in self._failed:
+                started = time.perf_counter()
+                try:
+                    members = self.index.members(path)
+                except Exception as e:
+                    logger.debug("Could not prefetch %s: %s", path, e)
+                    with self._cond:
+                        self._failed.add(path)
+                else:
+                    logger.debug(
+                        "Prefetched %s members of %s in %.3fs",
+                        len(members),
+                        path,
+                        time.perf_counter() - started,
+                    )
+            with self._cond:
+                if members is not None and path in self._around:
+                    targets = [
+                        path / name for name, info in members.items() if info.is_group
+                    ]
+                    self._queue.extend(targets[: self.max_targets])
+                late = path == self._late
+                if late:
+                    self._late = None
+                self._cond.notify_all()
+            if late and members is not None and self.on_late is not None:
+                self.on_late()
@@ -0,0 +1,67 @@
+"""
+Bounded text previews of values which may be very large, such as attributes.
+"""
+import pprint
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from .utils import DEFAULT_PREVIEW_ITEMS, format_size
+
+#: Elements shown at the start and end of each axis of a summarised array
+DEFAULT_EDGE_ITEMS = 3
+
+#: Previews longer than this are cut down to their start and end
+DEFAULT_MAX_CHARS = 2000
+
+
+def describe(shape: Optional[Tuple[int, ...]], dtype: str, nbytes: int) -> str:
+    """One-line description of a value's type and size, e.g. ``float64 100x3 (2.3K)``"""
+    if shape is None:
+        dims = "empty"
+    elif not shape:
+        dims = "scalar"
+    else:
+        dims = "x".join(str(d) for d in shape)
+    return f"{dtype} {dims} ({format_size(nbytes, True)})"
+
+
+def truncate_text(text: str, max_chars=DEFAULT_MAX_CHARS) -> str:
+    """Cut out the middle of text longer than ``max_chars``"""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars // 2
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}… ({omitted} characters omitted) …{text[-tail:]}"
+
+
+def is_large(value: Any, max_items=DEFAULT_PREVIEW_ITEMS) -> bool:
+    """Whether ``preview`` would summarise this value"""
+    return isinstance(value, np.ndarray) and value.size > max_items
+
+
+def preview(
+    value: Any,
+    max_items=DEFAULT_PREVIEW_ITEMS,
+    edge_items=DEFAULT_EDGE_ITEMS,
+    max_chars=DEFAULT_MAX_CHARS,
+) -> str:
+    """Format a value for display, in bounded time and space.
+
+    Arrays with more than ``max_items`` elements are described (see ``describe``),
+    then show ``edge_items`` from each end of each axis, as NumPy does when printing;
+    only the elements shown are formatted.
+    The result is then cut down to at most about ``max_chars`` characters.
+    Smaller values are pretty-printed in full.
+    """
+    if is_large(value, max_items):
+        with np.printoptions(threshold=max_items, edgeitems=edge_items):
+            text = str(value)
+        text = describe(value.shape, str(value.dtype), value.nbytes) + "\n" + text
+    elif isinstance(value, (str, bytes)) and len(value) > max_chars:
+        # pretty-printing would wrap the whole string before it is cut down
+        text = repr(value)
+    else:
+        text = pprint.pformat(value, indent=2)
+    return truncate_text(text, max_chars)
@@ -0,0 +1,202 @@
+"""
+Per-command profiling: wall and CPU time, the process's rchar (bytes read),
+HDF5 objects opened, and time spent writing output;
+with optional cProfile dumps, and a summary of every command in a session.
+"""
+from collections import defaultdict
+import cProfile
+from contextlib import contextmanager
+from importlib import import_module
+import os
+import re
+from threading import get_ident
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from .utils import format_size
+
+#: (h5py module, function) of everything which opens an HDF5 file or object
+OPENERS = (
+    ("h5f", "open"),
+    ("h5o", "open"),
+    ("h5g", "open"),
+    ("h5d", "open"),
+    ("h5a", "open"),
+    ("h5t", "open"),
+)
+
+
+class CommandProfile(NamedTuple):
+    command: str
+    argv: Sequence[str]
+    #: seconds
+    wall: float
+    #: seconds of CPU time used by this process
+    cpu: float
+    #: bytes read by this process (see ``read_rchar``), if known
+    rchar: Optional[int]
+    objects_opened: int
+    #: seconds spent printing and writing records
+    output: float
+
+
+def read_rchar() -> Optional[int]:
+    """Bytes this process has read with read() and similar calls so far
+    (Linux's rchar), by any thread and from any file, including the OS page cache;
+    None if unknown (not on Linux).
+    """
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class OpenCounter:
+    """
+    Counts calls which open HDF5 files and objects,
+    by wrapping h5py's low-level open functions while in use.
+
+    The functions are replaced for the whole process, and restored on exit,
+    but only calls from the thread which entered the counter are counted;
+    objects opened by other threads (e.g. prefetching) or in worker processes are not.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._thread: Optional[int] = None
+        self._originals: List[tuple] = []
+
+    def _wrap(self, fn):
+        def wrapper(*args, **kwargs):
+            if get_ident() == self._thread:
+                self.count += 1
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    def __enter__(self):
+        self._thread = get_ident()
+        try:
+            for mod_name, fn_name in OPENERS:
+                mod = import_module(f"h5py.{mod_name}")
+                original = getattr(mod, fn_name)
+                self._originals.append((mod, fn_name, original))
+                setattr(mod, fn_name, self._wrap(original))
+        except BaseException:
+            self._restore()
+            raise
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        self._restore()
+
+    def _restore(self):
+        while self._originals:
+            mod, fn_name, original = self._originals.pop()
+            setattr(mod, fn_name, original)
+
+
+class Profiler:
+    """
+    Measures each command run in a session.
+
+    :param dump_dir: If given, a cProfile dump of each command is written here,
+        as ``NNN-command.prof``.
+    """
+
+    def __init__(self, dump_dir: Optional[os.PathLike] = None):
+        self.dump_dir = dump_dir
+        self.profiles: List[CommandProfile] = []
+        #: total seconds spent writing output; see ``Cli.print``
+        self.output_seconds = 0.0
+
+    def dump_path(self, command: str) -> str:
+        name = re.sub(r"[^\w.-]", "_", command)
+        return os.path.join(self.dump_dir, f"{len(self.profiles):03d}-{name}.prof")
+
+    @contextmanager
+    def measure(self, command: str, argv: Sequence[str]) -> Iterator[None]:
+        """Measure the code run in this context, and add its profile"""
+        profile = cProfile.Profile() if self.dump_dir is not None else None
+        output_before = self.output_seconds
+        rchar_before = read_rchar()
+        with OpenCounter() as opens:
+            wall_before = time.perf_counter()
+            cpu_before = time.process_time()
+            if profile is not None:
+                profile.enable()
+            try:
+                yield
+            finally:
+                if profile is not None:
+                    profile.disable()
+                wall = time.perf_counter() - wall_before
+                cpu = time.process_time() - cpu_before
+        rchar_after = read_rchar()
+        if profile is not None:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            profile.dump_stats(self.dump_path(command))
+        self.profiles.append(
+            CommandProfile(
+                command,
+                tuple(argv),
+                wall,
+                cpu,
+                None if rchar_before is None else rchar_after - rchar_before,
+                opens.count,
+                self.output_seconds - output_before,
+            )
+        )
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms"
+
+
+def _bytes(n: Optional[int]) -> str:
+    return "?" if n is None else format_size(n, True)
+
+
+def format_profile(p: CommandProfile) -> str:
+    return (
+        f"{p.command}: {_ms(p.wall)} wall, {_ms(p.cpu)} CPU, "
+        f"{_bytes(p.rchar)} process rchar, {p.objects_opened} HDF5 objects opened, "
+        f"{_ms(p.output)} output"
+    )
+
+
+def summary(profiles: Sequence[CommandProfile]) -> List[str]:
+    """Table of totals for each command, slowest first"""
+    by_command: Dict[str, List[CommandProfile]] = defaultdict(list)
+    for p in profiles:
+        by_command[p.command].append(p)
+    header = ("command", "runs", "wall", "max wall", "CPU", "rchar", "opened", "output")
+    rows = [header]
+    for command, ps in sorted(
+        by_command.items(), key=lambda item: -sum(p.wall for p in item[1])
+    ):
+        known = [p.rchar for p in ps if p.rchar is not None]
+        rows.append(
+            (
+                command,
+                str(len(ps)),
+                _ms(sum(p.wall for p in ps)),
+                _ms(max(p.wall for p in ps)),
+                _ms(sum(p.cpu for p in ps)),
+                _bytes(sum(known) if known else None),
+                str(sum(p.objects_opened for p in ps)),
+                _ms(sum(p.output for p in ps)),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return [
+        "  ".join(
+            cell.ljust(w) if i == 0 else cell.rjust(w)
+            for i, (cell, w) in enumerate(zip(row, widths))
+        )
+        for row in rows
+    ]
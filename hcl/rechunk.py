@@ -0,0 +1,449 @@
+"""
+Rewriting datasets with a new chunk layout and filters, in bounded memory.
+
+Data is read in blocks which are whole numbers of both the old and the new chunks,
+where that fits in the memory budget, so that each chunk is read and written once.
+Output chunks are written in order; where the new filter pipeline can be
+reproduced outside HDF5 (shuffle and deflate), they can be compressed
+in a pool of processes and written with ``write_direct_chunk``.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from math import gcd
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+import uuid
+import zlib
+
+from h5py import Dataset, File, Group, h5a, h5ds, h5o, h5z
+import numpy as np
+
+from .blocks import Block, block_shape, block_size, iter_blocks
+from .chunks import chunk_grid_size, get_filters
+from .utils import DEFAULT_BLOCK_BYTES
+
+#: Steps of a filter pipeline which can be run outside HDF5
+SHUFFLE = "shuffle"
+DEFLATE = "deflate"
+
+Pipeline = Tuple[Tuple[str, int], ...]
+
+#: Output chunks compressed to estimate the size of a rewritten dataset
+DEFAULT_SAMPLE_CHUNKS = 8
+
+
+class Layout(NamedTuple):
+    """Storage settings of a dataset, as reported by the commands of the same names"""
+
+    chunks: Optional[Tuple[int, ...]]
+    compression: Optional[str]
+    compression_opts: Any
+    shuffle: bool
+    scaleoffset: Optional[int]
+    fletcher32: bool
+
+    def create_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for ``Group.create_dataset``"""
+        kwargs: Dict[str, Any] = {"chunks": self.chunks}
+        if self.compression is not None:
+            kwargs["compression"] = self.compression
+            kwargs["compression_opts"] = self.compression_opts
+        if self.shuffle:
+            kwargs["shuffle"] = True
+        if self.scaleoffset is not None:
+            kwargs["scaleoffset"] = self.scaleoffset
+        if self.fletcher32:
+            kwargs["fletcher32"] = True
+        return kwargs
+
+
+def dataset_layout(dataset: Dataset) -> Layout:
+    return Layout(
+        dataset.chunks,
+        dataset.compression,
+        dataset.compression_opts,
+        dataset.shuffle,
+        dataset.scaleoffset,
+        dataset.fletcher32,
+    )
+
+
+def _scratch_file() -> File:
+    """An in-memory file which is never written to disk"""
+    return File(
+        f"hcl-scratch-{uuid.uuid4().hex}.h5", "w", driver="core", backing_store=False
+    )
+
+
+def _maxshape(dataset: Dataset) -> Optional[Tuple[Optional[int], ...]]:
+    # h5py chunks any dataset created with a maxshape, even if it is the shape
+    if dataset.maxshape == dataset.shape:
+        return None
+    return dataset.maxshape
+
+
+def _clip_chunks(chunks: Tuple[int, ...], dataset: Dataset) -> Tuple[int, ...]:
+    """Chunks no bigger than the dataset's maximum shape, as HDF5 requires"""
+    if len(chunks) != len(dataset.shape):
+        # let HDF5 report the mismatch
+        return chunks
+    out = tuple(c if m is None else min(c, m) for c, m in zip(chunks, dataset.maxshape))
+    if not all(out):
+        raise ValueError(
+            f"Cannot use chunks {chunks} for a dataset of shape {dataset.shape} "
+            f"and maximum shape {dataset.maxshape}"
+        )
+    return out
+
+
+def resolve_layout(dataset: Dataset, changes: Dict[str, Any]) -> Layout:
+    """The dataset's layout with some settings changed,
+    as HDF5 would create it (e.g. with ``chunks=True`` replaced by a chunk shape).
+
+    Chunks are clipped to the dataset's maximum shape,
+    so that one chunk shape can be given for datasets of different sizes.
+    Nothing is allocated: the dataset is created in an in-memory file.
+
+    :raises ValueError: If the settings are invalid for this dataset.
+    """
+    layout = dataset_layout(dataset)._replace(**changes)
+    if isinstance(layout.chunks, tuple):
+        layout = layout._replace(chunks=_clip_chunks(layout.chunks, dataset))
+    with _scratch_file() as f:
+        template = f.create_dataset(
+            "template",
+            shape=dataset.shape,
+            dtype=dataset.dtype,
+            maxshape=_maxshape(dataset),
+            **layout.create_kwargs(),
+        )
+        layout = dataset_layout(template)
+        if layout.chunks is not None:
+            layout = layout._replace(chunks=_clip_chunks(layout.chunks, dataset))
+        # check the dataset can be created exactly as it will be
+        _create_dataset(f, "check", dataset, layout)
+        return layout
+
+
+def _lcm(a: int, b: int) -> int:
+    return a * b // gcd(a, b)
+
+
+def read_block_shape(
+    shape: Tuple[int, ...],
+    old_chunks: Optional[Tuple[int, ...]],
+    new_chunks: Optional[Tuple[int, ...]],
+    itemsize: int,
+    max_bytes=DEFAULT_BLOCK_BYTES,
+) -> Tuple[int, ...]:
+    """Shape of the blocks to read, aligned to both chunk grids where possible.
+
+    If the smallest block aligned to both grids does not fit in ``max_bytes``,
+    blocks are aligned to the new chunks only, so that some old chunks
+    are read more than once.
+    """
+    old = old_chunks or (1,) * len(shape)
+    new = new_chunks or (1,) * len(shape)
+    both = tuple(min(_lcm(o, n), s) for o, n, s in zip(old, new, shape))
+    if int(np.prod(both, dtype=np.int64)) * itemsize <= max_bytes:
+        return block_shape(shape, both, itemsize, max_bytes)
+    return block_shape(shape, new_chunks, itemsize, max_bytes)
+
+
+def read_amplification(
+    shape: Tuple[int, ...], chunks: Optional[Tuple[int, ...]], block: Tuple[int, ...]
+) -> float:
+    """Chunk reads per source chunk, when reading the dataset in these blocks
+    without a chunk cache; 1.0 means each chunk is read once.
+    """
+    if chunks is None or not shape or not all(shape):
+        return 1.0
+    # the chunks touched by each block are a product of those touched along each axis
+    reads = 1
+    for s, c, b in zip(shape, chunks, block):
+        reads *= sum(
+            -(-min(start + b, s) // c) - start // c for start in range(0, s, b)
+        )
+    return reads / chunk_grid_size(shape, chunks)
+
+
+def chunk_pipeline(dataset: Dataset) -> Optional[Pipeline]:
+    """The dataset's filter pipeline, if it can be run outside HDF5"""
+    if dataset.dtype.kind not in "biufc" or dataset.dtype.fields is not None:
+        return None
+    if dataset.id.get_type().get_size() != dataset.dtype.itemsize:
+        return None
+    steps = []
+    for filter_id, _flags, options, _name in get_filters(dataset.id):
+        if filter_id == h5z.FILTER_SHUFFLE:
+            steps.append((SHUFFLE, dataset.dtype.itemsize))
+        elif filter_id == h5z.FILTER_DEFLATE:
+            steps.append((DEFLATE, options[0] if options else 4))
+        else:
+            return None
+    return tuple(steps)
+
+
+def encode_chunk(data: bytes, pipeline: Pipeline) -> bytes:
+    """Run a chunk's bytes through a filter pipeline, as HDF5 would"""
+    for step, option in pipeline:
+        if step == SHUFFLE:
+            if option > 1:
+                arr = np.frombuffer(data, np.uint8).reshape(-1, option)
+                data = arr.T.tobytes()
+        elif step == DEFLATE:
+            data = zlib.compress(data, option)
+    return data
+
+
+def _chunk_pieces(
+    block: Block, chunks: Tuple[int, ...]
+) -> List[Tuple[Tuple[int, ...], Block]]:
+    """(offset in the dataset, selection within the block) of each chunk in a block"""
+    out = []
+    for piece in iter_blocks(block_size(block), chunks):
+        offset = tuple(sl.start + p.start for sl, p in zip(block, piece))
+        out.append((offset, piece))
+    return out
+
+
+def _is_fill(arr: np.ndarray, fill) -> bool:
+    if arr.dtype.hasobject:
+        return False
+    return bool(np.all(arr == fill))
+
+
+def _padded(arr: np.ndarray, chunks: Tuple[int, ...], fill) -> np.ndarray:
+    if arr.shape == chunks:
+        return np.ascontiguousarray(arr)
+    out = np.full(chunks, fill, arr.dtype)
+    out[tuple(slice(0, n) for n in arr.shape)] = arr
+    return out
+
+
+def rewrite_data(
+    src: Dataset,
+    dst: Dataset,
+    block: Tuple[int, ...],
+    jobs=1,
+    progress: Optional[Callable[[int], None]] = None,
+):
+    """Copy the values of ``src`` into a new, empty ``dst`` (same shape and dtype),
+    block by block.
+
+    Blocks (or chunks) which only hold the fill value are not written,
+    so they stay unallocated.
+
+    With ``jobs > 1``, if the pipeline of ``dst`` can be run outside HDF5,
+    its chunks are compressed in that many processes
+    while the next block is read, and written in order.
+    """
+    if src.shape is None:
+        return
+    if not src.shape:
+        dst[()] = src[()]
+        return
+    if progress is None:
+        progress = _ignore
+    pipeline = chunk_pipeline(dst) if jobs > 1 and dst.chunks is not None else None
+    if pipeline is None:
+        for sl in iter_blocks(src.shape, block):
+            arr = src[sl]
+            _write_block(dst, sl, arr)
+            progress(arr.nbytes)
+        return
+
+    chunks = dst.chunks
+    fill = dst.fillvalue
+    with ProcessPoolExecutor(jobs) as pool:
+        pending: Deque = deque()
+        for sl in iter_blocks(src.shape, block):
+            arr = src[sl]
+            futures = [
+                (
+                    offset,
+                    pool.submit(
+                        encode_chunk,
+                        _padded(arr[piece], chunks, fill).tobytes(),
+                        pipeline,
+                    ),
+                )
+                for offset, piece in _chunk_pieces(sl, chunks)
+                if not _is_fill(arr[piece], fill)
+            ]
+            pending.append((futures, arr.nbytes))
+            # read the next block while this one is compressed
+            while len(pending) > 1:
+                _write_chunks(dst, *pending.popleft(), progress)
+        while pending:
+            _write_chunks(dst, *pending.popleft(), progress)
+
+
+def _write_block(dst: Dataset, block: Block, arr: np.ndarray):
+    """Write a block, leaving out any of its chunks which only hold the fill value"""
+    fill = dst.fillvalue
+    if dst.chunks is None:
+        if not _is_fill(arr, fill):
+            dst[block] = arr
+        return
+    pieces = _chunk_pieces(block, dst.chunks)
+    written = [piece for _, piece in pieces if not _is_fill(arr[piece], fill)]
+    if len(written) == len(pieces):
+        dst[block] = arr
+        return
+    for piece in written:
+        dst[
+            tuple(
+                slice(b.start + p.start, b.start + p.stop) for b, p in zip(block, piece)
+            )
+        ] = arr[piece]
+
+
+def _write_chunks(dst: Dataset, futures, n_bytes: int, progress):
+    for offset, future in futures:
+        dst.id.write_direct_chunk(offset, future.result())
+    progress(n_bytes)
+
+
+def _ignore(_n_bytes: int):
+    pass
+
+
+def copy_attrs(src, dst):
+    """Copy all attributes, keeping their dtypes and shapes"""
+    for name in src.attrs:
+        aid = h5a.open(src.id, name.encode("utf-8"))
+        dst.attrs.create(name, src.attrs[name], shape=aid.shape, dtype=aid.dtype)
+
+
+def _create_dataset(parent: Group, name: str, src: Dataset, layout: Layout) -> Dataset:
+    return parent.create_dataset(
+        name,
+        shape=src.shape,
+        dtype=src.dtype,
+        maxshape=_maxshape(src),
+        fillvalue=src.fillvalue,
+        **layout.create_kwargs(),
+    )
+
+
+def create_like(parent: Group, name: str, src: Dataset, layout: Layout) -> Dataset:
+    """Create an empty dataset like ``src``, but with the given layout"""
+    dst = _create_dataset(parent, name, src, layout)
+    copy_attrs(src, dst)
+    return dst
+
+
+def hard_link_count(obj) -> int:
+    return h5o.get_info(obj.id).rc
+
+
+def uses_dimension_scales(dset: Dataset) -> bool:
+    """Whether the dataset is a dimension scale, or has scales attached;
+    either way, other datasets refer to it by reference
+    """
+    if h5ds.is_scale(dset.id):
+        return True
+    return any(h5ds.get_num_scales(dset.id, axis) for axis in range(dset.ndim))
+
+
+def replace_dataset(
+    src: Dataset, layout: Layout, block: Tuple[int, ...], jobs=1, progress=None
+) -> Dataset:
+    """Rewrite a dataset in place, under a temporary name, then swap it in.
+
+    Object references to the old dataset are left dangling,
+    which is why callers check ``hard_link_count`` and ``uses_dimension_scales``.
+    """
+    parent = src.parent
+    name = src.name.rsplit("/", 1)[-1]
+    tmp_name = f".{name}.rechunk-{uuid.uuid4().hex[:8]}"
+    dst = create_like(parent, tmp_name, src, layout)
+    try:
+        rewrite_data(src, dst, block, jobs, progress)
+    except BaseException:
+        del parent[tmp_name]
+        raise
+    del parent[name]
+    parent.move(tmp_name, name)
+    return parent[name]
+
+
+class Estimate(NamedTuple):
+    #: bytes allocated now
+    current: int
+    #: estimated bytes allocated after rewriting
+    estimated: int
+    block: Tuple[int, ...]
+    read_amplification: float
+
+
+def _sample_offsets(
+    shape: Tuple[int, ...], chunks: Tuple[int, ...], n: int
+) -> List[Tuple[int, ...]]:
+    grid = [-(-s // c) for s, c in zip(shape, chunks)]
+    total = int(np.prod(grid, dtype=np.int64))
+    indices = np.unique(np.linspace(0, total - 1, min(n, total)).astype(np.int64))
+    return [
+        tuple(int(i) * c for i, c in zip(np.unravel_index(idx, grid), chunks))
+        for idx in indices
+    ]
+
+
+def estimate(
+    src: Dataset,
+    layout: Layout,
+    max_bytes=DEFAULT_BLOCK_BYTES,
+    n_samples=DEFAULT_SAMPLE_CHUNKS,
+) -> Estimate:
+    """Estimate the storage of a rewritten dataset,
+    by writing a sample of its new chunks to an in-memory file.
+    """
+    itemsize = src.dtype.itemsize
+    current = src.id.get_storage_size()
+    if src.shape is None or not src.shape or not src.size:
+        return Estimate(current, current, src.shape or (), 1.0)
+    block = read_block_shape(src.shape, src.chunks, layout.chunks, itemsize, max_bytes)
+    amplification = read_amplification(src.shape, src.chunks, block)
+    if layout.chunks is None:
+        return Estimate(current, src.size * itemsize, block, amplification)
+
+    offsets = _sample_offsets(src.shape, layout.chunks, n_samples)
+    sampled = 0
+    with _scratch_file() as f:
+        for i, offset in enumerate(offsets):
+            sl = tuple(
+                slice(o, min(o + c, s))
+                for o, c, s in zip(offset, layout.chunks, src.shape)
+            )
+            sample = f.create_dataset(
+                str(i),
+                shape=layout.chunks,
+                dtype=src.dtype,
+                fillvalue=src.fillvalue,
+                **layout.create_kwargs(),
+            )
+            sample[tuple(slice(0, s.stop - s.start) for s in sl)] = src[sl]
+            sampled += sample.id.get_storage_size()
+    n_chunks = chunk_grid_size(src.shape, layout.chunks)
+    return Estimate(current, sampled * n_chunks // len(offsets), block, amplification)
+
+
+def describe_layout(layout: Layout) -> str:
+    """e.g. ``chunks 100x100, gzip(4)+shuffle``"""
+    if layout.chunks is None:
+        chunks = "contiguous"
+    else:
+        chunks = "chunks " + "x".join(str(c) for c in layout.chunks)
+    filters = []
+    if layout.shuffle:
+        filters.append("shuffle")
+    if layout.scaleoffset is not None:
+        filters.append(f"scaleoffset({layout.scaleoffset})")
+    if layout.compression is not None:
+        opts = layout.compression_opts
+        filters.append(
+            layout.compression if opts is None else f"{layout.compression}({opts})"
+        )
+    if layout.fletcher32:
+        filters.append("fletcher32")
+    return f"{chunks}, {'+'.join(filters) or 'no filters'}"
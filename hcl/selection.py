@@ -0,0 +1,134 @@
+"""
+Parsing and normalising NumPy-style selections like ``ds[100:200, ::10, 3]``.
+"""
+import ast
+from typing import Tuple, Union
+
+import numpy as np
+
+Index = Union[int, slice]
+Selection = Tuple[Index, ...]
+
+
+def _literal_int(node) -> int:
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_literal_int(node.operand)
+    value = ast.literal_eval(node)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"Not an integer index: {ast.dump(node)}")
+    return value
+
+
+def _parse_index(node):
+    if isinstance(node, ast.Slice):
+        bounds = (node.lower, node.upper, node.step)
+        return slice(*(None if n is None else _literal_int(n) for n in bounds))
+    if isinstance(node, ast.Constant) and node.value is Ellipsis:
+        return Ellipsis
+    # python < 3.9
+    if hasattr(ast, "Index") and isinstance(node, ast.Index):
+        return _parse_index(node.value)
+    return _literal_int(node)
+
+
+def parse_selection(s: str) -> Tuple[str, tuple]:
+    """Split a string like ``path/to/ds[:10, 3]`` into the path and the raw selection.
+
+    A string with no brackets selects the whole dataset.
+    Only integers, slices and ``...`` are allowed.
+    """
+    s = s.strip()
+    if not s.endswith("]"):
+        return s, ()
+    try:
+        bracket = s.index("[")
+    except ValueError:
+        raise ValueError(f"Unmatched ']' in selection: {s}")
+    path = s[:bracket].rstrip()
+    try:
+        node = ast.parse("_" + s[bracket:], mode="eval").body
+    except SyntaxError:
+        raise ValueError(f"Could not parse selection: {s[bracket:]}")
+    sl = node.slice
+    if hasattr(ast, "ExtSlice") and isinstance(sl, ast.ExtSlice):
+        # python < 3.9
+        items = sl.dims
+    elif isinstance(sl, ast.Tuple):
+        items = sl.elts
+    elif (
+        hasattr(ast, "Index")
+        and isinstance(sl, ast.Index)
+        and isinstance(sl.value, ast.Tuple)
+    ):
+        items = sl.value.elts
+    else:
+        items = [sl]
+    return path, tuple(_parse_index(n) for n in items)
+
+
+def normalise_selection(selection: tuple, shape: Tuple[int, ...]) -> Selection:
+    """Expand ellipses and missing trailing axes,
+    and make all indices and slice bounds explicit and non-negative.
+
+    :raises IndexError: for out-of-range indices or too many indices.
+    :raises ValueError: for non-positive steps, which HDF5 does not support.
+    """
+    n_ellipsis = sum(idx is Ellipsis for idx in selection)
+    if n_ellipsis > 1:
+        raise IndexError("Selection can only contain one ellipsis")
+    n_explicit = len(selection) - n_ellipsis
+    if n_explicit > len(shape):
+        raise IndexError(f"Too many indices ({n_explicit}) for {len(shape)}D dataset")
+
+    expanded = []
+    for idx in selection:
+        if idx is Ellipsis:
+            expanded.extend([slice(None)] * (len(shape) - n_explicit))
+        else:
+            expanded.append(idx)
+    expanded.extend([slice(None)] * (len(shape) - len(expanded)))
+
+    out = []
+    for ax, (idx, n) in enumerate(zip(expanded, shape)):
+        if isinstance(idx, slice):
+            if idx.step is not None and idx.step <= 0:
+                raise ValueError(f"Slice step must be positive, got {idx.step}")
+            out.append(slice(*idx.indices(n)))
+        else:
+            if not -n <= idx < n:
+                raise IndexError(f"Index {idx} out of range for axis {ax} of size {n}")
+            out.append(idx % n)
+    return tuple(out)
+
+
+def selection_shape(selection: Selection) -> Tuple[int, ...]:
+    """Shape of the array resulting from a normalised selection"""
+    return tuple(
+        len(range(idx.start, idx.stop, idx.step))
+        for idx in selection
+        if isinstance(idx, slice)
+    )
+
+
+def read_selection(dataset, selection: tuple) -> np.ndarray:
+    """Read only the given selection of the dataset, into a new array of exactly its shape"""
+    selection = normalise_selection(selection, dataset.shape)
+    if dataset.dtype.kind == "O":
+        # variable-length data can't be read into a preallocated buffer
+        return np.asarray(dataset[selection])
+    out = np.empty(selection_shape(selection), dataset.dtype)
+    if out.size:
+        dataset.read_direct(out, selection or None)
+    return out
+
+
+def format_selection(selection: Selection) -> str:
+    """Format a normalised selection as NumPy-style indices, e.g. ``[0:10, 3]``"""
+    parts = []
+    for idx in selection:
+        if isinstance(idx, slice):
+            step = "" if idx.step == 1 else f":{idx.step}"
+            parts.append(f"{idx.start}:{idx.stop}{step}")
+        else:
+            parts.append(str(idx))
+    return "[" + ", ".join(parts) + "]"
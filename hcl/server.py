@@ -0,0 +1,371 @@
+"""
+A long-lived server which keeps a file open (``hcl FILE --serve``),
+and the thin client which forwards ``--command`` to it (``hcl FILE --client -c ...``).
+
+The server listens on a UNIX socket which only its user can use.
+Each connection carries one request: a JSON line of
+``{"command", "gpath", "format", "cwd", "isatty", "columns"}``,
+where ``isatty`` and ``columns`` describe the client's stdout,
+so that commands write to it as they would locally.
+The server replies with frames of a 1-byte channel,
+a 4-byte big-endian length and a payload:
+``o`` and ``e`` carry stdout and stderr bytes, as they are written;
+``x`` ends the reply with the exit status (in ASCII);
+``b`` means the server is busy, so the client should run the command itself.
+
+Commands run one at a time, in the server's Cli, so caches stay warm between them.
+"""
+from contextlib import nullcontext
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import stat
+import struct
+import sys
+import tempfile
+from threading import BoundedSemaphore, Lock, Thread
+import time
+from typing import Callable, Optional
+
+from .cli import Cli
+from .utils import H5Path, Signal
+
+logger = logging.getLogger(__name__)
+
+STDOUT = b"o"
+STDERR = b"e"
+EXIT = b"x"
+BUSY = b"b"
+
+_HEADER = struct.Struct(">cI")
+
+#: Seconds without requests after which the server stops
+DEFAULT_IDLE_TIMEOUT = 600.0
+
+#: Clients which may be connected at once; others run commands themselves
+DEFAULT_MAX_CLIENTS = 8
+
+#: Seconds a client has to send its request
+REQUEST_TIMEOUT = 10.0
+
+#: Seconds between checks for the idle timeout
+POLL_INTERVAL = 1.0
+
+
+def default_socket_dir() -> str:
+    """$HCL_SOCKET_DIR, or $XDG_RUNTIME_DIR/hcl, or a per-user temporary directory"""
+    path = os.environ.get("HCL_SOCKET_DIR")
+    if path:
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "hcl")
+    return os.path.join(tempfile.gettempdir(), f"hcl-{os.getuid()}")
+
+
+def check_socket_dir(path: str, create=False):
+    """Check that only this user can use the directory,
+    so that nobody else controls which socket is in it.
+
+    :param create: Create the directory (with mode 0700) if it does not exist.
+    :raises PermissionError: If the directory is not safe to use.
+    """
+    if create:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if (
+        not stat.S_ISDIR(st.st_mode)
+        or st.st_uid != os.getuid()
+        or stat.S_IMODE(st.st_mode) != 0o700
+    ):
+        raise PermissionError(
+            f"Not using socket directory {path}: "
+            "it must be a directory owned by you, with mode 0700"
+        )
+
+
+def default_socket_path(fpath: os.PathLike) -> str:
+    """Socket for serving this file, keyed by its real path"""
+    real = os.path.realpath(fpath).encode("utf-8", "surrogateescape")
+    return os.path.join(
+        default_socket_dir(), hashlib.sha1(real).hexdigest()[:16] + ".sock"
+    )
+
+
+def _send_frame(conn: socket.socket, channel: bytes, payload: bytes):
+    conn.sendall(_HEADER.pack(channel, len(payload)) + payload)
+
+
+def run_client(
+    socket_path: str, command: str, gpath="/", output_format="text"
+) -> Optional[int]:
+    """Run a command line on the server, streaming its output to stdout and stderr.
+
+    :return: The exit status, or None if no server is listening,
+        or it is too busy, so the command should be run locally.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        logger.debug("No server at %s: %s", socket_path, e)
+        sock.close()
+        return None
+
+    request = {
+        "command": command,
+        "gpath": gpath,
+        "format": output_format,
+        "cwd": os.getcwd(),
+        "isatty": sys.stdout.isatty(),
+        "columns": shutil.get_terminal_size().columns,
+    }
+    with sock, sock.makefile("rb") as reader:
+        try:
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        except OSError:
+            # a busy server may already have replied and closed the connection
+            pass
+        while True:
+            header = reader.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                print("hcl server closed the connection", file=sys.stderr)
+                return 1
+            channel, length = _HEADER.unpack(header)
+            payload = reader.read(length)
+            if channel == STDOUT:
+                try:
+                    sys.stdout.buffer.write(payload)
+                    sys.stdout.buffer.flush()
+                except BrokenPipeError:
+                    # e.g. piped into head; stop quietly, as on SIGPIPE
+                    devnull = os.open(os.devnull, os.O_WRONLY)
+                    os.dup2(devnull, sys.stdout.fileno())
+                    return 1
+            elif channel == STDERR:
+                sys.stderr.buffer.write(payload)
+                sys.stderr.buffer.flush()
+            elif channel == EXIT:
+                return int(payload)
+            elif channel == BUSY:
+                logger.debug("Server at %s is busy", socket_path)
+                return None
+
+
+class _Channel:
+    """
+    Text and binary stream which sends what is written to a client.
+
+    Stands in for ``sys.stdout`` (or ``sys.stderr``), and its ``buffer``.
+
+    :param tty: Whether the client's stream is a terminal.
+    """
+
+    encoding = "utf-8"
+
+    def __init__(self, send: Callable[[bytes, bytes], None], channel: bytes, tty=False):
+        self._send = send
+        self._channel = channel
+        self._tty = tty
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            self._send(self._channel, data.encode("utf-8", "surrogateescape"))
+        else:
+            self._send(self._channel, bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self) -> bool:
+        return self._tty
+
+    def fileno(self) -> int:
+        # prompt_toolkit then assumes the default terminal size
+        raise io.UnsupportedOperation("fileno")
+
+    @property
+    def buffer(self):
+        return self
+
+
+def _terminal_session(stdout: _Channel):
+    """prompt_toolkit session printing to this client's terminal, if it has one;
+    otherwise prompt_toolkit would keep printing to the first client's.
+    """
+    if not stdout.isatty():
+        return nullcontext()
+    from prompt_toolkit.application import create_app_session
+    from prompt_toolkit.output import create_output
+
+    return create_app_session(output=create_output(stdout))
+
+
+class Server:
+    """
+    Serves commands on a read-only file, over a UNIX socket.
+
+    If the file changes on disk (by size or modification time),
+    it is reopened and the index is cleared before the next command.
+
+    :param cli: Entered Cli, with the file opened read-only.
+    :param socket_path: Socket to listen on; its directory is created if needed.
+    :param idle_timeout: Stop after this many seconds without requests;
+        0 or None to never stop.
+    :param max_clients: Clients which may be connected at once;
+        others are told the server is busy.
+    """
+
+    def __init__(
+        self,
+        cli: Cli,
+        socket_path: str,
+        idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT,
+        max_clients=DEFAULT_MAX_CLIENTS,
+    ):
+        if cli.writable:
+            raise ValueError("Only files opened read-only can be served")
+        self.cli = cli
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self._slots = BoundedSemaphore(max_clients)
+        self._lock = Lock()
+        self._n_active = 0
+        self._active_lock = Lock()
+        self._last_active = time.monotonic()
+        self._stat = self._file_stat()
+
+    def _file_stat(self):
+        st = os.stat(self.cli.fpath)
+        return st.st_size, st.st_mtime_ns
+
+    def _bind(self) -> socket.socket:
+        os.makedirs(os.path.dirname(self.socket_path) or ".", mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # left behind by a server which did not stop cleanly
+                os.unlink(self.socket_path)
+            else:
+                raise FileExistsError(f"Already being served at {self.socket_path}")
+            finally:
+                probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        sock.listen()
+        sock.settimeout(POLL_INTERVAL)
+        return sock
+
+    def _idle(self) -> bool:
+        if not self.idle_timeout:
+            return False
+        with self._active_lock:
+            return (
+                self._n_active == 0
+                and time.monotonic() - self._last_active > self.idle_timeout
+            )
+
+    def serve(self):
+        """Accept clients until the idle timeout, or KeyboardInterrupt"""
+        sock = self._bind()
+        logger.info("Serving %s at %s", self.cli.fpath, self.socket_path)
+        try:
+            while not self._idle():
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+                if not self._slots.acquire(blocking=False):
+                    with conn:
+                        _send_frame(conn, BUSY, b"")
+                    continue
+                with self._active_lock:
+                    self._n_active += 1
+                Thread(target=self._handle, args=(conn,), daemon=True).start()
+            logger.info("No requests for %ss; stopping", self.idle_timeout)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.unlink(self.socket_path)
+
+    def _handle(self, conn: socket.socket):
+        try:
+            with conn:
+                conn.settimeout(REQUEST_TIMEOUT)
+                with conn.makefile("rb") as reader:
+                    line = reader.readline()
+                if not line:
+                    # e.g. another server checking whether this one is running
+                    return
+                request = json.loads(line)
+                conn.settimeout(None)
+
+                def send(channel: bytes, payload: bytes):
+                    _send_frame(conn, channel, payload)
+
+                with self._lock:
+                    status = self._run(request, send)
+                send(EXIT, str(status).encode("ascii"))
+        except (OSError, ValueError) as e:
+            # e.g. the client went away
+            logger.warning("Request failed: %s", e)
+        finally:
+            with self._active_lock:
+                self._n_active -= 1
+                self._last_active = time.monotonic()
+            self._slots.release()
+
+    def _run(self, request: dict, send: Callable[[bytes, bytes], None]) -> int:
+        tty = bool(request.get("isatty"))
+        stdout = _Channel(send, STDOUT, tty)
+        stderr = _Channel(send, STDERR)
+        old_cwd = os.getcwd()
+        old_streams = sys.stdout, sys.stderr
+        old_interactive = self.cli.interactive
+        old_columns = os.environ.get("COLUMNS")
+        sys.stdout, sys.stderr = stdout, stderr
+        # as decided in __main__ for a local --command
+        self.cli.interactive = tty
+        if request.get("columns"):
+            # for shutil.get_terminal_size
+            os.environ["COLUMNS"] = str(request["columns"])
+        try:
+            self._check_file()
+            os.chdir(request.get("cwd") or old_cwd)
+            self.cli.set_output_format(request.get("format") or "text")
+            self.cli.change_group(H5Path(request.get("gpath") or "/"))
+            with _terminal_session(stdout):
+                result = self.cli.run_line(request["command"])
+            return 1 if result == Signal.FAILURE else 0
+        except Exception as e:
+            logger.debug("Request %s failed", request, exc_info=True)
+            print(f"{type(e).__name__}: {e}", file=stderr)
+            return 1
+        finally:
+            sys.stdout, sys.stderr = old_streams
+            self.cli.interactive = old_interactive
+            if old_columns is None:
+                os.environ.pop("COLUMNS", None)
+            else:
+                os.environ["COLUMNS"] = old_columns
+            os.chdir(old_cwd)
+
+    def _check_file(self):
+        stat = self._file_stat()
+        if stat != self._stat:
+            logger.info("%s has changed; reopening", self.cli.fpath)
+            self.cli.reopen(self.cli.access)
+            self.cli.index.invalidate()
+            self._stat = stat
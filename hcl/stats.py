@@ -0,0 +1,199 @@
+"""
+Summary statistics of datasets, computed block by block with bounded memory.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Any, Iterable, Iterator, Optional, Tuple
+
+from h5py import File
+import numpy as np
+
+from .blocks import Block, BlockReader, block_shape, iter_blocks
+from .utils import H5Path, split_batches
+
+STAT_NAMES = ("count", "min", "max", "mean", "std", "nan", "fill")
+
+
+def check_dtype(dtype: np.dtype):
+    if dtype.kind not in "biuf":
+        raise TypeError(f"Cannot compute statistics of dtype {dtype}")
+
+
+def output_region(block: Block, axis: Optional[int]) -> Block:
+    """Region of the output which the reduction of a block covers"""
+    if axis is None:
+        return ()
+    return block[:axis] + block[axis + 1 :]
+
+
+def reduce_block(data: np.ndarray, axis: Optional[int], fillvalue: Any) -> dict:
+    """Partial statistics of one block, reduced over the given axis (or all axes).
+
+    ``count``, ``mean`` and ``m2`` (sum of squared deviations from the mean)
+    exclude NaNs.
+    """
+    if data.dtype.kind == "b":
+        data = data.view(np.uint8)
+
+    if data.dtype.kind == "f":
+        valid = ~np.isnan(data)
+        total = np.sum(data, axis, dtype=np.float64, where=valid)
+        nans = np.count_nonzero(~valid, axis)
+        minimum = np.fmin.reduce(data, axis)
+        maximum = np.fmax.reduce(data, axis)
+    else:
+        valid = True
+        total = np.sum(data, axis, dtype=np.float64)
+        nans = np.zeros(np.shape(total), np.int64)
+        minimum = np.min(data, axis)
+        maximum = np.max(data, axis)
+
+    n = data.size if axis is None else data.shape[axis]
+    count = n - nans
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, total / count, 0.0)
+    deviation = data - (mean if axis is None else np.expand_dims(mean, axis))
+    m2 = np.sum(np.square(deviation), axis, dtype=np.float64, where=valid)
+
+    if fillvalue is not None and np.isnan(fillvalue):
+        fills = nans
+    else:
+        fills = np.count_nonzero(data == fillvalue, axis)
+
+    return {
+        "count": np.asarray(count, np.int64),
+        "mean": np.asarray(mean),
+        "m2": np.asarray(m2),
+        "min": np.asarray(minimum),
+        "max": np.asarray(maximum),
+        "nan": np.asarray(nans, np.int64),
+        "fill": np.asarray(fills, np.int64),
+    }
+
+
+class RunningStats:
+    """
+    Statistics merged from any number of partial results.
+
+    :param shape: Shape of the output: () for a full reduction,
+        or the dataset's shape without the reduced axis.
+    :param dtype: dtype of the data, for the min and max.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype: np.dtype):
+        if dtype.kind == "b":
+            dtype = np.dtype(np.uint8)
+        self.count = np.zeros(shape, np.int64)
+        self.mean = np.zeros(shape, np.float64)
+        self.m2 = np.zeros(shape, np.float64)
+        if dtype.kind == "f":
+            self.min = np.full(shape, np.nan, dtype)
+            self.max = np.full(shape, np.nan, dtype)
+        else:
+            self.min = np.full(shape, np.iinfo(dtype).max, dtype)
+            self.max = np.full(shape, np.iinfo(dtype).min, dtype)
+        self.nan = np.zeros(shape, np.int64)
+        self.fill = np.zeros(shape, np.int64)
+
+    def add(self, region: Block, partial: dict):
+        """Merge partial statistics into the given region of the output,
+        using Chan et al.'s parallel algorithm for the mean and variance.
+        """
+        n_a = self.count[region]
+        n_b = partial["count"]
+        n = n_a + n_b
+        delta = partial["mean"] - self.mean[region]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.where(n > 0, n_b / n, 0.0)
+        self.m2[region] += partial["m2"] + delta**2 * n_a * frac
+        self.mean[region] += delta * frac
+        self.count[region] = n
+        self.min[region] = np.fmin(self.min[region], partial["min"])
+        self.max[region] = np.fmax(self.max[region], partial["max"])
+        self.nan[region] += partial["nan"]
+        self.fill[region] += partial["fill"]
+
+    @property
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(np.where(self.count > 0, self.m2 / self.count, np.nan))
+
+    def results(self) -> dict:
+        mean = np.where(self.count > 0, self.mean, np.nan)
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": mean,
+            "std": self.std,
+            "nan": self.nan,
+            "fill": self.fill,
+        }
+
+
+def iter_partials(
+    reader: BlockReader, blocks: Iterable[Block], axis: Optional[int]
+) -> Iterator[Tuple[Block, dict]]:
+    """Output region and partial statistics for each of the given blocks"""
+    fillvalue = reader.dataset.fillvalue
+    for source in blocks:
+        data = reader.read(source)
+        yield output_region(source, axis), reduce_block(data, axis, fillvalue)
+
+
+def _reduce_blocks_worker(fpath, path, blocks, block, axis):
+    with File(fpath, "r") as f:
+        reader = BlockReader(f[str(path)], block)
+        return list(iter_partials(reader, blocks, axis)), reader.bytes_read
+
+
+def dataset_stats(
+    dataset,
+    axis: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    jobs: int = 1,
+    fpath: Optional[os.PathLike] = None,
+) -> Tuple[RunningStats, int]:
+    """Compute statistics of a dataset in chunk-aligned blocks.
+
+    :param axis: Reduce over this axis only, rather than over the whole dataset.
+    :param max_bytes: Approximate memory budget per process for raw data.
+    :param jobs: If more than 1, read and reduce blocks in this many processes,
+        each of which opens the file at ``fpath`` read-only.
+    :return: The statistics, and the number of bytes read.
+    """
+    check_dtype(dataset.dtype)
+    shape = dataset.shape
+    if axis is not None:
+        if not -len(shape) <= axis < len(shape):
+            raise ValueError(f"Axis {axis} out of range for {len(shape)}D dataset")
+        axis %= len(shape)
+        out_shape = shape[:axis] + shape[axis + 1 :]
+    else:
+        out_shape = ()
+
+    kwargs = {} if max_bytes is None else {"max_bytes": max_bytes}
+    block = block_shape(shape, dataset.chunks, dataset.dtype.itemsize, **kwargs)
+    running = RunningStats(out_shape, dataset.dtype)
+
+    if jobs > 1:
+        batches = split_batches(list(iter_blocks(shape, block)), jobs * 4)
+        bytes_read = 0
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [
+                pool.submit(
+                    _reduce_blocks_worker, fpath, H5Path(dataset.name), b, block, axis
+                )
+                for b in batches
+            ]
+            for fut in futures:
+                partials, n_bytes = fut.result()
+                bytes_read += n_bytes
+                for region, partial in partials:
+                    running.add(region, partial)
+        return running, bytes_read
+
+    reader = BlockReader(dataset, block)
+    for region, partial in iter_partials(reader, iter_blocks(shape, block), axis):
+        running.add(region, partial)
+    return running, reader.bytes_read
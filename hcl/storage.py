@@ -0,0 +1,79 @@
+"""
+Storage accounting for datasets, from HDF5 metadata only.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from h5py import File, h5d
+
+from .utils import H5Path, split_batches
+
+
+class StorageInfo(NamedTuple):
+    allocated: int
+    logical: int
+    n_chunks: Optional[int] = None
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """Logical size / allocated size; None if nothing is allocated."""
+        if not self.allocated:
+            return None
+        return self.logical / self.allocated
+
+
+def sum_storage(infos: Iterable[StorageInfo]) -> StorageInfo:
+    allocated = 0
+    logical = 0
+    n_chunks = None
+    for info in infos:
+        allocated += info.allocated
+        logical += info.logical
+        if info.n_chunks is not None:
+            n_chunks = (n_chunks or 0) + info.n_chunks
+    return StorageInfo(allocated, logical, n_chunks)
+
+
+def read_storage(dsid: h5d.DatasetID) -> StorageInfo:
+    """Get storage information for an open low-level dataset, without reading data"""
+    shape = dsid.shape
+    n_elements = 0
+    if shape is not None:
+        n_elements = 1
+        for s in shape:
+            n_elements *= s
+
+    n_chunks = None
+    if dsid.get_create_plist().get_layout() == h5d.CHUNKED:
+        n_chunks = dsid.get_num_chunks()
+
+    return StorageInfo(
+        dsid.get_storage_size(), n_elements * dsid.dtype.itemsize, n_chunks
+    )
+
+
+def read_storage_paths(
+    fpath: os.PathLike, paths: Sequence[H5Path]
+) -> List[StorageInfo]:
+    """Open the file read-only and get storage information for the given datasets"""
+    with File(fpath, "r") as f:
+        return [read_storage(h5d.open(f.id, str(p).encode())) for p in paths]
+
+
+def read_storage_parallel(
+    fpath: os.PathLike, paths: Sequence[H5Path], jobs: int
+) -> List[StorageInfo]:
+    """Get storage information for many datasets using a pool of processes.
+
+    Each process opens the file independently, so it must be readable
+    and up to date on disk.
+    """
+    paths = list(paths)
+    # a few batches per process, so that one slow batch doesn't hold up the rest
+    batches = split_batches(paths, jobs * 4)
+    out: List[StorageInfo] = []
+    with ProcessPoolExecutor(jobs) as pool:
+        for result in pool.map(read_storage_paths, [fpath] * len(batches), batches):
+            out.extend(result)
+    return out
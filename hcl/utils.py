@@ -1,23 +1,35 @@
+from collections import OrderedDict
 from pathlib import PurePosixPath as H5Path
-from typing import List, Union, Iterable
+from typing import TYPE_CHECKING, List, Union, Sequence
 from enum import Enum, auto
 
-from h5py import File, Group, Dataset
+# h5py and prompt_toolkit are slow to import, so are only imported when used
+if TYPE_CHECKING:
+    from h5py import File, Group, Dataset
 
-from prompt_toolkit.completion import Completion, Completer
+ObjectType = Union["File", "Group", "Dataset"]
 
-ObjectType = Union[File, Group, Dataset]
+DEFAULT_BLOCK_BYTES = 64 * 2**20
+
+#: Values with more elements than this are previewed rather than shown in full
+DEFAULT_PREVIEW_ITEMS = 100
 
 
 def is_file(obj):
+    from h5py import File
+
     return isinstance(obj, File)
 
 
 def is_group(obj):
+    from h5py import Group
+
     return isinstance(obj, Group)
 
 
 def is_dataset(obj):
+    from h5py import Dataset
+
     return isinstance(obj, Dataset)
 
 
@@ -51,6 +63,13 @@ def normalise_path(
     return out
 
 
+def relative_name(path: H5Path, root: H5Path) -> str:
+    """Path relative to ``root``, which it is at or below; '.' for the root itself"""
+    if path == root:
+        return "."
+    return str(path.relative_to(root))
+
+
 def obj_name(obj: ObjectType) -> str:
     stripped = obj.name.strip("/")
     if not stripped:
@@ -59,6 +78,73 @@ def obj_name(obj: ObjectType) -> str:
     return stripped.split("/")[-1]
 
 
+def format_size(n_bytes: int, human=False) -> str:
+    """Format a number of bytes, optionally with a binary unit suffix (K, M, G...)"""
+    if not human:
+        return str(n_bytes)
+    size = float(n_bytes)
+    for unit in "BKMGTP":
+        if abs(size) < 1024 or unit == "P":
+            break
+        size /= 1024
+    if unit == "B":
+        return f"{n_bytes}B"
+    return f"{size:.1f}{unit}" if abs(size) < 10 else f"{size:.0f}{unit}"
+
+
+_SIZE_UNITS = {
+    "": 1,
+    "B": 1,
+    "K": 2**10,
+    "M": 2**20,
+    "G": 2**30,
+    "T": 2**40,
+    "P": 2**50,
+}
+
+
+def parse_size(s: str) -> int:
+    """Parse a number of bytes, optionally with a binary unit suffix like 1.5M or 2GiB"""
+    stripped = s.strip().upper()
+    for suffix in ("IB", "B"):
+        if stripped.endswith(suffix) and len(stripped) > len(suffix):
+            stripped = stripped[: -len(suffix)]
+            break
+    unit = stripped[-1:] if stripped[-1:].isalpha() else ""
+    try:
+        return int(float(stripped[: len(stripped) - len(unit)]) * _SIZE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ValueError(f"Not a valid size: '{s}'")
+
+
+def split_batches(items: Sequence, n_batches: int) -> List[Sequence]:
+    """Split a sequence into at most ``n_batches`` contiguous, similarly-sized batches"""
+    size = max(1, -(-len(items) // max(1, n_batches)))
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+class LRUDict(OrderedDict):
+    """Dict which forgets its least recently used items beyond ``max_size``.
+
+    Getting or setting an item counts as using it; ``in`` does not.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
+
+
 # TODO: consider replacing with OS signals
 class Signal(Enum):
     SUCCESS = auto()
@@ -66,56 +152,10 @@ class Signal(Enum):
     QUIT = auto()
 
 
-class H5PathCompleter(Completer):
-    """
-    Complete for Path variables.
-    :param get_paths: Callable which returns a list of directories to look into
-                      when the user enters a relative path.
-    :param file_filter: Callable which takes a filename and returns whether
-                        this file should show up in the completion. ``None``
-                        when no filtering has to be done.
-    :param min_input_len: Don't do autocompletion when the input string is shorter.
-    """
+def __getattr__(name):
+    # H5PathCompleter used to live here
+    if name == "H5PathCompleter":
+        from .completion import H5PathCompleter
 
-    def __init__(
-        self,
-        context,
-        include_groups: bool = True,
-        include_datasets: bool = True,
-    ) -> None:
-        self.context = context
-        self.include_groups = include_groups
-        self.include_datasets = include_datasets
-
-    @property
-    def gpath(self):
-        return self.context.gpath
-
-    @property
-    def group(self):
-        return self.context.group
-
-    def get_completions(self, document, complete_event) -> Iterable[Completion]:
-        text = document.text_before_cursor
-
-        curr_path = H5Path(text)
-        if text.endswith("/"):
-            parent = curr_path
-            prefix = ""
-        else:
-            parent = curr_path.parent
-            prefix = curr_path.name
-
-        try:
-            parent_obj = self.group[str(normalise_path(parent, self.gpath))]
-        except KeyError:
-            return
-
-        for name, obj in parent_obj.items():
-            if not name.startswith(prefix):
-                continue
-
-            if (self.include_groups and is_group(obj)) or (
-                self.include_datasets and is_dataset(obj)
-            ):
-                yield Completion(name[len(prefix) :], 0, display=name)
+        return H5PathCompleter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
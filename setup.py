@@ -6,7 +6,7 @@ here = Path(__file__).resolve().parent
 
 long_description = (here / "README.md").read_text()
 
-install_requires = ["h5py", "prompt-toolkit", "tree-format"]
+install_requires = ["h5py", "prompt-toolkit"]
 
 setup(
     name="hcl",